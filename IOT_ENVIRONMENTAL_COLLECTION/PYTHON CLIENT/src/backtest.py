@@ -0,0 +1,216 @@
+'''
+Rolling-origin backtesting: replays the history one day at a time, forecasting each next entry only from the data before it,
+to measure how well the model selection in predictWeatherParams would have done.
+The rolling features are computed once, the batch models are only refitted every few days with the forecasts between refits
+made in one predict call, and online models learn each day with a constant time update.
+'''
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import train_test_split
+from weatherschema import FEATURES, dayToDate
+from rollingfeatures import RollingFeatureEngine
+from modelselection import evaluateCandidate
+from sharedframes import SharedFrames, attachFrames
+
+
+def evaluateOnBlock(model, handle, numOfThreads):
+    '''
+    This function is responsible for fitting and scoring a candidate inside a worker process and forecasting a block of days with it.
+    Only the forecasts are sent back, trained models can be far larger than the data.
+    params:
+        model: untrained candidate model
+        handle: description of the shared X_train, y_train, X_test, y_test and X_block frames, X_block being the model inputs
+                of the days forecast before the next refit
+        numOfThreads: number of cores the candidate may use on its own
+    returns:
+        mse: mean squared error on the testing set
+        forecasts: two-dimensional array with one row per day of the block
+    '''
+
+    frames = attachFrames(handle)
+    model, mse, fitTime, scoreTime = evaluateCandidate(model, frames["X_train"], frames["y_train"], frames["X_test"], frames["y_test"], numOfThreads)
+
+    return mse, np.asarray(model.predict(frames["X_block"]), dtype=np.float64)
+
+
+class Backtester():
+
+    def __init__(self, days, values, models, windowSize=30, refitEvery=30, trainingDays=None, minTrainingRows=365, onlineModels=None,
+                 coreBudget=None):
+        self.days = np.asarray(days)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.models = models  # Untrained batch candidates, compared the same way predictWeatherParams does
+        self.windowSize = windowSize
+        self.refitEvery = refitEvery  # Number of days the selected model is used before the candidates are refitted
+        self.trainingDays = trainingDays  # Length of the sliding training window in days, the window expands from the start when None
+        self.minTrainingRows = minTrainingRows  # Number of rolling average rows needed before the first forecast
+        self.onlineModels = onlineModels or {}  # Dictionary of name to model with partial_fit, updated every day
+        self.coreBudget = coreBudget or os.cpu_count()
+
+        # Rolling averages of the whole history, computed once and shared by every step of the replay
+        engine = RollingFeatureEngine((windowSize,))
+        engine.build(self.days, self.values)
+        self.features = engine.features[:engine.size]
+
+    def getOrigins(self, startDay=None, endDay=None):
+        '''
+        This method is responsible for finding the rows forecasts are made from, each forecasting the entry after it.
+        params:
+            startDay: first forecast day to replay, the first day with enough training rows when None
+            endDay: last forecast day to replay (inclusive), the last entry when None
+        returns:
+            origins: array of row positions
+        '''
+
+        origins = np.arange(self.windowSize - 1 + self.minTrainingRows, len(self.days) - 1)
+
+        if startDay is not None:
+            origins = origins[self.days[origins + 1] >= startDay]
+        if endDay is not None:
+            origins = origins[self.days[origins + 1] <= endDay]
+
+        return origins
+
+    def getTrainingRows(self, origin):
+        '''
+        This method is responsible for selecting the rolling average rows the candidates are trained on at a refit.
+        params:
+            origin: row position of the refit
+        returns:
+            rows: array of row positions, all at or before the origin
+        '''
+
+        first = self.windowSize - 1
+
+        if self.trainingDays is not None:
+            first = max(first, int(np.searchsorted(self.days, self.days[origin] - self.trainingDays, side="right")))
+
+        return np.arange(first, origin + 1)
+
+    def run(self, startDay=None, endDay=None):
+        '''
+        This method is responsible for replaying the history and collecting every forecast with the actual values.
+        params:
+            startDay: first forecast day to replay
+            endDay: last forecast day to replay (inclusive)
+        returns:
+            table: data frame with one row per forecast day, the selected model and its forecast and actual value of each feature
+            metrics: data frame of the mean absolute error of each feature and the overall MAE and RMSE, one row per model
+        '''
+
+        origins = self.getOrigins(startDay, endDay)
+
+        names = [type(model).__name__ for model in self.models]
+        forecasts = {name: np.full((len(origins), len(FEATURES)), np.nan) for name in names + ["Selected"] + list(self.onlineModels)}
+        selectedNames = np.empty(len(origins), dtype=object)
+
+        numOfWorkers = max(min(len(self.models), self.coreBudget), 1)
+        numOfThreads = max(self.coreBudget // numOfWorkers, 1)
+
+        with ProcessPoolExecutor(max_workers=numOfWorkers) as executor:
+
+            blockStart = 0
+
+            while blockStart < len(origins):
+
+                # Every day until refitEvery days after the refit is forecast by the models trained at the refit
+                refitOrigin = origins[blockStart]
+                blockEnd = int(np.searchsorted(self.days[origins + 1], self.days[refitOrigin + 1] + self.refitEvery, side="left"))
+                blockEnd = max(blockEnd, blockStart + 1)
+
+                trainingRows = self.getTrainingRows(refitOrigin)
+                X = pd.DataFrame(self.features[trainingRows], columns=FEATURES)
+                X_block = pd.DataFrame(self.features[origins[blockStart:blockEnd]], columns=FEATURES)
+
+                # Same split and comparison as predictWeatherParams
+                X_train, X_test, y_train, y_test = train_test_split(X, X, test_size=0.2, random_state=42)
+
+                with SharedFrames({"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test, "X_block": X_block}) as shared:
+                    futures = [executor.submit(evaluateOnBlock, model, shared.getHandle(), numOfThreads) for model in self.models]
+                    results = [future.result() for future in futures]
+
+                for name, (mse, blockForecasts) in zip(names, results):
+                    forecasts[name][blockStart:blockEnd] = blockForecasts
+
+                best = int(np.argmin([mse for mse, blockForecasts in results]))
+                forecasts["Selected"][blockStart:blockEnd] = results[best][1]
+                selectedNames[blockStart:blockEnd] = names[best]
+
+                print("%s: %s selected for %d days" % (dayToDate(int(self.days[refitOrigin + 1])), names[best], blockEnd - blockStart))
+
+                blockStart = blockEnd
+
+        self.replayOnlineModels(origins, forecasts)
+
+        actuals = self.values[origins + 1]
+
+        table = pd.DataFrame({"Date": [dayToDate(int(day)) for day in self.days[origins + 1]], "Model": selectedNames})
+        for index, feature in enumerate(FEATURES):
+            table[feature + "Forecast"] = forecasts["Selected"][:, index]
+            table[feature + "Actual"] = actuals[:, index]
+
+        return table, self.getMetrics(forecasts, actuals)
+
+    def replayOnlineModels(self, origins, forecasts):
+        '''
+        This method is responsible for replaying the online models, each learning every rolling average row once and forecasting before it learns the next.
+        params:
+            origins: array of row positions forecasts are made from
+            forecasts: dictionary of model name to forecast array, filled in place
+        '''
+
+        for name, model in self.onlineModels.items():
+
+            # Rows known before the first forecast are learnt in one block
+            firstRows = self.features[self.windowSize - 1:origins[0] + 1] if len(origins) else self.features[:0]
+            if len(firstRows):
+                model.partial_fit_batch(firstRows, firstRows)
+
+            for position, origin in enumerate(origins):
+
+                if position > 0:
+                    newRows = self.features[origins[position - 1] + 1:origin + 1]
+                    for row in newRows:
+                        model.partial_fit(row, row)
+
+                forecasts[name][position] = model.predict(self.features[origin].reshape(1, -1))[0]
+
+    def getMetrics(self, forecasts, actuals):
+        '''
+        This method is responsible for summarising the forecast errors of every model.
+        params:
+            forecasts: dictionary of model name to forecast array
+            actuals: two-dimensional array of the actual values
+        returns:
+            metrics: data frame with one row per model
+        '''
+
+        rows = {}
+
+        for name, modelForecasts in forecasts.items():
+            errors = modelForecasts - actuals
+
+            row = dict(zip([feature + "MAE" for feature in FEATURES], np.abs(errors).mean(axis=0)))
+            row["MAE"] = np.abs(errors).mean()
+            row["RMSE"] = np.sqrt(np.square(errors).mean())
+            rows[name] = row
+
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+if __name__ == '__main__':
+
+    # Usage: python backtest.py [refitEvery] [trainingYears], run from the directory holding the weather data
+    from main import MachineLearning
+
+    refitEvery = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    trainingYears = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    table, metrics = MachineLearning().runBacktest(refitEvery, trainingYears)
+
+    table.to_csv("backtest.csv", index=False)
+    print(metrics[["MAE", "RMSE"]].sort_values("MAE").to_string())
@@ -0,0 +1,249 @@
+'''
+Bulk import of historical exports (ThingSpeak feeds or third-party daily CSV files) into a dataset store.
+Large files are streamed in blocks of lines which are parsed in parallel across a process pool.
+'''
+
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from weatherschema import FEATURES, DATE_FORMAT, MISSING_DAY
+from typedloader import parseDays
+from segmentstore import SegmentedStore, formatLines
+
+# ThingSpeak channel fields published by the sensor station (see updateThingspeaks)
+THINGSPEAK_FIELDS = {"field1": "Temp", "field2": "Pressure", "field3": "Humidity", "field4": "WindSpeed"}
+
+# Hours of the readings used for the 9am and 3pm columns
+MORNING_HOUR = 9
+AFTERNOON_HOUR = 15
+
+
+def parseDailyBlock(block, header, columnMap, dateFormat):
+    '''
+    This function is responsible for parsing a block of lines from a daily CSV export into day numbers and feature values,
+    and formatting them as weatherData.csv lines, so the importing process only has to write them.
+    params:
+        block: bytes holding whole lines of the file
+        header: list of column names of the file
+        columnMap: dictionary of file column name to weather data column name
+        dateFormat: strptime format of the file's date column
+    returns:
+        days: int32 array of day numbers
+        values: float32 array with one column per feature, NaN for missing values
+        lines: list of the rows formatted by formatLines
+    '''
+
+    data = pd.read_csv(io.BytesIO(block), header=None, names=header, usecols=list(columnMap), dtype=str)
+    data = data.rename(columns=columnMap)
+
+    days = parseDays(data["Date"], dateFormat)
+
+    # Features missing from the export are stored as missing values
+    values = np.full((len(data), len(FEATURES)), np.nan, dtype=np.float32)
+    for index, feature in enumerate(FEATURES):
+        if feature in data:
+            values[:, index] = pd.to_numeric(data[feature], errors="coerce")
+
+    valid = days != MISSING_DAY
+    days, values = days[valid], values[valid]
+
+    return days, values, formatLines(days, values)
+
+
+def parseThingSpeakBlock(block, header, fieldMap):
+    '''
+    This function is responsible for summarising a block of ThingSpeak feed entries into partial daily rows.
+    params:
+        block: bytes holding whole lines of the feed export
+        header: list of column names of the export
+        fieldMap: dictionary of ThingSpeak field to reading name (Temp, Pressure, Humidity or WindSpeed)
+    returns:
+        days: sorted int32 array of day numbers
+        values: float32 array with one column per feature, NaN where the block had no reading
+    '''
+
+    data = pd.read_csv(io.BytesIO(block), header=None, names=header, usecols=["created_at"] + list(fieldMap), dtype=str)
+
+    times = pd.to_datetime(data["created_at"], utc=True, errors="coerce")
+    readings = pd.DataFrame({reading: pd.to_numeric(data[field], errors="coerce") for field, reading in fieldMap.items()})
+
+    readings["Day"] = (times.dt.floor("D") - pd.Timestamp(1970, 1, 1, tz="UTC")).dt.days
+    readings["Hour"] = times.dt.hour
+    readings = readings.dropna(subset=["Day"])
+
+    daily = pd.DataFrame(index=pd.Index(np.unique(readings["Day"]), name="Day"))
+    daily["MinTemp"] = readings.groupby("Day")["Temp"].min()
+    daily["MaxTemp"] = readings.groupby("Day")["Temp"].max()
+
+    # The first reading of the 9am and 3pm hours fills the timestamped columns
+    for hour, suffix in [(MORNING_HOUR, "9am"), (AFTERNOON_HOUR, "3pm")]:
+        first = readings[readings["Hour"] == hour].groupby("Day").first()
+        for reading in ["WindSpeed", "Humidity", "Pressure", "Temp"]:
+            daily[reading + suffix] = first[reading] if reading in first else np.nan
+
+    return daily.index.to_numpy(dtype=np.int32), daily[FEATURES].to_numpy(dtype=np.float32)
+
+
+def mergeDailyPartials(current, new):
+    '''
+    This function is responsible for combining two partial summaries of the same day taken from different blocks.
+    params:
+        current: float32 array of feature values summarised so far
+        new: float32 array of feature values from the next block
+    returns:
+        merged: float32 array of feature values
+    '''
+
+    merged = np.where(np.isnan(current), new, current)
+
+    # Temperature extremes are combined across blocks, timestamped readings keep the earliest one found
+    merged[0] = np.fmin(current[0], new[0])
+    merged[1] = np.fmax(current[1], new[1])
+
+    return merged
+
+
+class BulkImporter():
+
+    def __init__(self, store, workers=None, blockSize=16 * 1024 * 1024):
+        self.store = store
+        self.workers = workers or os.cpu_count()
+        self.blockSize = blockSize  # Number of bytes of the file parsed by each task
+
+    def readBlocks(self, path):
+        '''
+        This method is responsible for streaming a CSV file as blocks of whole lines without parsing them.
+        params:
+            path: path of the CSV file
+        returns:
+            header: list of column names
+            blocks: generator of bytes, each ending on a line boundary
+        '''
+
+        file = open(path, mode="rb")
+        header = file.readline().decode().strip().split(",")
+
+        def blocks():
+            with file:
+                while True:
+                    block = file.read(self.blockSize)
+                    if not block:
+                        break
+
+                    # Extend the block to the end of its last line
+                    block += file.readline()
+
+                    if block.strip():
+                        yield block
+
+        return header, blocks()
+
+    def parseInParallel(self, path, parser, *args):
+        '''
+        This method is responsible for parsing the blocks of a file across the process pool, yielding the results in file order.
+        Only a few blocks per worker are in flight at a time, so memory use doesn't depend on the file size.
+        params:
+            path: path of the CSV file
+            parser: top-level function taking a block, the header and args
+            args: extra arguments passed to the parser
+        returns:
+            results: generator of the parser results
+        '''
+
+        header, blocks = self.readBlocks(path)
+        pending = []
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+
+            for block in blocks:
+
+                pending.append(executor.submit(parser, block, header, *args))
+
+                if len(pending) >= 2 * self.workers:
+                    yield pending.pop(0).result()
+
+            for future in pending:
+                yield future.result()
+
+    def importDaily(self, path, columnMap, dateFormat=DATE_FORMAT):
+        '''
+        This method is responsible for importing a CSV export that already holds one row per day.
+        params:
+            path: path of the CSV file
+            columnMap: dictionary of file column name to weather data column name, one of them must map to "Date"
+            dateFormat: strptime format of the file's date column
+        returns:
+            numOfRows: number of rows written to the store
+        '''
+
+        numOfRows = 0
+
+        for days, values, lines in self.parseInParallel(path, parseDailyBlock, columnMap, dateFormat):
+            self.store.appendArrays(days, values, lines)
+            numOfRows += len(days)
+
+        return numOfRows
+
+    def importThingSpeak(self, path, fieldMap=THINGSPEAK_FIELDS):
+        '''
+        This method is responsible for importing a ThingSpeak feed export, summarising the readings into one row per day.
+        The feed is expected in time order, so a day is written as soon as a later block starts after it.
+        params:
+            path: path of the feed CSV export
+            fieldMap: dictionary of ThingSpeak field to reading name
+        returns:
+            numOfRows: number of rows written to the store
+        '''
+
+        numOfRows = 0
+        pendingDays = {}
+
+        for days, values in self.parseInParallel(path, parseThingSpeakBlock, fieldMap):
+
+            for day, rowValues in zip(days, values):
+                pendingDays[day] = mergeDailyPartials(pendingDays[day], rowValues) if day in pendingDays else rowValues
+
+            # Days before the start of this block can't receive any more readings
+            if len(days) > 0:
+                numOfRows += self.flushDays(pendingDays, days[0])
+
+        numOfRows += self.flushDays(pendingDays, None)
+
+        return numOfRows
+
+    def flushDays(self, pendingDays, beforeDay):
+        '''
+        This method is responsible for writing the completed daily rows to the store.
+        params:
+            pendingDays: dictionary of day number to feature values, written days are removed from it
+            beforeDay: only days earlier than this are written, every day when None
+        returns:
+            numOfRows: number of rows written
+        '''
+
+        completeDays = sorted(day for day in pendingDays if beforeDay is None or day < beforeDay)
+
+        if completeDays:
+            self.store.appendArrays(np.array(completeDays, dtype=np.int32), np.array([pendingDays.pop(day) for day in completeDays]))
+
+        return len(completeDays)
+
+
+if __name__ == '__main__':
+
+    # Usage: python bulkimport.py thingspeak feeds.csv weatherData
+    #        python bulkimport.py daily history.csv weatherData date:Date,tmin:MinTemp,tmax:MaxTemp [dateFormat]
+    command, source, destination = sys.argv[1:4]
+    importer = BulkImporter(SegmentedStore(destination))
+
+    if command == "thingspeak":
+        print("Imported", importer.importThingSpeak(source), "days")
+    elif command == "daily":
+        columnMap = dict(pair.split(":") for pair in sys.argv[4].split(","))
+        dateFormat = sys.argv[5] if len(sys.argv) > 5 else DATE_FORMAT
+        print("Imported", importer.importDaily(source, columnMap, dateFormat), "days")
+    else:
+        print("Unknown command:", command)
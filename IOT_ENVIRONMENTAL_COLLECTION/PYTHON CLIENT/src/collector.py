@@ -0,0 +1,234 @@
+'''
+Collector daemon polling many weather stations concurrently with asyncio. Every station gets its own connection timeouts and retries,
+and the storage and forecasting of the received records run on a thread pool, so a slow or unreachable station never holds up the others.
+'''
+
+import os
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+from main import MachineLearning
+import recordprotocol
+
+
+def loadStations(path):
+    '''
+    This function is responsible for reading the list of weather stations to poll.
+    params:
+        path: JSON file holding a list of {"stationId", "host", "port", "altitude", "directory"} objects, only stationId and host are required
+    returns:
+        stations: list of station dictionaries with the defaults filled in
+    '''
+
+    with open(path, mode="r") as file:
+        stations = json.load(file)
+
+    for station in stations:
+        station.setdefault("port", 6000)
+        station.setdefault("altitude", 590)
+        station.setdefault("directory", "station%s" % station["stationId"])
+
+    return stations
+
+
+class Collector():
+
+    def __init__(self, stations, connectTimeout=5, readTimeout=30, retries=3, retryDelay=1, maxConnections=200, numOfThreads=4, coreBudget=None):
+        self.stations = stations
+        self.connectTimeout = connectTimeout  # Seconds allowed to connect to a weather station
+        self.readTimeout = readTimeout  # Seconds allowed for the weather station to send its record, and to take the reply
+        self.retries = retries  # Number of further attempts after a failed connection, each waiting twice as long as the previous one
+        self.retryDelay = retryDelay  # Seconds waited before the first retry
+        self.maxConnections = maxConnections  # Number of weather stations connected to at the same time
+        self.coreBudget = coreBudget  # Cores each retraining may use, all cores when None (see supervisor.py for several collectors)
+
+        # Storage and forecasting of the received records, kept off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=numOfThreads)
+
+        # Retraining runs after the replies, one at a time for all the weather stations so they don't compete for the cores
+        self.trainingExecutor = ThreadPoolExecutor(max_workers=1)
+
+        # Data and models of each weather station by ID, loaded when its first record arrives
+        self.machines = {}
+
+        self.connections = None
+
+    def getMachine(self, station):
+        '''
+        This method is responsible for returning the MachineLearning of a weather station, creating it the first time.
+        params:
+            station: station dictionary
+        returns:
+            machine: MachineLearning of the weather station
+        '''
+
+        stationId = station["stationId"]
+
+        if stationId not in self.machines:
+            self.machines[stationId] = MachineLearning(stationId, station["host"], station["port"], station["altitude"], station["directory"],
+                                                       trainingExecutor=self.trainingExecutor)
+
+            self.machines[stationId].coreBudget = self.coreBudget or os.cpu_count()
+
+        return self.machines[stationId]
+
+    def setCoreBudget(self, coreBudget):
+        '''
+        This method is responsible for changing the cores each retraining may use, for the weather stations already loaded too.
+        A retraining already running keeps the budget it started with.
+        params:
+            coreBudget: number of cores, all cores when None
+        '''
+
+        self.coreBudget = coreBudget
+
+        for machine in self.machines.values():
+            machine.coreBudget = coreBudget or os.cpu_count()
+
+    def setStations(self, stations):
+        '''
+        This method is responsible for changing the weather stations polled, releasing the ones no longer polled.
+        A released station's retraining is waited for, so another collector can safely take over its data and models.
+        params:
+            stations: list of station dictionaries
+        '''
+
+        stationIds = set(station["stationId"] for station in stations)
+
+        for stationId in [stationId for stationId in self.machines if stationId not in stationIds]:
+            machine = self.machines.pop(stationId)
+
+            if machine.retraining is not None:
+                wait([machine.retraining])
+
+        self.stations = stations
+
+    async def exchange(self, station):
+        '''
+        This method is responsible for a single exchange with a weather station: receiving its record, storing it and replying with the forecast.
+        params:
+            station: station dictionary
+        returns:
+            machine: MachineLearning of the weather station
+        '''
+
+        loop = asyncio.get_running_loop()
+
+        async with self.connections:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(station["host"], station["port"]), self.connectTimeout)
+
+            try:
+                message = await asyncio.wait_for(self.readMessage(reader), self.readTimeout)
+
+                machine = await loop.run_in_executor(self.executor, self.getMachine, station)
+                reply = await loop.run_in_executor(self.executor, machine.handleMessage, message)
+
+                writer.write(reply)
+                await asyncio.wait_for(writer.drain(), self.readTimeout)
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+        return machine
+
+    async def readMessage(self, reader):
+        '''
+        This method is responsible for receiving a complete message from a weather station.
+        returns:
+            message: framed record, or the text record of older firmware
+        '''
+
+        header = await reader.readexactly(recordprotocol.HEADER_SIZE)
+
+        if not header.startswith(recordprotocol.MAGIC):
+            return header + await reader.read(1024)
+
+        return header + await reader.readexactly(recordprotocol.parseHeader(header)[1])
+
+    async def pollStation(self, station):
+        '''
+        This method is responsible for collecting a weather station's record, retrying failed connections with a growing delay.
+        params:
+            station: station dictionary
+        returns:
+            collected: True if the record was stored and the forecast sent back
+        '''
+
+        for attempt in range(self.retries + 1):
+
+            try:
+                machine = await self.exchange(station)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+                print("Station %s: attempt %d failed (%s)" % (station["stationId"], attempt + 1, type(error).__name__))
+
+                if attempt < self.retries:
+                    await asyncio.sleep(self.retryDelay * 2 ** attempt)
+                continue
+            except Exception as error:
+                # A record that can't be stored would fail again, so it isn't retried
+                print("Station %s: %s" % (station["stationId"], error))
+                return False
+
+            # Retrain on the new data after replying, the new model is used from the next record onwards
+            machine.retrainInBackground()
+
+            return True
+
+        return False
+
+    async def pollAll(self):
+        '''
+        This method is responsible for collecting the records of every weather station in one ingestion window.
+        returns:
+            results: dictionary of station ID to True if its record was collected
+        '''
+
+        if self.connections is None:
+            self.connections = asyncio.Semaphore(self.maxConnections)
+
+        start = time.perf_counter()
+
+        collected = await asyncio.gather(*(self.pollStation(station) for station in self.stations))
+
+        print("Collected %d of %d stations in %.2fs" % (sum(collected), len(self.stations), time.perf_counter() - start))
+
+        return {station["stationId"]: result for station, result in zip(self.stations, collected)}
+
+    async def run(self, interval=None):
+        '''
+        This method is responsible for polling every weather station once per interval.
+        params:
+            interval: seconds between the starts of the ingestion windows, a single window is collected when None
+        '''
+
+        while True:
+            start = time.perf_counter()
+
+            await self.pollAll()
+
+            if interval is None:
+                return
+
+            await asyncio.sleep(max(interval - (time.perf_counter() - start), 0))
+
+    def close(self):
+        '''This method is responsible for waiting for the running forecasts and retrainings to finish'''
+
+        self.executor.shutdown()
+        self.trainingExecutor.shutdown()
+
+
+if __name__ == '__main__':
+
+    # Usage: python collector.py stations.json [interval in seconds]
+    collector = Collector(loadStations(sys.argv[1]))
+
+    try:
+        asyncio.run(collector.run(float(sys.argv[2]) if len(sys.argv) > 2 else None))
+    finally:
+        collector.close()
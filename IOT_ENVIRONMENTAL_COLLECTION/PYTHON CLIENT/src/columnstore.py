@@ -0,0 +1,257 @@
+'''
+Columnar binary storage for the weather dataset. Each field is kept in its own fixed-width file which is opened with memory mapping.
+A column store directory can be given to loadTypedHistory (and MachineLearning) as the training source instead of the CSV segments.
+'''
+
+import os
+import sys
+import csv
+import numpy as np
+import pandas as pd
+from weatherschema import COLUMNS, FEATURES, MISSING_DAY, dateToDay, dayToDate, toFloat
+
+# Storage type of each column file
+COLUMN_DTYPES = dict({"Day": np.int32}, **{feature: np.float32 for feature in FEATURES})
+
+
+class ColumnStore():
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.maps = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def getColumnPath(self, column):
+        return os.path.join(self.directory, column + ".bin")
+
+    def getNumOfEntries(self):
+        '''
+        This method is responsible for returning the number of complete rows in the store.
+        The shortest column wins, so a row that was only partially appended is ignored.
+        returns:
+            numOfEntries: number of rows present in every column file
+        '''
+
+        counts = []
+        for column, dtype in COLUMN_DTYPES.items():
+            path = self.getColumnPath(column)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // np.dtype(dtype).itemsize)
+
+        return min(counts)
+
+    def open(self):
+        '''
+        This method is responsible for memory mapping every column file without copying it into memory.
+        returns:
+            maps: dictionary of column name to read-only array
+        '''
+
+        if self.maps is not None:
+            return self.maps
+
+        numOfEntries = self.getNumOfEntries()
+        maps = {}
+
+        for column, dtype in COLUMN_DTYPES.items():
+
+            # Empty files can't be memory mapped
+            if numOfEntries == 0:
+                maps[column] = np.empty(0, dtype=dtype)
+            else:
+                maps[column] = np.memmap(self.getColumnPath(column), dtype=dtype, mode="r", shape=(numOfEntries,))
+
+        self.maps = maps
+
+        return maps
+
+    def close(self):
+        '''This method is responsible for releasing the memory maps so the column files can grow'''
+        self.maps = None
+
+    def append(self, newData):
+        '''
+        This method is responsible for appending a single row in the COLUMNS layout to the end of every column file.
+        params:
+            newData: list of values in the COLUMNS order
+        '''
+        self.appendRows([newData])
+
+    def appendRows(self, rows):
+        '''
+        This method is responsible for appending rows in the COLUMNS layout to the end of every column file.
+        params:
+            rows: iterable of row lists in the COLUMNS order
+        '''
+
+        days = []
+        values = []
+
+        for row in rows:
+            day = dateToDay(row[0])
+            days.append(MISSING_DAY if day is None else day)
+            values.append([toFloat(value) for value in row[1:]])
+
+        if not days:
+            return
+
+        self.appendArrays(np.asarray(days, dtype=np.int32), np.asarray(values, dtype=np.float32))
+
+    def appendArrays(self, days, values):
+        '''
+        This method is responsible for appending a block of rows to the end of every column file, nothing else in the files is touched.
+        params:
+            days: array of day keys
+            values: two-dimensional array with one column per feature
+        '''
+
+        # Memory maps have a fixed length, they are reopened on the next load
+        self.close()
+
+        # Trim any partially appended row so that every column stays aligned
+        numOfEntries = self.getNumOfEntries()
+
+        for index, column in enumerate(["Day"] + FEATURES):
+
+            dtype = COLUMN_DTYPES[column]
+            path = self.getColumnPath(column)
+
+            if os.path.exists(path) and os.path.getsize(path) != numOfEntries * np.dtype(dtype).itemsize:
+                os.truncate(path, numOfEntries * np.dtype(dtype).itemsize)
+
+            columnValues = days if column == "Day" else values[:, index - 1]
+
+            with open(path, mode="ab") as file:
+                file.write(np.ascontiguousarray(columnValues, dtype=dtype).tobytes())
+
+    def readArrays(self):
+        '''
+        This method is responsible for returning the stored rows as arrays sorted by day.
+        A day appended more than once (resent by the weather station) keeps only its last appended row.
+        returns:
+            days: sorted int32 array of day numbers, MISSING_DAY rows first
+            values: float32 array with one column per feature, in the same order as days
+        '''
+
+        maps = self.open()
+        days = np.asarray(maps["Day"])
+
+        # Stable sort, so the last row of each day is the one appended last
+        order = np.argsort(days, kind="stable")
+        sortedDays = days[order]
+        rows = order[np.append(sortedDays[1:] != sortedDays[:-1], True)] if len(days) else order
+
+        values = np.empty((len(rows), len(FEATURES)), dtype=np.float32)
+        for index, feature in enumerate(FEATURES):
+            values[:, index] = maps[feature][rows]
+
+        return days[rows], values
+
+    def readFrame(self):
+        '''
+        This method is responsible for returning the memory mapped columns as a data frame with the COLUMNS layout.
+        returns:
+            data: data frame of the stored rows
+        '''
+
+        maps = self.open()
+
+        data = pd.DataFrame({feature: maps[feature] for feature in FEATURES}, copy=False)
+        data.insert(0, "Date", [dayToDate(day) if day != MISSING_DAY else "N/A" for day in maps["Day"]])
+
+        return data
+
+    def readTail(self, numOfRows, blockSize=1024):
+        '''
+        This method is responsible for returning the last valid rows of the store, scanning the memory maps backwards in blocks.
+        params:
+            numOfRows: number of valid rows to return
+            blockSize: number of rows checked per step
+        returns:
+            data: data frame with the COLUMNS layout holding at most numOfRows rows, oldest first
+        '''
+
+        maps = self.open()
+        end = len(maps["Day"])
+        positions = []
+
+        while end > 0 and len(positions) < numOfRows:
+
+            start = max(end - blockSize, 0)
+
+            # Rows are valid when they have a date and no missing measurement
+            valid = maps["Day"][start:end] != MISSING_DAY
+            for feature in FEATURES:
+                valid &= ~np.isnan(maps[feature][start:end])
+
+            positions = list(np.flatnonzero(valid) + start) + positions
+            end = start
+
+        positions = np.asarray(positions[-numOfRows:], dtype=np.int64)
+
+        data = pd.DataFrame({feature: maps[feature][positions] for feature in FEATURES})
+        data.insert(0, "Date", [dayToDate(day) for day in maps["Day"][positions]])
+
+        return data
+
+
+def csvToColumnStore(csvFile, directory, chunkSize=100000):
+    '''
+    This function is responsible for converting an existing weatherData.csv file into a column store.
+    params:
+        csvFile: path of the CSV file to convert
+        directory: directory of the column store to append to
+        chunkSize: number of rows converted at a time
+    returns:
+        store: the column store holding the converted rows
+    '''
+
+    store = ColumnStore(directory)
+
+    with open(csvFile, mode="r") as file:
+
+        reader = csv.reader(file)
+
+        # Skip the header row
+        next(reader, None)
+
+        chunk = []
+        for row in reader:
+            if row:
+                chunk.append(row)
+
+            if len(chunk) >= chunkSize:
+                store.appendRows(chunk)
+                chunk = []
+
+        store.appendRows(chunk)
+
+    return store
+
+
+def columnStoreToCSV(directory, csvFile):
+    '''
+    This function is responsible for converting a column store back into the weatherData.csv layout.
+    params:
+        directory: directory of the column store to convert
+        csvFile: path of the CSV file to write
+    '''
+
+    data = ColumnStore(directory).readFrame()
+
+    data.to_csv(csvFile, index=False, columns=COLUMNS, na_rep="N/A")
+
+
+if __name__ == '__main__':
+
+    # Usage: python columnstore.py import weatherData.csv weatherColumns
+    #        python columnstore.py export weatherColumns weatherData.csv
+    command, source, destination = sys.argv[1:4]
+
+    if command == "import":
+        csvToColumnStore(source, destination)
+    elif command == "export":
+        columnStoreToCSV(source, destination)
+    else:
+        print("Unknown command:", command)
@@ -0,0 +1,280 @@
+'''
+In-process manager holding the weather history in a NumPy ring buffer sorted by day, so the dataset is only read from disk once per process.
+'''
+
+import numpy as np
+import pandas as pd
+from weatherschema import FEATURES, MAX_ENTRIES, dateToDay, toFloat
+from typedloader import loadTypedHistory, findDayRange
+from rangeindex import RangeAggregateIndex
+from rollingfeatures import RollingFeatureEngine
+
+
+class DatasetManager():
+
+    def __init__(self, store, capacity=MAX_ENTRIES, source=None, windowSizes=(30,), lags=()):
+        self.store = store
+        self.capacity = capacity
+        self.loaded = False
+
+        # Optional function returning sorted (days, values) arrays to load the history from instead of the store's CSV segments
+        self.source = source
+
+        # Every row is written twice, capacity rows apart, so the retained rows are always one contiguous slice of the buffer
+        self.days = np.zeros(2 * capacity, dtype=np.int32)
+        self.values = np.zeros((2 * capacity, len(FEATURES)), dtype=np.float32)
+
+        # Position of the oldest row and number of rows held in memory
+        self.head = 0
+        self.numOfEntries = 0
+
+        # Date-range min/max/mean index kept in step with the ring buffer
+        self.aggregates = RangeAggregateIndex()
+
+        # Rolling means (and lags) of the rows used as the model inputs, also kept in step with the ring buffer
+        self.features = RollingFeatureEngine(windowSizes, lags)
+
+    def load(self):
+        '''This method is responsible for reading the stored history into the ring buffer, it only runs the first time the data is needed'''
+
+        if self.loaded:
+            return
+
+        # Typed load sorted by day, rows with a missing value are kept on disk but never used for training, so they aren't held in memory
+        if self.source is not None:
+            days, values = self.source()
+        else:
+            days, values = loadTypedHistory(self.store.getSegmentPaths())
+
+        self.rebuild(days, values)
+        self.loaded = True
+
+    def rebuild(self, days, values):
+        '''
+        This method is responsible for replacing the contents of the ring buffer and rebuilding the aggregation index from them.
+        params:
+            days: sorted array of day numbers
+            values: two-dimensional array with one column per feature
+        '''
+
+        self.head = 0
+        self.numOfEntries = 0
+        self.insertArrays(days, values)
+
+        self.aggregates.build(self.days[self.head:self.head + self.numOfEntries], self.values[self.head:self.head + self.numOfEntries])
+        self.features.build(self.days[self.head:self.head + self.numOfEntries], self.values[self.head:self.head + self.numOfEntries])
+
+    def insertArrays(self, days, values):
+        '''
+        This method is responsible for writing rows into the ring buffer, overwriting the oldest rows once it is full.
+        params:
+            days: array of day numbers
+            values: two-dimensional array with one column per feature
+        '''
+
+        # Only the newest rows can survive when more rows than the capacity are inserted
+        days = days[-self.capacity:]
+        values = values[-self.capacity:]
+
+        # Positions following the newest row, wrapping around the buffer
+        positions = (self.head + self.numOfEntries + np.arange(len(days))) % self.capacity
+
+        total = self.numOfEntries + len(days)
+
+        # Once the buffer is full the oldest rows have been overwritten
+        if total > self.capacity:
+            self.head = (self.head + total - self.capacity) % self.capacity
+
+        self.numOfEntries = min(total, self.capacity)
+
+        self.days[positions] = days
+        self.days[positions + self.capacity] = days
+        self.values[positions] = values
+        self.values[positions + self.capacity] = values
+
+    def append(self, newData):
+        '''
+        This method is responsible for appending a new daily record to the stored dataset and, when loaded, to the ring buffer in place.
+        params:
+            newData: list of values in the COLUMNS order
+        '''
+
+        # Write through to disk first so the record is never only held in memory
+        self.store.append(newData)
+
+        # Rows appended before the first load will be read with the rest of the history
+        if self.loaded:
+            self.insertRecord(newData)
+
+    def upsert(self, newData):
+        '''
+        This method is responsible for storing a daily record, replacing the existing row of the same date instead of appending a duplicate.
+        params:
+            newData: list of values in the COLUMNS order
+        '''
+
+        replaced = self.store.upsert(newData)
+
+        if not self.loaded:
+            return
+
+        if not replaced:
+            self.insertRecord(newData)
+            return
+
+        day = dateToDay(newData[0])
+        rowValues = np.array([toFloat(value) for value in newData[1:]], dtype=np.float32)
+
+        # The day index is sorted, so the existing row is found by binary search
+        start, end = findDayRange(self.getDays(), day, day)
+
+        if start == end:
+            self.insertRecord(newData)
+        elif np.isnan(rowValues).any():
+            # The resent record is incomplete, so the row is no longer used for training
+            self.removeRows(start, end)
+        else:
+            position = (self.head + end - 1) % self.capacity
+            oldValues = self.values[position].copy()
+
+            self.values[position] = rowValues
+            self.values[position + self.capacity] = rowValues
+
+            # Only the windows holding the row change, so both indexes are updated in place
+            self.aggregates.replace(end - 1, rowValues)
+            self.features.replace(end - 1, oldValues, rowValues)
+
+    def insertRecord(self, newData):
+        '''
+        This method is responsible for inserting a daily record into the ring buffer, keeping the rows sorted by day.
+        params:
+            newData: list of values in the COLUMNS order
+        '''
+
+        day = dateToDay(newData[0])
+        rowValues = np.array([toFloat(value) for value in newData[1:]], dtype=np.float32)
+
+        if day is None or np.isnan(rowValues).any():
+            return
+
+        days = self.getDays()
+
+        # Records normally arrive in date order and go straight to the end of the buffer
+        if self.numOfEntries == 0 or day >= days[-1]:
+
+            isFull = self.numOfEntries == self.capacity
+            self.insertArrays(np.array([day], dtype=np.int32), rowValues.reshape(1, -1))
+
+            # The oldest row was overwritten, so it also leaves the aggregation index and the rolling features
+            if isFull:
+                self.aggregates.dropOldest(1)
+                self.features.dropOldest(1)
+
+            self.aggregates.append(day, rowValues)
+            self.features.append(day, rowValues)
+        else:
+            self.insertSorted(day, rowValues)
+
+    def insertSorted(self, day, rowValues):
+        '''
+        This method is responsible for inserting a late record at its place in the day order, rebuilding the buffer around it.
+        params:
+            day: day number of the record
+            rowValues: array of feature values
+        '''
+
+        position = np.searchsorted(self.getDays(), day, side="right")
+
+        days = np.insert(self.getDays(), position, day)
+        values = np.insert(self.getValues(), position, rowValues, axis=0)
+
+        self.rebuild(days, values)
+
+    def removeRows(self, start, end):
+        '''
+        This method is responsible for removing a run of rows from the ring buffer, rebuilding the buffer around them.
+        params:
+            start: position of the first row to remove
+            end: position after the last row to remove
+        '''
+
+        days = np.delete(self.getDays(), np.s_[start:end])
+        values = np.delete(self.getValues(), np.s_[start:end], axis=0)
+
+        self.rebuild(days, values)
+
+    def getDays(self):
+        '''
+        This method is responsible for returning the day numbers of the rows held in memory, oldest first.
+        returns:
+            days: view of the ring buffer, no data is copied
+        '''
+        self.load()
+        return self.days[self.head:self.head + self.numOfEntries]
+
+    def getValues(self):
+        '''
+        This method is responsible for returning the feature values of the rows held in memory, oldest first.
+        returns:
+            values: two-dimensional view of the ring buffer, no data is copied
+        '''
+        self.load()
+        return self.values[self.head:self.head + self.numOfEntries]
+
+    def getRange(self, startDay, endDay):
+        '''
+        This method is responsible for returning the rows between two days using binary search over the sorted day index.
+        params:
+            startDay: first day of the range
+            endDay: last day of the range (inclusive)
+        returns:
+            days: view of the day numbers in the range
+            values: view of the feature values in the range
+        '''
+
+        start, end = findDayRange(self.getDays(), startDay, endDay)
+
+        return self.getDays()[start:end], self.getValues()[start:end]
+
+    def aggregate(self, column, startDay, endDay, statistic):
+        '''
+        This method is responsible for answering a date-range query such as the mean Pressure3pm for March without scanning the history.
+        params:
+            column: name of the feature column
+            startDay: first day of the range
+            endDay: last day of the range (inclusive)
+            statistic: "min", "max", "mean", "sum" or "count"
+        returns:
+            result: value of the statistic, NaN when the range holds no rows
+        '''
+
+        self.load()
+
+        return float(self.aggregates.aggregate(startDay, endDay, statistic)[FEATURES.index(column)])
+
+    def getFrame(self):
+        '''
+        This method is responsible for returning the rows held in memory as a data frame of the FEATURES columns.
+        returns:
+            data: data frame backed by the ring buffer
+        '''
+        return pd.DataFrame(self.getValues(), columns=FEATURES, copy=False)
+
+    def getRollingFrame(self):
+        '''
+        This method is responsible for returning the rolling window features of the rows held in memory, one row per complete window.
+        returns:
+            data: data frame of the rolling means (and lags), the first window keeps the FEATURES column names
+        '''
+        self.load()
+        return self.features.getFrame()
+
+    def getTail(self, numOfRows):
+        '''
+        This method is responsible for returning the most recent rows held in memory as a data frame.
+        params:
+            numOfRows: number of rows to return
+        returns:
+            data: data frame backed by the ring buffer
+        '''
+        return pd.DataFrame(self.getValues()[-numOfRows:], columns=FEATURES, copy=False)
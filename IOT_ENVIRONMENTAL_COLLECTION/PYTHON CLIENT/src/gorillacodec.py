@@ -0,0 +1,180 @@
+'''
+Gorilla style compression for archived weather history: delta-of-delta encoding for the day numbers and XOR encoding for the float32 measurements.
+Both transforms are done on whole NumPy arrays, the bytes are then split into planes and deflated, so archives decode straight into NumPy arrays
+without a Python loop over the rows.
+'''
+
+import zlib
+import struct
+import numpy as np
+
+# File signature and version of the archive format
+MAGIC = b"GRLA"
+VERSION = 2
+
+HEADER_FORMAT = "<BIB"
+
+# zlib level of the archives, they are written once and read many times
+COMPRESSION_LEVEL = 9
+
+
+def encodeDays(days):
+    '''
+    This function is responsible for the delta-of-delta transform of the day numbers.
+    Consecutive daily rows have a delta-of-delta of zero, which the compression step reduces to almost nothing.
+    params:
+        days: array of int32 day numbers
+    returns:
+        deltasOfDeltas: int64 array, wide enough for any jump between int32 day numbers
+    '''
+
+    deltas = np.diff(np.asarray(days, dtype=np.int64), prepend=0)
+
+    return np.diff(deltas, prepend=0)
+
+
+def decodeDays(deltasOfDeltas):
+    '''
+    This function is responsible for turning deltas-of-deltas back into day numbers.
+    params:
+        deltasOfDeltas: int64 array from encodeDays
+    returns:
+        days: int32 array of day numbers
+    '''
+    return np.cumsum(np.cumsum(deltasOfDeltas)).astype(np.int32)
+
+
+def encodeFloats(values):
+    '''
+    This function is responsible for XOR-ing the bits of each float32 value with the previous value of its column.
+    A repeated value becomes zero and small changes only keep the low bits that differ.
+    params:
+        values: float32 array with one column per feature
+    returns:
+        xors: uint32 array of the same shape
+    '''
+
+    bits = np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)
+    xors = bits.copy()
+    xors[1:] ^= bits[:-1]
+
+    return xors
+
+
+def decodeFloats(xors):
+    '''
+    This function is responsible for turning XOR-ed bits back into float32 values.
+    params:
+        xors: uint32 array from encodeFloats
+    returns:
+        values: float32 array of the same shape
+    '''
+    return np.bitwise_xor.accumulate(xors, axis=0).view(np.float32)
+
+
+def splitBytes(array):
+    '''
+    This function is responsible for storing each byte position of the values of a column together, the high bytes of a
+    delta-of-delta or XOR are nearly always zero and compress far better once they follow each other.
+    params:
+        array: two-dimensional array of rows by columns
+    returns:
+        data: bytes ordered by column, then byte position, then row
+    '''
+
+    numOfRows, numOfColumns = array.shape
+    planes = np.ascontiguousarray(array).view(np.uint8).reshape(numOfRows, numOfColumns, array.itemsize)
+
+    return planes.transpose(1, 2, 0).tobytes()
+
+
+def joinBytes(data, numOfRows, numOfColumns, dtype):
+    '''
+    This function is responsible for putting the bytes stored by splitBytes back in place.
+    params:
+        data: bytes from splitBytes
+        numOfRows: number of rows of the array
+        numOfColumns: number of columns of the array
+        dtype: type of the values
+    returns:
+        array: two-dimensional array of rows by columns
+    '''
+
+    dtype = np.dtype(dtype)
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(numOfColumns, dtype.itemsize, numOfRows)
+
+    return np.ascontiguousarray(planes.transpose(2, 0, 1)).view(dtype).reshape(numOfRows, numOfColumns)
+
+
+def encodeArchive(days, values):
+    '''
+    This function is responsible for compressing a block of rows into the archive format.
+    params:
+        days: array of int32 day numbers
+        values: float32 array with one column per feature
+    returns:
+        data: archive bytes
+    '''
+
+    values = np.asarray(values, dtype=np.float32)
+
+    payload = splitBytes(encodeDays(days).astype("<i8")[:, None]) + splitBytes(encodeFloats(values).astype("<u4"))
+
+    return MAGIC + struct.pack(HEADER_FORMAT, VERSION, len(days), values.shape[1]) + zlib.compress(payload, COMPRESSION_LEVEL)
+
+
+def decodeArchive(data):
+    '''
+    This function is responsible for decompressing archive bytes directly into NumPy arrays.
+    params:
+        data: archive bytes
+    returns:
+        days: int32 array of day numbers
+        values: float32 array with one column per feature
+    '''
+
+    if data[:4] != MAGIC:
+        raise ValueError("Not a compressed weather archive")
+
+    version, count, numOfColumns = struct.unpack_from(HEADER_FORMAT, data, 4)
+
+    if version != VERSION:
+        raise ValueError("Unsupported archive version: " + str(version))
+
+    payload = zlib.decompress(data[4 + struct.calcsize(HEADER_FORMAT):])
+    daysSize = count * 8
+
+    if len(payload) != daysSize + count * numOfColumns * 4:
+        raise ValueError("Corrupted weather archive")
+
+    days = decodeDays(joinBytes(payload[:daysSize], count, 1, "<i8")[:, 0])
+    values = decodeFloats(joinBytes(payload[daysSize:], count, numOfColumns, "<u4"))
+
+    return days, values
+
+
+def writeArchive(path, days, values):
+    '''
+    This function is responsible for writing a compressed archive file.
+    params:
+        path: path of the archive file
+        days: array of int32 day numbers
+        values: float32 array with one column per feature
+    '''
+
+    with open(path, mode="wb") as file:
+        file.write(encodeArchive(days, values))
+
+
+def readArchive(path):
+    '''
+    This function is responsible for reading a compressed archive file into NumPy arrays.
+    params:
+        path: path of the archive file
+    returns:
+        days: int32 array of day numbers
+        values: float32 array with one column per feature
+    '''
+
+    with open(path, mode="rb") as file:
+        return decodeArchive(file.read())
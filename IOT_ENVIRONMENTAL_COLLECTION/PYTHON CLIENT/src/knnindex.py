@@ -0,0 +1,428 @@
+'''
+K-nearest neighbours regressor backed by a persistent KD-tree index over the weather features.
+New points go into a small buffer which is merged into a set of static KD-trees of doubling sizes (the logarithmic method),
+so inserting a day never rebuilds the whole index. Saved trees, including the nodes of their KD-trees, are plain NumPy files
+that load through memory mapping, so a loaded index is searched without building anything.
+'''
+
+import os
+import json
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.exceptions import NotFittedError
+from sklearn.metrics import DistanceMetric
+from sklearn.neighbors import KDTree
+
+# Arrays making up a static tree, each saved to its own .npy file.
+# order, nodes and bounds are the point order, node ranges and node boxes of the KD-tree searching the points
+TREE_ARRAYS = ["points", "targets", "order", "nodes", "bounds"]
+
+# Number of query points searched together, bounding the memory of the distances to the buffer and of the merged neighbours
+QUERY_CHUNK_SIZE = 512
+
+
+def buildTree(points, targets, leafSize):
+    '''
+    This function is responsible for building the static tree of a level.
+    The arrays of the KD-tree are kept next to the points, so they are saved with them and the KD-tree never has to be built again.
+    params:
+        points: two-dimensional array of feature values
+        targets: two-dimensional array of target values, one row per point
+        leafSize: maximum number of points in a leaf
+    returns:
+        tree: dictionary of the points, the targets and the KD-tree searching the points
+    '''
+
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    search = KDTree(points, leaf_size=leafSize)
+
+    # The state of a KD-tree starts with its points, point order, node ranges and node boxes
+    state = search.__getstate__()
+
+    return {"points": points,
+            "targets": np.ascontiguousarray(targets, dtype=np.float64),
+            "order": state[1],
+            "nodes": state[2],
+            "bounds": state[3],
+            "search": search}
+
+
+def restoreSearch(tree, leafSize):
+    '''
+    This function is responsible for recreating the KD-tree of a loaded level from its saved arrays, without building it again.
+    The arrays may be memory mapped read only, the search never writes to them.
+    params:
+        tree: static tree loaded from the index files
+        leafSize: maximum number of points in a leaf
+    returns:
+        search: KD-tree searching the points of the tree
+    '''
+
+    # Index files written before the KD-tree arrays were saved only hold the points
+    if "nodes" not in tree:
+        return KDTree(tree["points"], leaf_size=leafSize)
+
+    # The tree is complete, so its number of levels follows from its number of nodes
+    numOfNodes = len(tree["nodes"])
+    numOfLevels = int(np.log2(numOfNodes + 1))
+
+    search = KDTree.__new__(KDTree)
+    search.__setstate__((tree["points"], tree["order"], tree["nodes"], tree["bounds"], leafSize, numOfLevels, numOfNodes,
+                         0, 0, 0, 0, DistanceMetric.get_metric("euclidean"), None))
+
+    return search
+
+
+def mergeNearest(bestDistances, bestTargets, distances, targets, numOfNeighbours):
+    '''
+    This function is responsible for keeping, for each query point, the closest points out of its current best ones and a block of candidates.
+    params:
+        bestDistances: squared distances of the current best points, one row per query point
+        bestTargets: targets of the current best points, one block of rows per query point
+        distances: squared distances of the candidates, one row per query point
+        targets: targets of the candidates, one block of rows per query point
+        numOfNeighbours: number of points to keep
+    returns:
+        bestDistances: squared distances of the closest points
+        bestTargets: targets of the closest points
+    '''
+
+    distances = np.concatenate([bestDistances, distances], axis=1)
+    targets = np.concatenate([bestTargets, targets], axis=1)
+
+    nearest = np.argpartition(distances, numOfNeighbours - 1, axis=1)[:, :numOfNeighbours]
+
+    return np.take_along_axis(distances, nearest, axis=1), np.take_along_axis(targets, nearest[:, :, np.newaxis], axis=1)
+
+
+def searchPoints(queries, points, targets, bestDistances, bestTargets, numOfNeighbours):
+    '''
+    This function is responsible for comparing a group of query points against every point of a block.
+    params:
+        queries: two-dimensional array of query points
+        points: two-dimensional array of stored points
+        targets: two-dimensional array of the targets of the stored points
+        bestDistances, bestTargets: best points found so far for the query points
+        numOfNeighbours: number of points to find
+    returns:
+        bestDistances, bestTargets: closest points found for the query points
+    '''
+
+    distances = np.square(queries[:, np.newaxis, :] - points[np.newaxis, :, :]).sum(axis=2)
+    targets = np.broadcast_to(targets, (len(queries),) + targets.shape)
+
+    return mergeNearest(bestDistances, bestTargets, distances, targets, numOfNeighbours)
+
+
+def queryTree(tree, queries, bestDistances, bestTargets, numOfNeighbours, leafSize):
+    '''
+    This function is responsible for searching a static tree for the nearest points to a group of query points.
+    The KD-tree search is exact and runs in compiled code, visiting the nodes nearest to each query first and skipping every node
+    whose box is further away than the query's current furthest neighbour.
+    params:
+        tree: static tree built by buildTree, or loaded from the index files
+        queries: two-dimensional array of query points
+        bestDistances, bestTargets: best points found so far for the query points
+        numOfNeighbours: number of points to find
+        leafSize: maximum number of points in a leaf, used when the KD-tree of a loaded level is recreated
+    returns:
+        bestDistances, bestTargets: closest points found for the query points
+    '''
+
+    if "search" not in tree:
+        tree["search"] = restoreSearch(tree, leafSize)
+
+    distances, indices = tree["search"].query(queries, k=min(numOfNeighbours, len(tree["points"])))
+
+    return mergeNearest(bestDistances, bestTargets, np.square(distances), np.asarray(tree["targets"])[indices], numOfNeighbours)
+
+
+class KDTreeKNNRegressor(BaseEstimator, RegressorMixin):
+
+    def __init__(self, n_neighbors=5, leafSize=64, bufferSize=256, indexDirectory=None):
+        self.n_neighbors = n_neighbors
+        self.leafSize = leafSize
+        self.bufferSize = bufferSize  # Number of inserted points searched linearly before they are merged into a tree
+        self.indexDirectory = indexDirectory  # Directory the index files are saved to, the pickled model then only refers to it
+
+        self.reset()
+
+    def reset(self):
+        '''This method is responsible for emptying the index'''
+
+        # Level i holds a static tree of roughly bufferSize * 2^i points, or None
+        self.levels = []
+        self.bufferPoints = None
+        self.bufferTargets = None
+        self.numOfSamples = 0
+        self.isTrained = False
+
+        # Levels changed since the index was last saved, and whether the files match the index
+        self.dirtyLevels = set()
+        self.isSaved = False
+
+    def fit(self, X, y):
+        '''
+        This method is responsible for building the index from scratch as a single tree.
+        params:
+            X: two-dimensional array of feature values
+            y: two-dimensional array of target values
+        '''
+
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        self.reset()
+
+        # The tree goes on the first level large enough for it, so points inserted later merge into the levels below it first
+        if len(X):
+            level = max(int(np.ceil(np.log2(len(X) / self.bufferSize))), 0)
+            self.setLevel(level, buildTree(X, y, self.leafSize))
+
+        self.bufferPoints = np.empty((0, X.shape[1]))
+        self.bufferTargets = np.empty((0, y.shape[1]))
+        self.numOfSamples = len(X)
+        self.isTrained = len(X) > 0
+
+        return self
+
+    def partial_fit(self, X, y):
+        '''
+        This method is responsible for inserting new points without rebuilding the index.
+        Once the buffer is full it is merged with the consecutive occupied levels from the smallest one into a single new tree,
+        so each point is rebuilt O(log n) times over the life of the index.
+        params:
+            X: array of feature values, or a two-dimensional array for several points
+            y: array of target values, or a two-dimensional array for several points
+        '''
+
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+
+        if self.bufferPoints is None:
+            self.bufferPoints = np.empty((0, X.shape[1]))
+            self.bufferTargets = np.empty((0, y.shape[1]))
+
+        self.bufferPoints = np.vstack([self.bufferPoints, X])
+        self.bufferTargets = np.vstack([self.bufferTargets, y])
+        self.numOfSamples += len(X)
+        self.isTrained = True
+        self.isSaved = False
+
+        if len(self.bufferPoints) < self.bufferSize:
+            return self
+
+        points = self.bufferPoints
+        targets = self.bufferTargets
+        level = 0
+
+        while level < len(self.levels) and self.levels[level] is not None:
+            points = np.vstack([self.levels[level]["points"], points])
+            targets = np.vstack([self.levels[level]["targets"], targets])
+            self.setLevel(level, None)
+            level += 1
+
+        self.setLevel(level, buildTree(points, targets, self.leafSize))
+
+        self.bufferPoints = self.bufferPoints[:0]
+        self.bufferTargets = self.bufferTargets[:0]
+
+        return self
+
+    def partial_fit_batch(self, X, y):
+        return self.partial_fit(X, y)
+
+    def setLevel(self, level, tree):
+        '''
+        This method is responsible for replacing the tree of a level and marking the level to be saved.
+        params:
+            level: level number
+            tree: static tree, or None to empty the level
+        '''
+
+        while len(self.levels) <= level:
+            self.levels.append(None)
+
+        self.levels[level] = tree
+        self.dirtyLevels.add(level)
+        self.isSaved = False
+
+    def kneighbors(self, X):
+        '''
+        This method is responsible for finding the nearest stored points to each query point.
+        params:
+            X: two-dimensional array of feature values
+        returns:
+            distances: two-dimensional array of distances, nearest first
+            targets: three-dimensional array of the targets of the nearest points
+        '''
+
+        if self.numOfSamples == 0:
+            raise NotFittedError("The index holds no points yet, call fit or partial_fit before searching it")
+
+        X = np.asarray(X, dtype=np.float64)
+        numOfNeighbours = min(self.n_neighbors, self.numOfSamples)
+        numOfTargets = self.bufferTargets.shape[1]
+
+        allDistances = np.full((len(X), numOfNeighbours), np.inf)
+        allTargets = np.zeros((len(X), numOfNeighbours, numOfTargets))
+
+        for start in range(0, len(X), QUERY_CHUNK_SIZE):
+            queries = X[start:start + QUERY_CHUNK_SIZE]
+            bestDistances = allDistances[start:start + QUERY_CHUNK_SIZE]
+            bestTargets = allTargets[start:start + QUERY_CHUNK_SIZE]
+
+            # The buffer is small enough to search linearly
+            if len(self.bufferPoints):
+                bestDistances, bestTargets = searchPoints(queries, self.bufferPoints, self.bufferTargets, bestDistances, bestTargets, numOfNeighbours)
+
+            for tree in self.levels:
+                if tree is not None:
+                    bestDistances, bestTargets = queryTree(tree, queries, bestDistances, bestTargets, numOfNeighbours, self.leafSize)
+
+            order = np.argsort(bestDistances, axis=1)
+            allDistances[start:start + QUERY_CHUNK_SIZE] = np.sqrt(np.take_along_axis(bestDistances, order, axis=1))
+            allTargets[start:start + QUERY_CHUNK_SIZE] = np.take_along_axis(bestTargets, order[:, :, np.newaxis], axis=1)
+
+        return allDistances, allTargets
+
+    def predict(self, X):
+        '''
+        This method is responsible for predicting the average target of the nearest points, like KNeighborsRegressor with uniform weights.
+        params:
+            X: two-dimensional array of feature values
+        returns:
+            predictions: two-dimensional array with one row per query point
+        '''
+
+        distances, targets = self.kneighbors(X)
+
+        return targets.mean(axis=1)
+
+    def save(self, directory=None):
+        '''
+        This method is responsible for writing the index files, only the levels changed since the last save are written.
+        Saving to a new directory hard links the files of the unchanged levels from the previous one, so versions share them.
+        params:
+            directory: directory of the index files, the current indexDirectory when None
+        '''
+
+        directory = directory or self.indexDirectory
+        sharedLevels = set()
+
+        # Saving somewhere new writes every level, the unchanged ones are linked from the previous directory when it exists
+        if directory != self.indexDirectory:
+            if self.indexDirectory is not None and os.path.isdir(self.indexDirectory):
+                sharedLevels = set(range(len(self.levels))) - self.dirtyLevels
+                previousDirectory = self.indexDirectory
+
+            self.dirtyLevels = set(range(len(self.levels)))
+            self.indexDirectory = directory
+
+        os.makedirs(directory, exist_ok=True)
+
+        for level in sorted(self.dirtyLevels):
+            tree = self.levels[level] if level < len(self.levels) else None
+
+            # Levels loaded from index files written before the KD-tree arrays were saved get them now
+            if tree is not None and "nodes" not in tree:
+                tree.update(buildTree(tree["points"], tree["targets"], self.leafSize))
+
+            for name in TREE_ARRAYS:
+                path = os.path.join(directory, "level%d_%s.npy" % (level, name))
+
+                if tree is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                elif level in sharedLevels:
+                    self.linkArray(os.path.join(previousDirectory, os.path.basename(path)), path, tree[name])
+                else:
+                    self.writeArray(path, tree[name])
+
+        self.writeArray(os.path.join(directory, "buffer_points.npy"), self.bufferPoints)
+        self.writeArray(os.path.join(directory, "buffer_targets.npy"), self.bufferTargets)
+
+        # The description of the index is written last, so it only lists files that are complete
+        meta = {"levels": [level for level, tree in enumerate(self.levels) if tree is not None], "numOfLevels": len(self.levels),
+                "numOfSamples": self.numOfSamples}
+
+        with open(os.path.join(directory, "index.json.tmp"), mode="w") as file:
+            json.dump(meta, file)
+        os.replace(os.path.join(directory, "index.json.tmp"), os.path.join(directory, "index.json"))
+
+        self.dirtyLevels = set()
+        self.isSaved = True
+
+    def writeArray(self, path, array):
+        with open(path + ".tmp", mode="wb") as file:
+            np.save(file, np.asarray(array))
+        os.replace(path + ".tmp", path)
+
+    def linkArray(self, source, path, array):
+        '''
+        This method is responsible for sharing a saved array file through a hard link, writing the array when it can't be linked.
+        Files are always replaced rather than written in place, so a linked file never changes under the other directory.
+        params:
+            source: saved file of the array
+            path: path of the new file
+            array: array, written when the file system doesn't support hard links or the source is missing
+        '''
+
+        try:
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            os.link(source, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        except OSError:
+            self.writeArray(path, array)
+
+    def loadIndex(self, directory, mmapMode="r"):
+        '''
+        This method is responsible for loading the saved index files, mapping the trees into memory instead of reading them.
+        params:
+            directory: directory of the index files
+            mmapMode: numpy memory mapping mode, None reads the arrays into memory
+        '''
+
+        with open(os.path.join(directory, "index.json"), mode="r") as file:
+            meta = json.load(file)
+
+        self.levels = [None] * meta["numOfLevels"]
+
+        for level in meta["levels"]:
+            paths = {name: os.path.join(directory, "level%d_%s.npy" % (level, name)) for name in TREE_ARRAYS}
+            self.levels[level] = {name: np.load(path, mmap_mode=mmapMode) for name, path in paths.items() if os.path.exists(path)}
+            self.levels[level]["search"] = restoreSearch(self.levels[level], self.leafSize)
+
+        # The buffer changes with every insert, so it is read into memory
+        self.bufferPoints = np.load(os.path.join(directory, "buffer_points.npy"))
+        self.bufferTargets = np.load(os.path.join(directory, "buffer_targets.npy"))
+
+        self.numOfSamples = meta["numOfSamples"]
+        self.isTrained = self.numOfSamples > 0
+        self.indexDirectory = directory
+        self.dirtyLevels = set()
+        self.isSaved = True
+
+    @staticmethod
+    def load(directory, n_neighbors=5, mmapMode="r"):
+        model = KDTreeKNNRegressor(n_neighbors=n_neighbors)
+        model.loadIndex(directory, mmapMode)
+        return model
+
+    def __getstate__(self):
+        # The base class may hand back the instance dictionary itself, so the arrays are dropped from a copy
+        state = dict(super().__getstate__())
+
+        # A saved index is pickled as a reference to its files, which are memory mapped again when the model is loaded
+        if self.indexDirectory is not None and self.isSaved:
+            for name in ["levels", "bufferPoints", "bufferTargets"]:
+                state.pop(name, None)
+
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+
+        if "levels" not in state:
+            self.loadIndex(self.indexDirectory)
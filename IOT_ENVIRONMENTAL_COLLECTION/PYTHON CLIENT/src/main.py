@@ -5,31 +5,167 @@ import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.neighbors import KNeighborsRegressor
 from sklearn.tree import DecisionTreeRegressor
-from sklearn.metrics import mean_squared_error
+from sklearn.base import clone
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
 import socket
 import csv
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from segmentstore import SegmentedStore
+from datasetmanager import DatasetManager
+from modelcache import ModelCache, hashRows, fingerprintConfig
+from modelregistry import ModelRegistry, fingerprintData
+from modelselection import selectBestModel, selectBestModelHalving
+from onlinelearning import OnlineForecaster, RecursiveLeastSquares
+from knnindex import KDTreeKNNRegressor
+from treecompiler import compileTreeModel, isCompilable
+from multihorizon import forecastHorizons
+from backtest import Backtester
+from weatherschema import FEATURES, dateToDay, toFloat
+from typedloader import loadTypedHistory
+from columnstore import ColumnStore
+import recordprotocol
 
 class MachineLearning():
 
-    def __init__(self):
-        self.host =  'MY-ESP32-IP-ADDRESS'
-        self.port = 6000  # Socket server port number
-        self.client_socket = socket.socket()  # Instantiate client socket
-        self.csvFile = "weatherData.csv"
-        self.altitude = 590
+    def __init__(self, stationId=1, host='MY-ESP32-IP-ADDRESS', port=6000, altitude=590, directory=".", trainingExecutor=None, columnDirectory=None, parquetDirectory=None,
+                 retrainAfterRows=7):
+        self.host = host
+        self.port = port  # Socket server port number
+        self.directory = directory  # Directory holding the data and models of the weather station
+        self.csvFile = os.path.join(directory, "weatherData.csv")
+        self.dataDirectory = os.path.join(directory, "weatherData")
+        self.parquetDirectory = parquetDirectory  # Optional Parquet export (see parquetstore.py) used as the training source
+        self.columnDirectory = columnDirectory  # Optional column store (see columnstore.py) used as the training source, new records are written to it too
+        self.modelFile = os.path.join(directory, "weather_predictor.sav")  # Single model file of older versions, imported into the model registry the first time
+        self.registryDirectory = os.path.join(directory, "modelRegistry")
+        self.altitude = altitude
+        self.stationId = stationId  # ID of the weather station the data is collected from
+        self.windowSize = 30  # Number of days averaged into the model inputs
+        self.inferenceOnly = False  # Reuse the saved model instead of retraining on every connection
+        self.retrainAfterRows = retrainAfterRows  # Number of new daily entries after which a cached model is retrained, 0 for every new entry
+        self.maxIncrementalRows = 90  # Number of rows inserted into a nearest neighbour index before every model is compared again
+        self.coreBudget = os.cpu_count()  # Cores shared by the candidate models during model selection
+        self.selectionTimeBudget = None  # Seconds allowed for model selection, successive halving is used when set
+        self.trainingYears = None  # Only train on the last N years of the history when set
+        self.forecastHorizon = 1  # Number of days forecast for the weather station, the extra days' Zambretti values follow tomorrow's
+        self.onlineLearning = False  # Update streaming models one day at a time instead of refitting on the whole history
+        self.onlineStateFile = os.path.join(directory, "online_state.sav")
+        self.onlineIndexDirectory = os.path.join(directory, "onlineKnnIndex")  # Memory mapped nearest neighbour index of the online models
+        self.onlineForecaster = None
+
+        # Latest trained model, swapped under the lock when a background retraining finishes
+        self.currentModel = None
+        self.modelLock = threading.Lock()
+
+        # Held while rows are added, so a background retraining never reads a half written dataset
+        self.datasetLock = threading.Lock()
+
+        # Single worker thread, so at most one retraining runs at a time. The collector shares one between all its weather stations
+        self.trainingExecutor = trainingExecutor or ThreadPoolExecutor(max_workers=1)
+        self.retraining = None
+
+        # Monthly segmented dataset, old segments are dropped once it holds more than 20538 entries.
+        # Segments older than the last two months are compressed into archives, which load faster than the CSV
+        self.store = SegmentedStore(self.dataDirectory, stationId=self.stationId, keepRecent=2)
+
+        # Migrate an existing single CSV file into segments the first time the store is used
+        if self.store.getNumOfEntries() == 0 and os.path.exists(self.csvFile):
+            self.store.importCSV(self.csvFile)
+
+        # Every selected model is saved as a version of the registry, which can be rolled back
+        self.registry = ModelRegistry(self.registryDirectory)
+
+        if self.registry.currentVersion is None and os.path.exists(self.modelFile):
+            self.registry.register(joblib.load(self.modelFile), self.registry.newVersion("imported"), source=self.modelFile)
+
+        # Versions of the best models cached by data and configuration fingerprint, so unchanged data isn't retrained
+        self.modelCache = ModelCache(os.path.join(directory, "modelCache"), maxNewRows=self.retrainAfterRows)
+
+        # History is read from the store once per process and then kept in memory
+        if self.parquetDirectory is not None:
+
+            # Train from a Parquet export instead of the CSV segments, which then only hold the records received since the export
+            from parquetstore import loadParquetHistory
+            self.dataset = DatasetManager(self.store, source=lambda: loadParquetHistory(self.parquetDirectory, self.stationId, self.store),
+                                          windowSizes=(self.windowSize,))
+        elif self.columnDirectory is not None:
+
+            # Train from the memory mapped column files instead of the CSV segments
+            self.columnStore = ColumnStore(self.columnDirectory)
+            self.dataset = DatasetManager(self.store, source=lambda: loadTypedHistory([self.columnDirectory]), windowSizes=(self.windowSize,))
+        else:
+            self.dataset = DatasetManager(self.store, windowSizes=(self.windowSize,))
 
     def client_program(self):
 
-        client_socket = self.client_socket
+        client_socket = socket.socket()  # Instantiate client socket
         client_socket.connect((self.host, self.port))  # Connect to server
 
-        # Receive response
-        data = client_socket.recv(1024).decode()
+        # Receive the record, its header says how many bytes follow
+        header = recordprotocol.recvExactly(client_socket, recordprotocol.HEADER_SIZE)
+
+        if header.startswith(recordprotocol.MAGIC):
+            message = header + recordprotocol.recvExactly(client_socket, recordprotocol.parseHeader(header)[1])
+        else:
+            # Weather stations running older firmware send the record as a single text message
+            message = header + client_socket.recv(1024)
+
+        # Store the record and forecast from it
+        zambrettiForecasts = self.handleMessage(message)
+
+        # Send zambretti prediction back to Weather Station ESP32
+        recordprotocol.sendAll(client_socket, zambrettiForecasts)
+
+        # Close connetion 
+        client_socket.close()
+
+        # Retrain on the new data after replying, the new model is used from the next connection onwards
+        self.retrainInBackground()
+
+    def handleMessage(self, message):
+        '''
+        This method is responsible for handling a message received from the weather station and encoding the reply to send back.
+        Replies use the same format as the message, framed binary (see recordprotocol.py) or the text format of older firmware.
+        params:
+            message: complete message received from the weather station
+        returns:
+            reply: bytes to send back
+        '''
+
+        if not message.startswith(recordprotocol.MAGIC):
+            zambrettiCodes = self.handleRecord(self.parseRecord(message.decode()))
+
+            # Format zambretti values
+            return ",".join(f"{zambretti9am},{zambretti3pm}" for zambretti9am, zambretti3pm in zambrettiCodes).encode()
+
+        messageType, payload = recordprotocol.parseFrame(message)
+
+        if messageType != recordprotocol.RECORD:
+            raise ValueError("Expected a record, got message type " + str(messageType))
+
+        stationId, sequence, newData = recordprotocol.decodeRecord(payload)
+
+        if stationId != self.stationId:
+            raise ValueError("Record from station %d sent to the client of station %d" % (stationId, self.stationId))
+
+        zambrettiCodes = self.handleRecord(newData)
+
+        # The reply carries the record's sequence number, so the weather station can match it to the record it sent
+        return recordprotocol.encodeReply(stationId, sequence, [code for codes in zambrettiCodes for code in codes])
+
+    def parseRecord(self, data):
+        '''
+        This method is responsible for splitting a text record sent by older weather station firmware into its values.
+        params:
+            data: record string, values separated by spaces
+        returns:
+            newData: list of values in the COLUMNS order, numbers converted to floats
+        '''
 
         # Convert data string to list 
         data = list(data.split(" "))
@@ -42,189 +178,485 @@ class MachineLearning():
                 newData.append(float(ele))
             except:
                 newData.append(ele)
+
+        return newData
+
+    def handleRecord(self, newData):
+        '''
+        This method is responsible for storing a record received from the weather station and forecasting from it.
+        params:
+            newData: list of values in the COLUMNS order
+        returns:
+            zambrettiCodes: list of the 9am and 3pm Zambretti values of each forecast day
+        '''
         
         # Call function to update CSV file with the new data collected
         self.updateCSV(newData)
 
-        # Call function run machine-learning function and return prediction
-        predictions = self.predictWeatherParams()
+        # Forecast with the latest trained model straight away, the weather station is blocked until it gets a reply
+        predictions = self.getLatestForecast()
+
+        # Zambretti values for tomorrow, followed by the rest of the outlook when more than one day is forecast
+        zambrettiCodes = [self.getZambrettiCodes(predictions)]
+
+        if self.forecastHorizon > 1:
+            zambrettiCodes += [self.getZambrettiCodes(dayPredictions) for dayPredictions in self.predictHorizons(self.forecastHorizon)[1:]]
+
+        return zambrettiCodes
+
+    def getZambrettiCodes(self, predictions):
+        '''
+        This method is responsible for turning a day's predicted weather parameters into its 9am and 3pm Zambretti values.
+        params:
+            predictions: list of predicted values in the FEATURES order
+        returns:
+            zambretti9am: 9am Zambretti value
+            zambretti3pm: 3pm Zambretti value
+        '''
 
         # Convert prediction list values to floats
         predictions = [float(i) for i in predictions]
 
         # Get seaLevelPressure for 9am predictions
         seaLevelPressure9am = self.getStationSeaLevel(predictions[6], self.altitude, predictions[8])
-        #print(seaLevelPressure9am)
 
         # Get seaLevelPressure for 3pm predictions
         seaLevelPressure3pm = self.getStationSeaLevel(predictions[7], self.altitude, predictions[9])
-        #print(seaLevelPressure3pm)
 
         # Calculate 9am zambretti value by parsing 9am pressure prediction and atmospheric pressure value at sea level for 9am  
         zambretti9am = self.calculateZambretti(predictions[6], float(seaLevelPressure9am))
-        #print(zambretti9am)
 
         # Calculate 3pm zambretti value by parsing 3pm pressure prediction and atmospheric pressure value at sea level for 9am  
         zambretti3pm = self.calculateZambretti(predictions[7], float(seaLevelPressure3pm))
-        #print(zambretti3pm)
 
-        # Format zambretti values
-        zambrettiForecasts = f"{zambretti9am},{zambretti3pm}"
+        return zambretti9am, zambretti3pm
 
-        # Send zambretti prediction back to Weather Station ESP32
-        client_socket.send(zambrettiForecasts.encode())
+    def predictHorizons(self, numOfDays, model=None):
+        '''
+        This method is responsible for forecasting the weather parameters of the next numOfDays days in one batched call.
+        params:
+            numOfDays: number of days to forecast
+            model: trained model to use, the latest trained (or online) model when None
+        returns:
+            formattedPredictions: list with one list of predictions formatted to 2 decimal places per day, tomorrow first
+        '''
 
-        # Close connetion 
-        client_socket.close()
+        if model is None:
+            model = self.getOnlineForecaster().getBestModel() if self.onlineLearning else self.getCurrentModel()
+
+        # Nothing has been trained yet
+        if model is None:
+            self.predictWeatherParams(self.inferenceOnly)
+            model = self.getOnlineForecaster().getBestModel() if self.onlineLearning else self.getCurrentModel()
+
+        with self.datasetLock:
+            if self.dataset.loaded:
+                recentData = self.dataset.getTail(self.windowSize)
+            else:
+                recentData = self.store.readTail(self.windowSize)
+
+            predictions = forecastHorizons(model, recentData[FEATURES].to_numpy(), numOfDays)
+
+        print("\nWeather Outlook:")
+        print(pd.DataFrame(predictions, columns=FEATURES, index=range(1, numOfDays + 1)).to_string())
+
+        return [['%.2f' % elem for elem in dayPredictions] for dayPredictions in predictions]
 
     def getNumOfEntries(self):
         '''
-        This method is responsible for checking how many rows are in the weather data file and returning the value.
+        This method is responsible for checking how many rows are in the weather dataset and returning the value.
         returns:
-            numOfEntries: the number of rows present in the CSV file.
+            numOfEntries: the number of rows present in the dataset.
         '''
 
-        # Opening the CSV file
-        with open(self.csvFile, mode="r") as file:
+        # The store keeps a running count, so there is no need to scan the data files
+        return self.store.getNumOfEntries()
+        
+    def updateCSV(self, newData):
+        '''
+        This method is responsible for taking the newly acquired data and appending it to the existing dataset (monthly CSV segments)
+        params:
+            newData: newly acquired data
+        '''
+
+        with self.datasetLock:
+
+            # Append the new row to the end of its monthly segment (and to the in-memory dataset), whole segments are dropped once the dataset is full.
+            # A day resent by the weather station replaces its existing row instead of being appended again
+            self.dataset.upsert(newData)
 
-            # Reading the CSV file
-            csvFile = csv.reader(file)
+            # The column store is the training source, so it must hold the new row too (a resent day's last row wins when it is read)
+            if self.columnDirectory is not None:
+                self.columnStore.append(newData)
+
+            # Teach the online models the new day in constant time
+            if self.onlineLearning:
+                self.updateOnlineModels(newData)
+
+    def getLatestForecast(self):
+        '''
+        This method is responsible for forecasting tomorrows weather without waiting for a training run, using the latest trained model
+        on the most recent rows. Training only happens here when no model has been trained yet.
+        returns:
+            formattedPredictions: list of next day predictions formatted to 2 decimal places
+        '''
 
-            # Getting the header of the file
-            header = next(csvFile)
+        model = self.getCurrentModel()
 
-            # Checking if the file is empty
-            if header != None:
+        # Online models are updated with every row, so they are always current
+        if self.onlineLearning or model is None:
+            return self.predictWeatherParams(self.inferenceOnly)
 
-                # Get number of data entries using the sum method and a for loop
-                numOfEntries = sum(1 for row in csvFile)
+        with self.datasetLock:
+            return self.predictFromTail(model)
+
+    def getCurrentModel(self):
+        '''
+        This method is responsible for returning the latest trained model, loading the current registry version the first time.
+        returns:
+            model: trained model, or None if no model has been trained yet
+        '''
+
+        with self.modelLock:
+            if self.currentModel is None:
+                self.currentModel = self.registry.load()
+
+            return self.currentModel
+
+    def setCurrentModel(self, model, version, **metadata):
+        '''
+        This method is responsible for saving a newly trained model as a registry version and swapping it in for the next forecasts.
+        The file is written under a temporary name and renamed, so a reader never sees a half written model.
+        params:
+            model: trained model
+            version: name of the version from the registry
+            metadata: other values stored with the version
+        '''
+
+        with self.modelLock:
+            self.registry.register(model, version, **metadata)
+            self.currentModel = model
+
+    def activateModelVersion(self, version, pin=False):
+        '''
+        This method is responsible for swapping in an already saved model version, without writing it again.
+        params:
+            version: name of the version
+            pin: True to keep the version current until a new version is trained (see ModelRegistry.activate)
+        returns:
+            model: trained model of the version
+        '''
+
+        with self.modelLock:
+            self.registry.activate(version, pin)
+            self.currentModel = self.registry.load(version)
+
+            return self.currentModel
+
+    def rollbackModel(self):
+        '''
+        This method is responsible for going back to the model version trained before the current one, which stays pinned until a new version is trained.
+        returns:
+            version: name of the new current version, or None if there is no older version
+        '''
 
+        with self.modelLock:
+            version = self.registry.rollback()
+
+            if version is not None:
+                self.currentModel = self.registry.load(version)
+
+            return version
+
+    def retrainInBackground(self):
+        '''
+        This method is responsible for starting a retraining run on the worker thread, unless one is already running.
+        returns:
+            retraining: future of the training run, or None when only inference is used
+        '''
+
+        if self.inferenceOnly or self.onlineLearning:
+            return None
+
+        if self.retraining is None or self.retraining.done():
+            self.retraining = self.trainingExecutor.submit(self.predictWeatherParams)
+
+        return self.retraining
+
+    def getOnlineForecaster(self):
+        '''
+        This method is responsible for loading the persisted online models, bootstrapping them from the stored history the first time.
+        returns:
+            onlineForecaster: online models and their rolling window state
+        '''
+
+        if self.onlineForecaster is None:
+
+            if os.path.exists(self.onlineStateFile):
+                self.onlineForecaster = OnlineForecaster.load(self.onlineStateFile)
             else:
+                self.onlineForecaster = OnlineForecaster(self.windowSize, indexDirectory=self.onlineIndexDirectory).fit(self.dataset.getDays(), self.dataset.getValues())
+                self.onlineForecaster.save(self.onlineStateFile)
 
-                # Add header to CSV file
-                df = pd.read_csv(self.csvFile, header=None, names=["Date", "MinTemp", "MaxTemp", "Windspeed9am", "Windspeed3pm", "Humidity9am", "Humidity3pm", "Pressure9am", "Pressure3pm", "Temp9am", "Temp3pm"])
-                
-                # Get number of entries using the sum method and a for loop
-                numOfEntries = sum(1 for row in csvFile)
-            
-            return numOfEntries
-        
-    def updateCSV(self, newData):
+        return self.onlineForecaster
+
+    def updateOnlineModels(self, newData):
         '''
-        This method is responsible for taking the newly acquired data and appending it to the existing dataset (CSV file)
+        This method is responsible for updating the online models with a newly acquired daily record and saving their state.
         params:
             newData: newly acquired data
         '''
 
-        # --- Read csv file --- #
-        df = pd.read_csv(self.csvFile)
+        day = dateToDay(newData[0])
+        rowValues = np.array([toFloat(value) for value in newData[1:]])
 
-        entries = self.getNumOfEntries()
+        # Incomplete days aren't used for training
+        if day is None or np.isnan(rowValues).any():
+            return
 
-        # Create row data out of new data list elements
-        row = {
-            "Date" : [newData[0]],
-            "MinTemp" : [newData[1]],
-            "MaxTemp" : [newData[2]],
-            "WindSpeed9am" : [newData[3]],
-            "WindSpeed3pm" : [newData[4]], 
-            "Humidity9am" : [newData[5]],
-            "Humidity3pm" : [newData[6]],
-            "Pressure9am" : [newData[7]],
-            "Pressure3pm" : [newData[8]],
-            "Temp9am" : [newData[9]],
-            "Temp3pm" : [newData[10]]
-        }
+        onlineForecaster = self.getOnlineForecaster()
 
-        if entries >= 20538:
+        if onlineForecaster.update(day, rowValues):
+            onlineForecaster.save(self.onlineStateFile)
 
-            # Remove First entry from dataset 
-            df = df.drop(df.index[0])
+    def predictWeatherParams(self, inferenceOnly=False):
+        '''
+        This method is responsible for loading the historical data and using a list of machine learning models to predict tomorrows forecast
+        params:
+            inferenceOnly: skip training and run the already trained model on the most recent rows only
+        '''
 
-            # writing into the file
-            df.to_csv(self.csvFile, index=False)
+        # Only the tail of the dataset is needed when the model has already been trained
+        if inferenceOnly and self.registry.currentVersion is not None:
+            return self.predictFromTail()
 
-        # Create data frame using row data
-        df = pd.DataFrame(row)
+        # Online models are already up to date, so no training is needed
+        if self.onlineLearning:
+            onlineModel = self.getOnlineForecaster().getBestModel()
 
-        # Append new data frame to CSV file
-        df.to_csv(self.csvFile, mode='a', index=False, header=False)
+            if onlineModel is not None:
+                print("Online Model:", onlineModel)
+                return self.predictFromTail(onlineModel)
 
-    def predictWeatherParams(self):
-        '''This method is responsible for loading the historical data and using a list of machine learning models to predict tomorrows forecast'''
+        # --- Load the dataset, rows with "N/A" values are left out by the dataset manager --- #
+        window_size = self.windowSize
 
-        # Load the dataset
-        data = pd.read_csv('weatherData.csv')
+        # Take a copy of the data, new rows may be added while the models are training in the background
+        with self.datasetLock:
 
-        # --- Remove "N/A" values --- #
-        data = pd.read_csv(self.csvFile, na_values=["not available", "n/a", "N/A"])
+            # Rolling average across the last 30 data entries, kept up to date by the dataset manager as rows are added
+            rolling_average_data = self.dataset.getRollingFrame().copy()
+            recent_data = self.dataset.getTail(window_size).copy()
+            rowHashes = hashRows(self.dataset.getDays(), self.dataset.getValues())
 
-        # Remove rows with at least one Nan value (Null value)
-        data = data.dropna()
+            # Day of each rolling average row, used to limit training to a sliding window of recent years
+            rolling_days = self.dataset.getDays()[len(self.dataset.getDays()) - len(rolling_average_data):]
 
-        # Sort the dataset by date in ascending order
-        data = data.sort_values('Date')
+        if self.trainingYears is not None and len(rolling_days) > 0:
+            rolling_average_data = rolling_average_data[rolling_days >= rolling_days[-1] - int(self.trainingYears * 365)]
 
-        # Select the last row of the DataFrame
-        last_row = data.iloc[-1]
+        # The input features and the target variables are the same FEATURES columns
+        X = rolling_average_data[FEATURES]
+        y = rolling_average_data[FEATURES]
 
-        # Convert last row to list (2D array)
-        row = last_row.values.tolist()
+        # Define the models to compare
+        models = self.getCandidateModels()
 
-        # Convert last row list into 1D list
-        recentEntry = row
-        #print(recentEntry)
+        # Reuse the cached best model if the data and the models haven't changed (or only a few days were added)
+        configFingerprint = fingerprintConfig(models, windowSize=window_size, testSize=0.2, randomState=42,
+                                              timeBudget=self.selectionTimeBudget, trainingYears=self.trainingYears)
 
-        # Select the last 10 days' data entries
-        last_10_days_data = data.tail(10)
+        cachedVersion, numOfNewRows = self.modelCache.lookupAppended(configFingerprint, rowHashes)
 
-        # Extract the relevant columns for the prediction comparison graph
-        real_values = last_10_days_data['Pressure3pm']
-        real_values= real_values.values.tolist()
+        # Older cache entries hold the model itself, and a version may have been deleted from the registry since
+        if isinstance(cachedVersion, str) and self.registry.hasVersion(cachedVersion):
 
-        # Calculate rolling average across the last 30 data entries
-        window_size = 30
-        rolling_average_data = data.rolling(window_size).mean().dropna()
+            # A version rolled back to or activated by hand, possibly from the command line, isn't replaced by the cached one
+            pinned = self.registry.isPinned()
 
-        # Define the input features and target variables
-        features = ['MinTemp', 'MaxTemp', 'WindSpeed9am', 'WindSpeed3pm', 'Humidity9am', 'Humidity3pm', 'Pressure9am', 'Pressure3pm', 'Temp9am', 'Temp3pm']
-        targets = ['MinTemp', 'MaxTemp', 'WindSpeed9am', 'WindSpeed3pm', 'Humidity9am', 'Humidity3pm', 'Pressure9am', 'Pressure3pm', 'Temp9am', 'Temp3pm']
+            # An unchanged dataset always reuses the cached model, so retrainAfterRows=0 retrains after every new row
+            if numOfNewRows < max(self.retrainAfterRows, 1):
 
-        # Prepare input features for the last 10 days
-        X_last_10_days = last_10_days_data[features]
+                if pinned:
+                    with self.modelLock:
+                        self.currentModel = self.registry.load()
+                        best_model = self.currentModel
 
-        X = rolling_average_data[features]
-        y = rolling_average_data[targets]
+                    print("Pinned Model:", self.registry.currentVersion, best_model)
+                else:
+                    best_model = self.activateModelVersion(cachedVersion)
+                    print("Cached Model:", cachedVersion, best_model)
+
+                return self.forecastNextDay(best_model, recent_data)
+
+            # Only rows were appended, a nearest neighbour model just has them inserted into its index instead of every model being retrained.
+            # A sliding training window also drops old rows, which the index can't, so it is always retrained.
+            # A pinned version replaced the cached one, so the cached index isn't built on.
+            # Once maxIncrementalRows rows have been inserted since the last model selection, it runs again
+            if self.trainingYears is None and numOfNewRows < len(X) and not pinned:
+                best_model = self.updateNearestNeighbours(cachedVersion, X[-numOfNewRows:], y[-numOfNewRows:], rowHashes)
+
+                if best_model is not None:
+                    self.modelCache.store(configFingerprint, rowHashes, self.registry.currentVersion)
+                    return self.forecastNextDay(best_model, recent_data)
 
         # Split the dataset into training and testing sets
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-        # Define the models to compare
-        models = [
+        # Train and evaluate the models concurrently, then keep the one with the smallest MSE
+        if self.selectionTimeBudget is not None:
+            best_model, results = selectBestModelHalving(models, X_train, y_train, X_test, y_test, self.selectionTimeBudget, coreBudget=self.coreBudget)
+        else:
+            best_model, results = selectBestModel(models, X_train, y_train, X_test, y_test, self.coreBudget)
+
+        # Only the selected model is saved, as a new version named after the training data
+        version = self.registry.newVersion(fingerprintData(rowHashes))
+        best_mse = min(result[1] for result in results)
+
+        # The nearest neighbour index is kept in its own memory mapped files next to the version, the saved model only refers to them
+        if isinstance(best_model, KDTreeKNNRegressor):
+            best_model.save(self.registry.getVersionPath(version, "knn"))
+
+        # Tree models are flattened into node arrays, which are smaller to save and faster to load and predict with
+        if isCompilable(best_model):
+            best_model = compileTreeModel(best_model)
+
+        self.setCurrentModel(best_model, version, name=type(best_model).__name__, mse=float(best_mse), numOfRows=len(rowHashes))
+
+        print("Best Model MSE:", best_mse)
+        print("Best Model:", version, best_model)
+
+        # The cache refers to the registry version, so the model is only written once
+        self.modelCache.store(configFingerprint, rowHashes, version)
+
+        # Forecast tomorrow from the last 30 days' data entries
+        return self.forecastNextDay(best_model, recent_data)
+
+    def updateNearestNeighbours(self, previousVersion, X, y, rowHashes):
+        '''
+        This method is responsible for inserting the rows appended since a nearest neighbour model was trained into a copy of its index,
+        and saving the copy as a new version. The previous version keeps its own index files, so it can still be rolled back to.
+        params:
+            previousVersion: name of the version trained before the rows were appended
+            X: input features of the appended rows
+            y: targets of the appended rows
+            rowHashes: hashes of the current dataset rows
+        returns:
+            model: updated model, or None if the previous version isn't a nearest neighbour model or the model selection is due again
+        '''
+
+        previousModel = self.registry.load(previousVersion)
+
+        if not isinstance(previousModel, KDTreeKNNRegressor) or previousModel.indexDirectory is None:
+            return None
+
+        # Rows inserted since the model selection last ran, counted along the chain of updated versions
+        previousEntry = next(entry for entry in self.registry.versions if entry["version"] == previousVersion)
+        incrementalRows = previousEntry.get("incrementalRows", 0) + len(X)
+
+        if incrementalRows > self.maxIncrementalRows:
+            return None
+
+        # The appended rows haven't been seen by the previous index, so its error on them is measured before they are inserted
+        mse = float(np.mean(np.square(previousModel.predict(np.asarray(X)) - np.asarray(y))))
+
+        # The registry keeps the loaded previous model in memory, so the new rows go into a fresh copy mapping the same files.
+        # Saving the copy links the files of the levels the new rows didn't change instead of writing them again
+        model = clone(previousModel)
+        model.loadIndex(previousModel.indexDirectory)
+        model.partial_fit(X, y)
+
+        version = self.registry.newVersion(fingerprintData(rowHashes))
+        model.save(self.registry.getVersionPath(version, "knn"))
+
+        self.setCurrentModel(model, version, name=type(model).__name__, mse=mse, numOfRows=len(rowHashes),
+                             updatedFrom=previousVersion, incrementalRows=incrementalRows)
+
+        print("Updated Model:", version, model)
+
+        return model
+
+    def getCandidateModels(self):
+        '''
+        This method is responsible for returning the untrained models compared by the model selection.
+        returns:
+            models: list of untrained models
+        '''
+
+        return [
             LinearRegression(),
             RandomForestRegressor(),
-            KNeighborsRegressor(),
+            KDTreeKNNRegressor(),
             DecisionTreeRegressor()
         ]
 
-        # Train and evaluate each model
-        model_mses = []
-        for model in models:
-            model.fit(X_train, y_train)
-            joblib.dump(model, 'weather_predictor.sav')
-            y_pred = model.predict(X_test)
-            mse = mean_squared_error(y_test, y_pred)
-            model_mses.append(mse)
+    def runBacktest(self, refitEvery=30, trainingYears=None, startDay=None, endDay=None):
+        '''
+        This method is responsible for replaying the stored history to measure how the model selection would have forecast each day.
+        params:
+            refitEvery: number of days between refits of the candidate models
+            trainingYears: length of the sliding training window in years, the window expands from the start when None
+            startDay: first forecast day to replay, as a day number
+            endDay: last forecast day to replay, as a day number
+        returns:
+            table: data frame of the forecast and actual values of each day
+            metrics: data frame of the errors of each model, the selected models and the online model
+        '''
+
+        backtester = Backtester(self.dataset.getDays(), self.dataset.getValues(), self.getCandidateModels(), self.windowSize, refitEvery,
+                                None if trainingYears is None else int(trainingYears * 365),
+                                onlineModels={"RecursiveLeastSquares": RecursiveLeastSquares()}, coreBudget=self.coreBudget)
+
+        return backtester.run(startDay, endDay)
 
-        # Find the model with the smallest MSE
-        best_model_index = model_mses.index(min(model_mses))
-        best_model = models[best_model_index]
+    def predictFromTail(self, model=None):
+        '''
+        This method is responsible for predicting tomorrows forecast with the already trained model, reading only the last 30 valid rows
+        of the dataset backwards from its end. The time taken doesn't depend on how much history is stored.
+        params:
+            model: trained model to use, the model saved by the last training run when None
+        returns:
+            formattedPredictions: list of next day predictions formatted to 2 decimal places
+        '''
+
+        # Read the last 30 valid data entries, from memory if the history is already loaded, otherwise from the end of the store
+        if self.dataset.loaded:
+            recentData = self.dataset.getTail(self.windowSize)
+        else:
+            recentData = self.store.readTail(self.windowSize)
+
+        # Load the model saved by the last training run
+        if model is None:
+            model = self.getCurrentModel()
+
+        return self.forecastNextDay(model, recentData)
+
+    def forecastNextDay(self, model, recentData):
+        '''
+        This method is responsible for comparing the model against the last 10 days and predicting the next day's weather parameters
+        from the average of the most recent data entries.
+        params:
+            model: trained model used for the predictions
+            recentData: data frame of the most recent valid data entries, oldest first
+        returns:
+            formattedPredictions: list of next day predictions formatted to 2 decimal places
+        '''
+
+        features = FEATURES
+        targets = FEATURES
 
-        print("Best Model MSE:", min(model_mses))
-        print("Best Model:", best_model)
+        # Select the last 10 days' data entries
+        last_10_days_data = recentData.tail(10)
+
+        # Extract the relevant columns for the prediction comparison graph
+        real_values = last_10_days_data['Pressure3pm']
+        real_values= real_values.values.tolist()
+
+        # Prepare input features for the last 10 days
+        X_last_10_days = last_10_days_data[features]
 
         # Make predictions for the last 10 days using the best model
-        predictions = best_model.predict(X_last_10_days)
+        predictions = model.predict(X_last_10_days)
         predicted_values = predictions
 
         # Extract the values for the 'Pressure3pm' column from the predicted values
@@ -246,13 +678,12 @@ class MachineLearning():
         #plt.legend()
         #plt.show()
 
-        # Prepare input features for the next day (assuming you have data for the next day)
-        last_30_days_data = data.tail(window_size)  # Select the last 30 days' data entries
-        next_day_rolling_average = last_30_days_data.mean()  # Calculate the rolling average
-        next_day_features = next_day_rolling_average[features].values.reshape(1, -1)  # Reshape the features to match the model's expectations
+        # Prepare input features for the next day
+        next_day_rolling_average = recentData[features].mean()  # Calculate the rolling average
+        next_day_features = pd.DataFrame([next_day_rolling_average.values], columns=features)  # Reshape the features to match the model's expectations
 
         # Make predictions for the next day's weather parameters using the best model
-        next_day_predictions = best_model.predict(next_day_features)
+        next_day_predictions = model.predict(next_day_features)
         next_day_predictions = pd.DataFrame(next_day_predictions, columns=targets)
 
         print("\nNext Day's Weather Predictions:")#, predictions
@@ -0,0 +1,160 @@
+'''
+Cache of the best trained model, keyed by a fingerprint of the model configuration and of the training data.
+'''
+
+import os
+import hashlib
+import joblib
+import numpy as np
+
+# Odd 64-bit multipliers used to mix the columns of a row into a single hash
+ROW_HASH_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                                 0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9,
+                                 0x2545F4914F6CDD1D, 0x9FB21C651E98DF25, 0x8CB92BA72F3D8DD7, 0xA0761D6478BD642F], dtype=np.uint64)
+
+
+def hashRows(days, values):
+    '''
+    This function is responsible for computing a 64-bit hash of every row of the dataset in one vectorized pass.
+    params:
+        days: array of day numbers
+        values: two-dimensional array with one column per feature
+    returns:
+        rowHashes: uint64 array with one hash per row
+    '''
+
+    columns = np.column_stack([np.asarray(days, dtype=np.int32).view(np.uint32), np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)])
+    mixed = columns.astype(np.uint64) * ROW_HASH_MULTIPLIERS[:columns.shape[1]]
+
+    rowHashes = np.bitwise_xor.reduce(mixed, axis=1)
+
+    # Final avalanche step so rows differing in one bit get unrelated hashes
+    rowHashes ^= rowHashes >> np.uint64(33)
+    rowHashes *= np.uint64(0xFF51AFD7ED558CCD)
+    rowHashes ^= rowHashes >> np.uint64(33)
+
+    return rowHashes
+
+
+def fingerprintConfig(models, **settings):
+    '''
+    This function is responsible for fingerprinting the candidate models and the training settings.
+    params:
+        models: list of untrained candidate models
+        settings: other values that change the training result, such as the window size
+    returns:
+        fingerprint: hex digest
+    '''
+
+    description = [(type(model).__name__, sorted(model.get_params().items())) for model in models]
+    description.append(sorted(settings.items()))
+
+    return hashlib.sha256(repr(description).encode()).hexdigest()
+
+
+def countNewRows(cachedHashes, rowHashes):
+    '''
+    This function is responsible for counting the rows appended to a dataset since it held the cached rows.
+    Rows dropped from the start of the dataset by the retention limit don't count as a change.
+    params:
+        cachedHashes: hashes of the rows the cached model was trained on, oldest first
+        rowHashes: hashes of the current dataset rows, oldest first
+    returns:
+        numOfNewRows: number of rows after the newest cached row, or None if the datasets differ in another way
+    '''
+
+    # Find where the newest cached row is in the current data, every row after it is new
+    matches = np.flatnonzero(rowHashes == cachedHashes[-1]) if len(cachedHashes) else []
+    if len(matches) == 0:
+        return None
+
+    end = int(matches[-1]) + 1
+
+    # The rows both datasets share must be identical, otherwise a stored row was changed
+    overlap = min(end, len(cachedHashes))
+    if not np.array_equal(rowHashes[end - overlap:end], cachedHashes[len(cachedHashes) - overlap:]):
+        return None
+
+    return len(rowHashes) - end
+
+
+class ModelCache():
+
+    def __init__(self, directory="modelCache", maxNewRows=0):
+        self.directory = directory
+        self.maxNewRows = maxNewRows  # A cached model is reused while fewer rows than this have been appended since it was trained
+
+        os.makedirs(directory, exist_ok=True)
+
+    def getCachePath(self, configFingerprint):
+        return os.path.join(self.directory, configFingerprint + ".sav")
+
+    def lookup(self, configFingerprint, rowHashes, maxNewRows=None):
+        '''
+        This method is responsible for returning the cached best model if the training data is unchanged, or has only had a few rows appended.
+        Rows dropped from the start of the dataset by the retention limit don't count as a change.
+        params:
+            configFingerprint: fingerprint of the model configuration
+            rowHashes: hashes of the current dataset rows, oldest first
+            maxNewRows: number of appended rows that makes the cached model stale, the cache's maxNewRows when None
+        returns:
+            model: cached best model (or the model registry version it was saved as), or None if it has to be retrained
+        '''
+
+        path = self.getCachePath(configFingerprint)
+
+        if not os.path.exists(path):
+            return None
+
+        entry = joblib.load(path)
+
+        # Exact match of the training data
+        if np.array_equal(entry["rowHashes"], rowHashes):
+            return entry["model"]
+
+        numOfNewRows = countNewRows(entry["rowHashes"], rowHashes)
+
+        if numOfNewRows is None or numOfNewRows >= (self.maxNewRows if maxNewRows is None else maxNewRows):
+            return None
+
+        return entry["model"]
+
+    def lookupAppended(self, configFingerprint, rowHashes):
+        '''
+        This method is responsible for returning the cached best model together with the number of rows appended since it was trained,
+        so a model that can learn incrementally only has to be given the new rows.
+        params:
+            configFingerprint: fingerprint of the model configuration
+            rowHashes: hashes of the current dataset rows, oldest first
+        returns:
+            model: cached best model (or the model registry version it was saved as), or None if there is none or a stored row was changed
+            numOfNewRows: number of rows appended since the model was trained
+        '''
+
+        path = self.getCachePath(configFingerprint)
+
+        if not os.path.exists(path):
+            return None, 0
+
+        entry = joblib.load(path)
+        numOfNewRows = countNewRows(entry["rowHashes"], rowHashes)
+
+        if numOfNewRows is None:
+            return None, 0
+
+        return entry["model"], numOfNewRows
+
+    def store(self, configFingerprint, rowHashes, model):
+        '''
+        This method is responsible for saving the best model together with the hashes of the data it was trained on.
+        params:
+            configFingerprint: fingerprint of the model configuration
+            rowHashes: hashes of the training dataset rows, oldest first
+            model: trained best model, or the model registry version it was saved as
+        '''
+
+        path = self.getCachePath(configFingerprint)
+        tempFile = path + ".tmp"
+
+        joblib.dump({"rowHashes": rowHashes, "model": model}, tempFile)
+        os.replace(tempFile, path)
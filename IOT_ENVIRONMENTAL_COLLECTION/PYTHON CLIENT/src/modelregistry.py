@@ -0,0 +1,256 @@
+'''
+Versioned registry of the selected models. Each version is named by its training time and a fingerprint of its training data,
+the current version can be rolled back, and models are loaded through memory mapping with the most recent ones kept in memory.
+A version chosen by hand (rollback or activate from the command line) is pinned, and stays current until a new version is registered or it is unpinned.
+'''
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+import joblib
+
+
+def fingerprintData(rowHashes):
+    '''
+    This function is responsible for fingerprinting the training data from its row hashes.
+    params:
+        rowHashes: uint64 array with one hash per row (see modelcache.hashRows)
+    returns:
+        fingerprint: hex digest
+    '''
+    return hashlib.sha256(rowHashes.tobytes()).hexdigest()
+
+
+class ModelRegistry():
+
+    def __init__(self, directory="modelRegistry", maxLoaded=4, maxVersions=20):
+        self.directory = directory
+        self.maxLoaded = maxLoaded  # Number of loaded models kept in memory
+        self.maxVersions = maxVersions  # Number of versions kept on disk, the oldest ones are deleted first
+
+        # Loaded models by version, least recently used first
+        self.loadedModels = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.indexFile = os.path.join(directory, "registry.json")
+        self.versions, self.currentVersion, self.pinned = self.loadIndex()
+
+    def loadIndex(self):
+        '''
+        This method is responsible for reading the list of versions and the current version.
+        returns:
+            versions: list of version descriptions, oldest first
+            currentVersion: name of the current version, or None
+            pinned: True if the current version was chosen by hand
+        '''
+
+        if not os.path.exists(self.indexFile):
+            return [], None, False
+
+        with open(self.indexFile, mode="r") as file:
+            index = json.load(file)
+
+        return index["versions"], index["current"], index.get("pinned", False)
+
+    def refresh(self):
+        '''This method is responsible for reading the index again, it may have been changed by another process such as the command line'''
+
+        self.versions, self.currentVersion, self.pinned = self.loadIndex()
+
+    def saveIndex(self):
+        '''This method is responsible for writing the list of versions, replacing the old file in one step'''
+
+        tempFile = self.indexFile + ".tmp"
+
+        with open(tempFile, mode="w") as file:
+            json.dump({"versions": self.versions, "current": self.currentVersion, "pinned": self.pinned}, file, indent=1)
+
+        os.replace(tempFile, self.indexFile)
+
+    def newVersion(self, dataFingerprint):
+        '''
+        This method is responsible for naming a new version.
+        params:
+            dataFingerprint: fingerprint of the training data
+        returns:
+            version: training time followed by the start of the data fingerprint
+        '''
+        return datetime.now().strftime("%Y%m%d-%H%M%S-%f") + "-" + dataFingerprint[:12]
+
+    def getVersionPath(self, version, suffix="sav"):
+        '''
+        This method is responsible for returning the path of a file (or directory) belonging to a version.
+        params:
+            version: name of the version
+            suffix: extension of the file
+        returns:
+            path: path inside the registry directory
+        '''
+        return os.path.join(self.directory, version + "." + suffix)
+
+    def register(self, model, version, **metadata):
+        '''
+        This method is responsible for saving a model as a new version and making it the current one, which clears the pin.
+        The model is saved uncompressed so its arrays can be memory mapped when it is loaded.
+        params:
+            model: trained model
+            version: name from newVersion
+            metadata: other values stored with the version, such as the model name and MSE
+        '''
+
+        path = self.getVersionPath(version)
+
+        joblib.dump(model, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+        # Every change starts from the index on disk, so changes made by another process aren't overwritten
+        self.refresh()
+
+        self.versions.append(dict(metadata, version=version))
+        self.currentVersion = version
+        self.pinned = False
+        self.remember(version, model)
+
+        self.pruneVersions()
+        self.saveIndex()
+
+    def hasVersion(self, version):
+        return any(entry["version"] == version for entry in self.versions)
+
+    def activate(self, version, pin=False):
+        '''
+        This method is responsible for making an existing version the current one.
+        params:
+            version: name of the version
+            pin: True when the version is chosen by hand, it then stays current until a new version is registered or it is unpinned
+        '''
+
+        self.refresh()
+
+        if not self.hasVersion(version):
+            raise ValueError("Unknown model version: " + str(version))
+
+        self.currentVersion = version
+        self.pinned = pin
+        self.saveIndex()
+
+    def unpin(self):
+        '''This method is responsible for letting the cached and newly trained versions replace the current version again'''
+
+        self.refresh()
+        self.pinned = False
+        self.saveIndex()
+
+    def isPinned(self):
+        '''
+        This method is responsible for checking whether the current version was chosen by hand, reading the index again first.
+        returns:
+            pinned: True if the current version is pinned
+        '''
+
+        self.refresh()
+
+        return self.pinned
+
+    def rollback(self):
+        '''
+        This method is responsible for making the version registered before the current one current again, and pinning it.
+        returns:
+            version: name of the new current version, or None if there is no older version
+        '''
+
+        self.refresh()
+
+        names = [entry["version"] for entry in self.versions]
+
+        if self.currentVersion not in names or names.index(self.currentVersion) == 0:
+            return None
+
+        self.activate(names[names.index(self.currentVersion) - 1], pin=True)
+
+        return self.currentVersion
+
+    def load(self, version=None):
+        '''
+        This method is responsible for loading a version, from memory if it was used recently, otherwise by memory mapping its file.
+        params:
+            version: name of the version, the current version when None
+        returns:
+            model: trained model, or None if the version doesn't exist
+        '''
+
+        version = version or self.currentVersion
+
+        if version is None or not self.hasVersion(version):
+            return None
+
+        if version in self.loadedModels:
+            self.loadedModels.move_to_end(version)
+            return self.loadedModels[version]
+
+        model = joblib.load(self.getVersionPath(version), mmap_mode="r")
+        self.remember(version, model)
+
+        return model
+
+    def remember(self, version, model):
+        '''
+        This method is responsible for keeping a loaded model in memory, dropping the least recently used one when there are too many.
+        params:
+            version: name of the version
+            model: trained model
+        '''
+
+        self.loadedModels[version] = model
+        self.loadedModels.move_to_end(version)
+
+        while len(self.loadedModels) > self.maxLoaded:
+            self.loadedModels.popitem(last=False)
+
+    def pruneVersions(self):
+        '''This method is responsible for deleting the oldest versions beyond maxVersions, the current version is always kept'''
+
+        while len(self.versions) > self.maxVersions:
+            oldest = next(entry for entry in self.versions if entry["version"] != self.currentVersion)
+            self.versions.remove(oldest)
+            self.loadedModels.pop(oldest["version"], None)
+
+            # Every file of the version shares its name, such as a nearest neighbour index directory
+            for name in os.listdir(self.directory):
+                if name.startswith(oldest["version"] + "."):
+                    path = os.path.join(self.directory, name)
+                    shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+
+if __name__ == '__main__':
+
+    # Usage: python modelregistry.py list [modelRegistry]
+    #        python modelregistry.py rollback [modelRegistry]
+    #        python modelregistry.py activate version [modelRegistry]
+    #        python modelregistry.py unpin [modelRegistry]
+    # A version rolled back to or activated here is pinned, so the collector keeps using it until a new version is trained or it is unpinned
+    command = sys.argv[1]
+
+    if command == "activate":
+        registry = ModelRegistry(sys.argv[3] if len(sys.argv) > 3 else "modelRegistry")
+        registry.activate(sys.argv[2], pin=True)
+    else:
+        registry = ModelRegistry(sys.argv[2] if len(sys.argv) > 2 else "modelRegistry")
+
+        if command == "rollback":
+            print("Current version:", registry.rollback())
+        elif command == "unpin":
+            registry.unpin()
+        elif command != "list":
+            print("Unknown command:", command)
+
+    for entry in registry.versions:
+        print("*" if entry["version"] == registry.currentVersion else " ", entry)
+
+    if registry.pinned:
+        print("The current version is pinned")
@@ -0,0 +1,160 @@
+'''
+Model selection that trains and scores the candidate models concurrently across a process pool.
+The training and testing data is published once in shared memory, the workers read it in place.
+'''
+
+import math
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import clone
+from sklearn.metrics import mean_squared_error
+from sharedframes import SharedFrames, attachFrames
+
+
+def evaluateCandidate(model, X_train, y_train, X_test, y_test, numOfThreads):
+    '''
+    This function is responsible for fitting and scoring a single candidate model inside a worker process.
+    params:
+        model: untrained candidate model
+        X_train, y_train: training features and targets
+        X_test, y_test: testing features and targets
+        numOfThreads: number of cores the candidate may use on its own (nested parallelism)
+    returns:
+        model: trained model
+        mse: mean squared error on the testing set
+        fitTime: seconds spent fitting
+        scoreTime: seconds spent predicting and scoring
+    '''
+
+    # Models that can use several cores (random forest, k-nearest neighbours) get their share of the core budget
+    if "n_jobs" in model.get_params():
+        model.set_params(n_jobs=numOfThreads)
+
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fitTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    mse = mean_squared_error(y_test, y_pred)
+    scoreTime = time.perf_counter() - start
+
+    return model, mse, fitTime, scoreTime
+
+
+def evaluateSharedCandidate(model, handle, numOfThreads, numOfSamples=None):
+    '''
+    This function is responsible for fitting and scoring a candidate on the data frames published in shared memory.
+    params:
+        model: untrained candidate model
+        handle: description of the shared X_train, y_train, X_test and y_test frames
+        numOfThreads: number of cores the candidate may use on its own
+        numOfSamples: number of most recent training rows to fit on, all rows when None
+    returns:
+        model, mse, fitTime, scoreTime: see evaluateCandidate
+    '''
+
+    frames = attachFrames(handle)
+    X_train, y_train = frames["X_train"], frames["y_train"]
+
+    # The most recent rows are last, so the slice is a view of the shared block
+    if numOfSamples is not None:
+        X_train, y_train = X_train.iloc[-numOfSamples:], y_train.iloc[-numOfSamples:]
+
+    return evaluateCandidate(model, X_train, y_train, frames["X_test"], frames["y_test"], numOfThreads)
+
+
+def selectBestModel(models, X_train, y_train, X_test, y_test, coreBudget=None):
+    '''
+    This function is responsible for training and scoring every candidate concurrently and returning the one with the smallest MSE.
+    The core budget is split between one process per candidate and the threads each candidate may use internally.
+    params:
+        models: list of untrained candidate models
+        X_train, y_train: training features and targets
+        X_test, y_test: testing features and targets
+        coreBudget: maximum number of cores to use, all cores when None
+    returns:
+        bestModel: trained model with the smallest MSE
+        results: list of (model, mse, fitTime, scoreTime) tuples in the candidate order
+    '''
+
+    coreBudget = coreBudget or os.cpu_count()
+
+    numOfWorkers = max(min(len(models), coreBudget), 1)
+    numOfThreads = max(coreBudget // numOfWorkers, 1)
+
+    # Workers attach to one shared copy of the data instead of each receiving their own
+    with SharedFrames({"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test}) as shared, \
+         ProcessPoolExecutor(max_workers=numOfWorkers) as executor:
+        futures = [executor.submit(evaluateSharedCandidate, model, shared.getHandle(), numOfThreads) for model in models]
+        results = [future.result() for future in futures]
+
+    for model, mse, fitTime, scoreTime in results:
+        print("%s MSE: %.4f (fit %.3fs, score %.3fs)" % (type(model).__name__, mse, fitTime, scoreTime))
+
+    # Find the model with the smallest MSE
+    bestModel = min(results, key=lambda result: result[1])[0]
+
+    return bestModel, results
+
+
+def selectBestModelHalving(models, X_train, y_train, X_test, y_test, timeBudget=None, minSamples=365, reductionFactor=2, coreBudget=None):
+    '''
+    This function is responsible for picking the best model with successive halving, so the selection time stays bounded on any history size.
+    Every candidate is first trained on the most recent minSamples training rows, then only the best 1/reductionFactor of them are
+    trained again on reductionFactor times as many rows. The last candidate keeps being retrained on larger slices until every training row is used.
+    A new round is only started if it is expected to finish within the time budget.
+    params:
+        models: list of untrained candidate models
+        X_train, y_train: training features and targets, the data frame index gives the age of the rows (larger is more recent)
+        X_test, y_test: testing features and targets
+        timeBudget: wall-clock seconds the selection may take, unlimited when None
+        minSamples: number of training rows used in the first round
+        reductionFactor: share of candidates dropped, and growth of the training slice, between rounds
+        coreBudget: maximum number of cores to use, all cores when None
+    returns:
+        bestModel: trained model with the smallest MSE in the last completed round
+        results: list of (model, mse, fitTime, scoreTime) tuples of the last completed round, best first
+    '''
+
+    coreBudget = coreBudget or os.cpu_count()
+    start = time.perf_counter()
+
+    # Most recent rows last, so each round's slice is the tail of the training set
+    order = np.argsort(X_train.index.to_numpy(), kind="stable")
+    X_train = X_train.iloc[order]
+    y_train = y_train.iloc[order]
+
+    candidates = list(models)
+    numOfSamples = min(minSamples, len(X_train))
+    results = []
+
+    with SharedFrames({"X_train": X_train, "y_train": y_train, "X_test": X_test, "y_test": y_test}) as shared, \
+         ProcessPoolExecutor(max_workers=max(min(len(models), coreBudget), 1)) as executor:
+
+        while True:
+            roundStart = time.perf_counter()
+
+            numOfThreads = max(coreBudget // len(candidates), 1)
+            futures = [executor.submit(evaluateSharedCandidate, model, shared.getHandle(), numOfThreads, numOfSamples) for model in candidates]
+            results = sorted((future.result() for future in futures), key=lambda result: result[1])
+
+            for model, mse, fitTime, scoreTime in results:
+                print("%s MSE: %.4f on %d rows (fit %.3fs, score %.3fs)" % (type(model).__name__, mse, numOfSamples, fitTime, scoreTime))
+
+            if numOfSamples == len(X_train):
+                break
+
+            # Fitting time grows at least linearly with the rows, so the next round is assumed to take reductionFactor times as long
+            elapsed = time.perf_counter() - start
+            if timeBudget is not None and elapsed + (time.perf_counter() - roundStart) * reductionFactor > timeBudget:
+                print("Time budget reached after %.3fs" % elapsed)
+                break
+
+            # The leaders go on to the next round untrained, with a larger slice of the training rows
+            candidates = [clone(model) for model, mse, fitTime, scoreTime in results[:math.ceil(len(results) / reductionFactor)]]
+            numOfSamples = min(numOfSamples * reductionFactor, len(X_train))
+
+    return results[0][0], results
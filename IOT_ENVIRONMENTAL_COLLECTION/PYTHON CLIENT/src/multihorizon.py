@@ -0,0 +1,61 @@
+'''
+Multi-horizon forecasting: days 1 to N are forecast together, each day's model input being the rolling average of the rows before it,
+with the forecast days standing in for the rows that haven't been measured yet.
+'''
+
+import numpy as np
+import pandas as pd
+from weatherschema import FEATURES
+
+
+def getHorizonInputs(recentValues, predictions):
+    '''
+    This function is responsible for computing the model input of every forecast day in one pass.
+    The input of day h is the average of the windowSize rows before it, which are measured rows followed by the forecasts of days 1 to h-1.
+    params:
+        recentValues: two-dimensional array of the last windowSize measured rows, oldest first
+        predictions: two-dimensional array of the current forecast of each day
+    returns:
+        inputs: two-dimensional array with one row of rolling averages per forecast day
+    '''
+
+    windowSize = len(recentValues)
+    numOfDays = len(predictions)
+
+    rows = np.vstack([recentValues, predictions[:-1]])
+    cumulative = np.vstack([np.zeros((1, rows.shape[1])), np.cumsum(rows, axis=0)])
+
+    return (cumulative[windowSize:windowSize + numOfDays] - cumulative[:numOfDays]) / windowSize
+
+
+def forecastHorizons(model, recentValues, numOfDays, tolerance=1e-6):
+    '''
+    This function is responsible for forecasting the next numOfDays days with a model that predicts a day from the rolling average before it.
+    Instead of one predict call per day, all days are predicted together and their inputs refreshed from the new forecasts until they
+    stop changing. Every pass makes at least one more day exact, so after numOfDays passes the result equals the day by day recursion,
+    and as each forecast only moves a rolling average by 1/windowSize, far fewer passes are normally needed.
+    params:
+        model: trained model with a predict method
+        recentValues: two-dimensional array of the last windowSize measured rows, oldest first
+        numOfDays: number of days to forecast
+        tolerance: largest change of any forecast value between passes at which the forecasts are final
+    returns:
+        predictions: two-dimensional array with one row of FEATURES values per forecast day
+    '''
+
+    recentValues = np.asarray(recentValues, dtype=np.float64)
+
+    # Start from every day looking like the recent average
+    predictions = np.tile(recentValues.mean(axis=0), (numOfDays, 1))
+
+    for iteration in range(numOfDays):
+        inputs = pd.DataFrame(getHorizonInputs(recentValues, predictions), columns=FEATURES)
+
+        updated = np.asarray(model.predict(inputs), dtype=np.float64)
+        change = np.abs(updated - predictions).max()
+        predictions = updated
+
+        if change <= tolerance:
+            break
+
+    return predictions
@@ -0,0 +1,234 @@
+'''
+Online learners that are updated one daily record at a time, so ingesting a day takes constant time whatever the size of the history.
+'''
+
+import joblib
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.preprocessing import StandardScaler
+from weatherschema import FEATURES
+from rollingfeatures import RollingFeatureEngine
+from knnindex import KDTreeKNNRegressor
+
+
+class RecursiveLeastSquares():
+
+    def __init__(self, numOfFeatures=len(FEATURES), numOfTargets=len(FEATURES), forgettingFactor=1.0, initialCovariance=1000.0):
+        self.forgettingFactor = forgettingFactor  # Values below 1 give recent days more weight than old ones
+
+        # Weights include an intercept row, the covariance starts large so the first samples move the weights quickly
+        self.weights = np.zeros((numOfFeatures + 1, numOfTargets))
+        self.covariance = np.eye(numOfFeatures + 1) * initialCovariance
+        self.isTrained = False
+
+    def partial_fit(self, x, y):
+        '''
+        This method is responsible for updating the linear model with a single sample in O(features^2).
+        params:
+            x: array of feature values
+            y: array of target values
+        '''
+
+        x = np.append(np.asarray(x, dtype=np.float64), 1.0)
+
+        covarianceX = self.covariance @ x
+        gain = covarianceX / (self.forgettingFactor + x @ covarianceX)
+
+        self.weights += np.outer(gain, np.asarray(y, dtype=np.float64) - x @ self.weights)
+        self.covariance = (self.covariance - np.outer(gain, covarianceX)) / self.forgettingFactor
+        self.isTrained = True
+
+        return self
+
+    def partial_fit_batch(self, X, Y):
+        '''
+        This method is responsible for updating the linear model with a block of samples at once, giving the same result as
+        calling partial_fit on each row when no forgetting factor is used.
+        params:
+            X: two-dimensional array of feature values
+            Y: two-dimensional array of target values
+        '''
+
+        X = np.hstack([np.asarray(X, dtype=np.float64), np.ones((len(X), 1))])
+
+        self.covariance = np.linalg.inv(np.linalg.inv(self.covariance) + X.T @ X)
+        self.weights += self.covariance @ X.T @ (np.asarray(Y, dtype=np.float64) - X @ self.weights)
+        self.isTrained = True
+
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return np.hstack([X, np.ones((len(X), 1))]) @ self.weights
+
+    def __repr__(self):
+        return "RecursiveLeastSquares(forgettingFactor=%s)" % self.forgettingFactor
+
+
+class OnlineSGDRegressor():
+
+    def __init__(self):
+        # Features and targets are standardised with running statistics, pressures around 1000 would otherwise swamp the gradient
+        self.featureScaler = StandardScaler()
+        self.targetScaler = StandardScaler()
+        self.model = MultiOutputRegressor(SGDRegressor(learning_rate="invscaling", eta0=0.01))
+        self.isTrained = False
+
+    def partial_fit(self, x, y):
+        '''
+        This method is responsible for taking a single stochastic gradient step on a sample.
+        params:
+            x: array of feature values
+            y: array of target values
+        '''
+
+        x = np.asarray(x, dtype=np.float64).reshape(1, -1)
+        y = np.asarray(y, dtype=np.float64).reshape(1, -1)
+
+        self.featureScaler.partial_fit(x)
+        self.targetScaler.partial_fit(y)
+
+        self.model.partial_fit(self.featureScaler.transform(x), self.targetScaler.transform(y))
+        self.isTrained = True
+
+        return self
+
+    def partial_fit_batch(self, X, Y, batchSize=256):
+        '''
+        This method is responsible for taking stochastic gradient steps over a block of samples in mini-batches.
+        params:
+            X: two-dimensional array of feature values
+            Y: two-dimensional array of target values
+            batchSize: number of samples per gradient step
+        '''
+
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+
+        self.featureScaler.partial_fit(X)
+        self.targetScaler.partial_fit(Y)
+
+        for start in range(0, len(X), batchSize):
+            self.model.partial_fit(self.featureScaler.transform(X[start:start + batchSize]), self.targetScaler.transform(Y[start:start + batchSize]))
+
+        self.isTrained = True
+
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return self.targetScaler.inverse_transform(self.model.predict(self.featureScaler.transform(X)))
+
+    def __repr__(self):
+        return "OnlineSGDRegressor()"
+
+
+class OnlineForecaster():
+
+    def __init__(self, windowSize=30, errorDecay=0.05, indexDirectory=None):
+        self.windowSize = windowSize
+        self.errorDecay = errorDecay  # Weight of the newest error in each candidate's running error
+
+        # Running sums of the last windowSize daily rows, used to produce the rolling average for each new day
+        self.rollingFeatures = RollingFeatureEngine((windowSize,))
+
+        # The nearest neighbour index takes each new day as an insert, and is saved to its own files when indexDirectory is set
+        self.candidates = {"RecursiveLeastSquares": RecursiveLeastSquares(), "OnlineSGDRegressor": OnlineSGDRegressor(),
+                           "KDTreeKNNRegressor": KDTreeKNNRegressor(indexDirectory=indexDirectory)}
+
+        # Running mean squared error of each candidate, measured on each day before learning from it
+        self.errors = {name: None for name in self.candidates}
+
+    def update(self, day, rowValues):
+        '''
+        This method is responsible for learning from a new daily record in constant time.
+        The record extends the 30 day rolling average, and the new average row is used as a training sample the same way
+        predictWeatherParams builds its training set.
+        params:
+            day: day number of the record
+            rowValues: array of feature values
+        returns:
+            updated: False if the day was already learnt from (a resent record)
+        '''
+
+        # Learning can't be undone, so resent or late records are skipped
+        if self.rollingFeatures.lastDay is not None and day <= self.rollingFeatures.lastDay:
+            return False
+
+        averageRow = self.rollingFeatures.append(day, rowValues)
+
+        # Only the running sums are needed, not the past rolling average rows
+        self.rollingFeatures.dropOldest(self.rollingFeatures.size)
+
+        if np.isnan(averageRow).any():
+            return True
+
+        for name, candidate in self.candidates.items():
+
+            # Score the candidate on the new sample before it learns from it
+            if candidate.isTrained:
+                error = float(np.mean((candidate.predict(averageRow.reshape(1, -1))[0] - averageRow) ** 2))
+                previousError = self.errors[name]
+                self.errors[name] = error if previousError is None else (1 - self.errorDecay) * previousError + self.errorDecay * error
+
+            candidate.partial_fit(averageRow, averageRow)
+
+        return True
+
+    def fit(self, days, values, holdout=0.2):
+        '''
+        This method is responsible for bootstrapping the learners from the stored history in vectorized blocks.
+        Each candidate learns the older rows first and is scored on the newest ones before learning them too, which seeds its running error.
+        params:
+            days: sorted array of day numbers
+            values: two-dimensional array with one column per feature
+            holdout: share of the newest rolling average rows used to seed the running errors
+        '''
+
+        # Every 30 day rolling average of the history, the running sums then carry on from the newest rows
+        self.rollingFeatures.build(days, values)
+        averageRows = self.rollingFeatures.getFeatures().copy()
+        self.rollingFeatures.dropOldest(self.rollingFeatures.size)
+
+        if len(averageRows) == 0:
+            return self
+
+        split = max(int(len(averageRows) * (1 - holdout)), 1)
+
+        for name, candidate in self.candidates.items():
+
+            candidate.partial_fit_batch(averageRows[:split], averageRows[:split])
+
+            if split < len(averageRows):
+                self.errors[name] = float(np.mean((candidate.predict(averageRows[split:]) - averageRows[split:]) ** 2))
+                candidate.partial_fit_batch(averageRows[split:], averageRows[split:])
+
+        return self
+
+    def getBestModel(self):
+        '''
+        This method is responsible for returning the candidate with the smallest running error.
+        returns:
+            model: online model with a predict method, or None if no candidate has been trained yet
+        '''
+
+        scored = [(error, name) for name, error in self.errors.items() if error is not None]
+
+        if not scored:
+            return None
+
+        return self.candidates[min(scored)[1]]
+
+    def save(self, path):
+
+        # Only the index levels changed since the last save are written, the state file then just refers to them
+        neighbours = self.candidates["KDTreeKNNRegressor"]
+        if neighbours.indexDirectory is not None and neighbours.isTrained:
+            neighbours.save()
+
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
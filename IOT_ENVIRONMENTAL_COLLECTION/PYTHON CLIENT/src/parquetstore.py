@@ -0,0 +1,143 @@
+'''
+Parquet export and import of the weather history, partitioned by station and month so readers can skip the files they don't need.
+'''
+
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from weatherschema import FEATURES, MISSING_DAY
+from typedloader import readTypedSegment, parseDays, loadTypedHistory
+from segmentstore import SegmentedStore
+
+# Schema of the exported files, Station and Month are also the partition keys
+PARQUET_SCHEMA = pa.schema([("Station", pa.int32()), ("Month", pa.string()), ("Day", pa.int32())] + [(feature, pa.float32()) for feature in FEATURES])
+
+PARTITIONING = ds.partitioning(pa.schema([("Station", pa.int32()), ("Month", pa.string())]), flavor="hive")
+
+
+def exportParquet(store, directory):
+    '''
+    This function is responsible for writing the history held by a segmented store as Parquet files partitioned by station and month.
+    Column statistics are written with every file so date-range filters can skip whole row groups.
+    params:
+        store: segmented store to export
+        directory: directory the Parquet dataset is written to
+    '''
+
+    for path in store.getSegmentPaths():
+
+        data = readTypedSegment(path)
+        days = parseDays(data["Date"])
+
+        # Rows without a valid date can't be placed in a partition
+        valid = days != MISSING_DAY
+
+        table = pa.table({
+            "Station": np.full(valid.sum(), store.stationId, dtype=np.int32),
+            "Month": pd.to_datetime(days[valid], unit="D").strftime("%Y-%m"),
+            "Day": days[valid],
+            **{feature: data[feature].to_numpy(dtype=np.float32)[valid] for feature in FEATURES}
+        }, schema=PARQUET_SCHEMA)
+
+        ds.write_dataset(table, directory, format="parquet", partitioning=PARTITIONING, existing_data_behavior="overwrite_or_ignore",
+                         basename_template="part-{i}.parquet", file_options=ds.ParquetFileFormat().make_write_options(write_statistics=True))
+
+
+def readParquet(directory, stationId=None, startDay=None, endDay=None, columns=None):
+    '''
+    This function is responsible for reading the Parquet history, pushing the station, date-range and column filters down to the files.
+    params:
+        directory: directory of the Parquet dataset
+        stationId: only read this station, all stations when None
+        startDay: first day to read (inclusive), unbounded when None
+        endDay: last day to read (inclusive), unbounded when None
+        columns: list of columns to read, all columns when None
+    returns:
+        table: pyarrow table of the matching rows
+    '''
+
+    dataset = ds.dataset(directory, format="parquet", partitioning=PARTITIONING, schema=PARQUET_SCHEMA)
+
+    condition = None
+    for expression in [
+        ds.field("Station") == stationId if stationId is not None else None,
+        ds.field("Day") >= startDay if startDay is not None else None,
+        ds.field("Day") <= endDay if endDay is not None else None
+    ]:
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def loadParquetHistory(directory, stationId, store=None):
+    '''
+    This function is responsible for loading one station's history from Parquet in the same form as the typed CSV loader.
+    Rows with a missing measurement are left out.
+    params:
+        directory: directory of the Parquet dataset
+        stationId: station to load
+        store: optional segmented store holding the records received since the export, its rows replace exported rows of the same day
+    returns:
+        days: sorted int32 array of day numbers
+        values: float32 array with one column per feature, in the same order as days
+    '''
+
+    table = readParquet(directory, stationId=stationId, columns=["Day"] + FEATURES)
+
+    days = table.column("Day").to_numpy().astype(np.int32)
+    values = np.empty((len(days), len(FEATURES)), dtype=np.float32)
+    for index, feature in enumerate(FEATURES):
+        values[:, index] = table.column(feature).to_numpy()
+
+    valid = ~np.isnan(values).any(axis=1)
+    days, values = days[valid], values[valid]
+
+    if store is not None:
+        newDays, newValues = loadTypedHistory(store.getSegmentPaths())
+
+        days = np.concatenate([days, newDays])
+        values = np.concatenate([values, newValues])
+
+    # Stable sort so rows sharing a date keep the order they were stored in
+    order = np.argsort(days, kind="stable")
+
+    if store is not None:
+        # Only the last row of each day is kept, so a record received since the export wins over the exported one
+        sortedDays = days[order]
+        order = order[np.append(sortedDays[1:] != sortedDays[:-1], True)] if len(days) else order
+
+    return days[order], values[order]
+
+
+def importParquet(directory, store):
+    '''
+    This function is responsible for adding a station's Parquet history to a segmented store in the weatherData.csv row format.
+    Days the store already holds are replaced by the exported rows (see SegmentedStore.appendArrays), so importing an export back
+    into its source store leaves the history unchanged.
+    params:
+        directory: directory of the Parquet dataset
+        store: segmented store to import into, its stationId selects the rows to import
+    '''
+
+    data = readParquet(directory, stationId=store.stationId, columns=["Day"] + FEATURES).to_pandas()
+    data = data.sort_values("Day", kind="stable")
+
+    store.appendArrays(data["Day"].to_numpy(), data[FEATURES].to_numpy())
+
+
+if __name__ == '__main__':
+
+    # Usage: python parquetstore.py export weatherData weatherParquet [stationId]
+    #        python parquetstore.py import weatherParquet weatherData [stationId]
+    command, source, destination = sys.argv[1:4]
+    stationId = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    if command == "export":
+        exportParquet(SegmentedStore(source, stationId=stationId), destination)
+    elif command == "import":
+        importParquet(source, SegmentedStore(destination, stationId=stationId))
+    else:
+        print("Unknown command:", command)
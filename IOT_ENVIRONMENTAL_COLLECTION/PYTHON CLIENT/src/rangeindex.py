@@ -0,0 +1,212 @@
+'''
+Incrementally maintained aggregation index answering min, max, mean, sum and count queries over any date range of the weather history.
+'''
+
+import numpy as np
+from weatherschema import FEATURES
+
+STATISTICS = ["min", "max", "mean", "sum", "count"]
+
+
+class RangeAggregateIndex():
+
+    def __init__(self, numOfColumns=len(FEATURES), capacity=1024):
+        self.numOfColumns = numOfColumns
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        '''
+        This method is responsible for allocating empty index arrays that can hold the given number of rows.
+        params:
+            capacity: number of rows, rounded up to a power of two for the segment trees
+        '''
+
+        self.capacity = 1 << max(int(capacity) - 1, 1).bit_length()
+
+        # Position of the first row still in the dataset, and number of rows appended so far
+        self.start = 0
+        self.size = 0
+
+        self.days = np.zeros(self.capacity, dtype=np.int32)
+
+        # prefixSums[i] holds the sum of the first i rows, so a range sum is a single subtraction
+        self.prefixSums = np.zeros((self.capacity + 1, self.numOfColumns), dtype=np.float64)
+
+        # Segment trees with the leaves stored from position capacity onwards, node i covers nodes 2i and 2i+1
+        self.minTree = np.full((2 * self.capacity, self.numOfColumns), np.inf, dtype=np.float64)
+        self.maxTree = np.full((2 * self.capacity, self.numOfColumns), -np.inf, dtype=np.float64)
+
+    def build(self, days, values):
+        '''
+        This method is responsible for building the index from scratch in linear time.
+        params:
+            days: sorted array of day numbers
+            values: two-dimensional array with one column per feature, in the same order as days
+        '''
+
+        numOfRows = len(days)
+
+        self.allocate(max(2 * numOfRows, 1024))
+
+        self.size = numOfRows
+        self.days[:numOfRows] = days
+        self.prefixSums[1:numOfRows + 1] = np.cumsum(values, axis=0, dtype=np.float64)
+
+        self.minTree[self.capacity:self.capacity + numOfRows] = values
+        self.maxTree[self.capacity:self.capacity + numOfRows] = values
+
+        # Fill the inner nodes one level at a time, from the leaves up
+        level = self.capacity
+        while level > 1:
+            half = level // 2
+            self.minTree[half:level] = np.minimum(self.minTree[level:2 * level:2], self.minTree[level + 1:2 * level:2])
+            self.maxTree[half:level] = np.maximum(self.maxTree[level:2 * level:2], self.maxTree[level + 1:2 * level:2])
+            level = half
+
+    def append(self, day, rowValues):
+        '''
+        This method is responsible for adding a row after the newest one in O(log n), growing the arrays when they are full.
+        params:
+            day: day number of the row, not earlier than the newest day in the index
+            rowValues: array of feature values
+        '''
+
+        # Out of space, rebuild the rows still in the dataset into arrays twice their size
+        if self.size == self.capacity:
+            self.build(self.days[self.start:self.size].copy(), self.getValues())
+
+        position = self.size
+
+        self.days[position] = day
+        self.prefixSums[position + 1] = self.prefixSums[position] + rowValues
+        self.size += 1
+
+        self.updateLeaf(position, rowValues)
+
+    def replace(self, offset, rowValues):
+        '''
+        This method is responsible for replacing the values of a row in the index.
+        params:
+            offset: position of the row counted from the oldest row still in the dataset
+            rowValues: array of feature values
+        '''
+
+        position = self.start + offset
+
+        # Every prefix sum after the row moves by the same amount, resent rows are recent so this touches few rows
+        delta = rowValues - (self.prefixSums[position + 1] - self.prefixSums[position])
+        self.prefixSums[position + 1:self.size + 1] += delta
+
+        self.updateLeaf(position, rowValues)
+
+    def updateLeaf(self, position, rowValues):
+        '''
+        This method is responsible for setting a leaf of the segment trees and updating its ancestors.
+        params:
+            position: position of the row
+            rowValues: array of feature values
+        '''
+
+        node = self.capacity + position
+        self.minTree[node] = rowValues
+        self.maxTree[node] = rowValues
+
+        node //= 2
+        while node >= 1:
+            self.minTree[node] = np.minimum(self.minTree[2 * node], self.minTree[2 * node + 1])
+            self.maxTree[node] = np.maximum(self.maxTree[2 * node], self.maxTree[2 * node + 1])
+            node //= 2
+
+    def dropOldest(self, count=1):
+        '''
+        This method is responsible for removing the oldest rows from the index once they have left the dataset.
+        params:
+            count: number of rows to remove
+        '''
+        self.start = min(self.start + count, self.size)
+
+    def getValues(self):
+        '''
+        This method is responsible for returning the values of the rows still in the dataset from the segment tree leaves.
+        returns:
+            values: two-dimensional array with one column per feature
+        '''
+        return self.minTree[self.capacity + self.start:self.capacity + self.size].copy()
+
+    def findRange(self, startDay, endDay):
+        '''
+        This method is responsible for finding the positions of the rows within a date range using binary search.
+        params:
+            startDay: first day of the range
+            endDay: last day of the range (inclusive)
+        returns:
+            low: position of the first row in the range
+            high: position after the last row in the range
+        '''
+
+        days = self.days[self.start:self.size]
+
+        low = self.start + int(np.searchsorted(days, startDay, side="left"))
+        high = self.start + int(np.searchsorted(days, endDay, side="right"))
+
+        return low, high
+
+    def queryTree(self, tree, reduce, low, high):
+        '''
+        This method is responsible for reducing the leaves in [low, high) of a segment tree in O(log n).
+        params:
+            tree: segment tree to query
+            reduce: np.minimum or np.maximum
+            low: position of the first row
+            high: position after the last row
+        returns:
+            result: reduced value of every column
+        '''
+
+        result = tree[0].copy()
+        low += self.capacity
+        high += self.capacity
+
+        while low < high:
+            if low & 1:
+                result = reduce(result, tree[low])
+                low += 1
+            if high & 1:
+                high -= 1
+                result = reduce(result, tree[high])
+            low //= 2
+            high //= 2
+
+        return result
+
+    def aggregate(self, startDay, endDay, statistic):
+        '''
+        This method is responsible for computing a statistic of every column over a date range.
+        Means, sums and counts take constant time after the binary search, minimums and maximums take logarithmic time.
+        params:
+            startDay: first day of the range
+            endDay: last day of the range (inclusive)
+            statistic: one of STATISTICS
+        returns:
+            result: array with one value per column, NaN when the range holds no rows
+        '''
+
+        low, high = self.findRange(startDay, endDay)
+        count = high - low
+
+        if statistic == "count":
+            return np.full(self.numOfColumns, count, dtype=np.float64)
+
+        if count == 0:
+            return np.full(self.numOfColumns, np.nan)
+
+        if statistic == "sum":
+            return self.prefixSums[high] - self.prefixSums[low]
+        elif statistic == "mean":
+            return (self.prefixSums[high] - self.prefixSums[low]) / count
+        elif statistic == "min":
+            return self.queryTree(self.minTree, np.minimum, low, high)
+        elif statistic == "max":
+            return self.queryTree(self.maxTree, np.maximum, low, high)
+
+        raise ValueError("Unknown statistic: " + str(statistic))
@@ -0,0 +1,223 @@
+'''
+Incremental rolling-window features: running sums give the rolling means (and lagged copies of the rows) of every feature,
+so appending a daily row updates them in constant time instead of recomputing data.rolling() over the whole history.
+'''
+
+import joblib
+import numpy as np
+import pandas as pd
+from weatherschema import FEATURES
+
+
+class RollingFeatureEngine():
+
+    def __init__(self, windowSizes=(30,), lags=(), capacity=1024):
+        self.windowSizes = tuple(windowSizes)
+        self.lags = tuple(lags)  # Numbers of days back, each lag must be at least 1
+
+        # Number of most recent rows a feature row is computed from
+        self.span = max(self.windowSizes + tuple(lag + 1 for lag in self.lags))
+        self.numOfFeatures = (len(self.windowSizes) + len(self.lags)) * len(FEATURES)
+
+        self.reset(capacity)
+
+    def reset(self, capacity):
+        '''
+        This method is responsible for clearing the running state and allocating an empty array of feature rows.
+        params:
+            capacity: number of feature rows the array can hold before it has to grow
+        '''
+
+        # Last span rows in a circular buffer, row i is stored at position i % span
+        self.recent = np.zeros((self.span, len(FEATURES)), dtype=np.float64)
+
+        # Running sum of the rows in each window
+        self.sums = np.zeros((len(self.windowSizes), len(FEATURES)), dtype=np.float64)
+
+        # Number of rows seen so far and day number of the newest one
+        self.numOfRows = 0
+        self.lastDay = None
+
+        # One feature row per data row, the rows from start to size are the ones still in the dataset
+        self.features = np.full((capacity, self.numOfFeatures), np.nan, dtype=np.float64)
+        self.start = 0
+        self.size = 0
+
+    def getFeatureNames(self):
+        '''
+        This method is responsible for naming the feature columns.
+        The first window keeps the plain column names, so the models see the same inputs as data.rolling(30).mean() gave them.
+        returns:
+            names: list of column names
+        '''
+
+        names = []
+
+        for index, windowSize in enumerate(self.windowSizes):
+            names += FEATURES if index == 0 else [feature + "Mean" + str(windowSize) for feature in FEATURES]
+
+        for lag in self.lags:
+            names += [feature + "Lag" + str(lag) for feature in FEATURES]
+
+        return names
+
+    def build(self, days, values):
+        '''
+        This method is responsible for computing the feature rows of a whole history in one vectorized pass.
+        params:
+            days: sorted array of day numbers
+            values: two-dimensional array with one column per feature
+        '''
+
+        values = np.asarray(values, dtype=np.float64)
+        numOfRows = len(values)
+
+        self.reset(max(2 * numOfRows, 1024))
+
+        cumulative = np.vstack([np.zeros((1, len(FEATURES))), np.cumsum(values, axis=0)])
+        blocks = []
+
+        for index, windowSize in enumerate(self.windowSizes):
+            means = np.full((numOfRows, len(FEATURES)), np.nan)
+            if numOfRows >= windowSize:
+                means[windowSize - 1:] = (cumulative[windowSize:] - cumulative[:-windowSize]) / windowSize
+            blocks.append(means)
+
+            # The running sum continues from the newest rows
+            self.sums[index] = values[-windowSize:].sum(axis=0)
+
+        for lag in self.lags:
+            lagged = np.full((numOfRows, len(FEATURES)), np.nan)
+            lagged[lag:] = values[:numOfRows - lag]
+            blocks.append(lagged)
+
+        if blocks:
+            self.features[:numOfRows] = np.hstack(blocks)
+
+        # Keep the newest rows for the next appends
+        positions = np.arange(max(numOfRows - self.span, 0), numOfRows)
+        self.recent[positions % self.span] = values[positions]
+
+        self.numOfRows = numOfRows
+        self.size = numOfRows
+        self.lastDay = int(days[-1]) if numOfRows else None
+
+    def append(self, day, rowValues):
+        '''
+        This method is responsible for computing the feature row of a new daily row in constant time.
+        params:
+            day: day number of the row, not earlier than the newest day
+            rowValues: array of feature values
+        returns:
+            featureRow: array of feature values, NaN until enough rows have been seen
+        '''
+
+        # Out of space, keep the rows still in the dataset in an array twice their size
+        if self.size == len(self.features):
+            retained = self.features[self.start:self.size]
+            self.features = np.full((max(2 * len(retained), 1024), self.numOfFeatures), np.nan, dtype=np.float64)
+            self.features[:len(retained)] = retained
+            self.start = 0
+            self.size = len(retained)
+
+        rowValues = np.asarray(rowValues, dtype=np.float64)
+        featureRow = np.full(self.numOfFeatures, np.nan)
+        numOfColumns = len(FEATURES)
+
+        # Every row leaving a window is read from the circular buffer before the new row is written over the oldest one
+        for index, windowSize in enumerate(self.windowSizes):
+            self.sums[index] += rowValues
+
+            if self.numOfRows >= windowSize:
+                self.sums[index] -= self.recent[(self.numOfRows - windowSize) % self.span]
+
+            if self.numOfRows + 1 >= windowSize:
+                featureRow[index * numOfColumns:(index + 1) * numOfColumns] = self.sums[index] / windowSize
+
+        for index, lag in enumerate(self.lags, start=len(self.windowSizes)):
+            if self.numOfRows >= lag:
+                featureRow[index * numOfColumns:(index + 1) * numOfColumns] = self.recent[(self.numOfRows - lag) % self.span]
+
+        self.recent[self.numOfRows % self.span] = rowValues
+        self.features[self.size] = featureRow
+
+        self.numOfRows += 1
+        self.size += 1
+        self.lastDay = day
+
+        return featureRow
+
+    def replace(self, offset, oldValues, rowValues):
+        '''
+        This method is responsible for changing the values of a row already seen, such as a resent day, without recomputing the history.
+        The row moves the mean of each window holding it by the same amount, and is the lagged copy of a few later rows.
+        params:
+            offset: position of the row counted from the oldest row still in the dataset
+            oldValues: array of the feature values the row had
+            rowValues: array of the new feature values
+        '''
+
+        position = self.start + offset
+
+        # Number of the row counted from the first row of the last build
+        rowNumber = self.numOfRows - (self.size - position)
+
+        rowValues = np.asarray(rowValues, dtype=np.float64)
+        delta = rowValues - np.asarray(oldValues, dtype=np.float64)
+        numOfColumns = len(FEATURES)
+
+        # Windows that aren't complete yet hold NaN, which adding the change leaves as it is
+        for index, windowSize in enumerate(self.windowSizes):
+            self.features[position:min(position + windowSize, self.size), index * numOfColumns:(index + 1) * numOfColumns] += delta / windowSize
+
+            if rowNumber >= self.numOfRows - windowSize:
+                self.sums[index] += delta
+
+        for index, lag in enumerate(self.lags, start=len(self.windowSizes)):
+            if position + lag < self.size:
+                self.features[position + lag, index * numOfColumns:(index + 1) * numOfColumns] = rowValues
+
+        if rowNumber >= self.numOfRows - self.span:
+            self.recent[rowNumber % self.span] = rowValues
+
+    def dropOldest(self, count=1):
+        '''
+        This method is responsible for forgetting the feature rows of the oldest data rows once they have left the dataset.
+        params:
+            count: number of rows to remove
+        '''
+        self.start = min(self.start + count, self.size)
+
+    def getFeatures(self):
+        '''
+        This method is responsible for returning the feature rows whose windows lie entirely inside the dataset, oldest first.
+        This matches data.rolling(window).mean().dropna() on the rows still in the dataset.
+        returns:
+            features: two-dimensional view of the feature rows, no data is copied
+        '''
+        return self.features[min(self.start + self.span - 1, self.size):self.size]
+
+    def getFrame(self):
+        '''
+        This method is responsible for returning the complete feature rows as a data frame.
+        returns:
+            data: data frame with one column per feature name
+        '''
+        return pd.DataFrame(self.getFeatures(), columns=self.getFeatureNames(), copy=False)
+
+    def save(self, path):
+        joblib.dump(self, path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # Only the feature rows still in the dataset are saved, the spare capacity is allocated again by the next append
+        state["features"] = self.features[self.start:self.size].copy()
+        state["size"] = self.size - self.start
+        state["start"] = 0
+
+        return state
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
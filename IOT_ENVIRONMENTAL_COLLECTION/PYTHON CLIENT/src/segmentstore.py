@@ -0,0 +1,700 @@
+'''
+Append-only storage for the weather dataset, split into one CSV segment per month.
+'''
+
+import os
+import sys
+import csv
+import json
+import math
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from weatherschema import COLUMNS, FEATURES, MAX_ENTRIES, DATE_FORMAT, MISSING_DAY, dateToDay, dayToDate, toFloat
+from typedloader import ARCHIVE_EXTENSION, readTypedCSV, readTypedSegment, parseDays
+from gorillacodec import readArchive, writeArchive
+
+# Line ending of the segments, the one csv.writer uses
+LINE_TERMINATOR = "\r\n"
+
+# Day of the month strings, indexed by the day of the month
+DAYS_OF_MONTH = np.array(["%02d" % day for day in range(32)], dtype=object)
+
+
+class SegmentedStore():
+
+    def __init__(self, directory, maxEntries=MAX_ENTRIES, stationId=1, keepRecent=None):
+        self.directory = directory
+        self.maxEntries = maxEntries
+        self.stationId = stationId
+        self.keepRecent = keepRecent  # Number of newest segments kept as plain CSV when a new month starts, older ones are archived. Never archived when None
+        self.manifestFile = os.path.join(directory, "manifest.json")
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Number of rows held by each segment, keyed by "yyyy-mm", and the segments compressed into archives
+        self.segments, self.archived = self.loadManifest()
+        self.numOfEntries = sum(self.segments.values())
+
+        # Hash index of (station, day) to (segment, row) used to replace resent records, and the days held by each segment
+        self.segmentIndexes = {}
+        self.index = self.loadIndex()
+
+    def loadManifest(self):
+        '''
+        This method is responsible for loading the per-segment row counts, rebuilding them from the segment files if the manifest is missing.
+        returns:
+            segments: dictionary of segment name to number of rows
+            archived: set of segment names stored as compressed archives
+        '''
+
+        if os.path.exists(self.manifestFile):
+            with open(self.manifestFile, mode="r") as file:
+                manifest = json.load(file)
+                return manifest["segments"], set(manifest.get("archived", []))
+
+        # No manifest yet, count the rows of any segments already on disk
+        segments = {}
+        archived = set()
+        for fileName in sorted(os.listdir(self.directory)):
+            if fileName.endswith(".csv"):
+                with open(os.path.join(self.directory, fileName), mode="r") as file:
+                    segments[fileName[:-4]] = max(sum(1 for line in file) - 1, 0)
+            elif fileName.endswith(ARCHIVE_EXTENSION):
+                segmentName = fileName[:-len(ARCHIVE_EXTENSION)]
+                segments[segmentName] = len(readArchive(os.path.join(self.directory, fileName))[0])
+                archived.add(segmentName)
+
+        return segments, archived
+
+    def saveManifest(self):
+        '''This method is responsible for atomically writing the per-segment row counts to disk'''
+
+        tempFile = self.manifestFile + ".tmp"
+
+        with open(tempFile, mode="w") as file:
+            json.dump({"segments": self.segments, "archived": sorted(self.archived)}, file)
+
+        os.replace(tempFile, self.manifestFile)
+
+    def getIndexPath(self, segmentName):
+        return os.path.join(self.directory, segmentName + ".idx")
+
+    def loadIndex(self):
+        '''
+        This method is responsible for loading the (station, day) index from the index file saved next to each segment.
+        Only segments without an index file, such as ones written before indexing existed, are scanned.
+        returns:
+            index: dictionary of (station, day) to (segment name, row number)
+        '''
+
+        index = {}
+
+        for segmentName in sorted(self.segments):
+
+            indexPath = self.getIndexPath(segmentName)
+
+            if os.path.exists(indexPath):
+                with open(indexPath, mode="r") as file:
+                    segmentIndex = json.load(file)
+            else:
+                segmentIndex = self.buildSegmentIndex(segmentName)
+
+            self.segmentIndexes[segmentName] = segmentIndex
+
+            for day, rowNumber in segmentIndex.items():
+                index[(self.stationId, int(day))] = (segmentName, rowNumber)
+
+        return index
+
+    def buildSegmentIndex(self, segmentName):
+        '''
+        This method is responsible for scanning a single segment to build its index and saving it next to the segment.
+        params:
+            segmentName: name of the segment to index
+        returns:
+            segmentIndex: dictionary of day to row number
+        '''
+
+        segmentIndex = {}
+
+        if segmentName in self.archived:
+            days = readArchive(self.getSegmentPath(segmentName))[0]
+            segmentIndex = {str(day): rowNumber for rowNumber, day in enumerate(days.tolist()) if day != MISSING_DAY}
+            self.saveSegmentIndex(segmentName, segmentIndex)
+            return segmentIndex
+
+        with open(self.getSegmentPath(segmentName), mode="r") as file:
+
+            reader = csv.reader(file)
+
+            # Skip the header row
+            next(reader, None)
+
+            for rowNumber, row in enumerate(reader):
+                day = dateToDay(row[0]) if row else None
+                if day is not None:
+                    segmentIndex[str(day)] = rowNumber
+
+        self.saveSegmentIndex(segmentName, segmentIndex)
+
+        return segmentIndex
+
+    def saveSegmentIndex(self, segmentName, segmentIndex):
+        '''
+        This method is responsible for atomically writing the index of a single segment to disk.
+        params:
+            segmentName: name of the segment
+            segmentIndex: dictionary of day to row number
+        '''
+
+        indexPath = self.getIndexPath(segmentName)
+        tempFile = indexPath + ".tmp"
+
+        with open(tempFile, mode="w") as file:
+            json.dump(segmentIndex, file)
+
+        os.replace(tempFile, indexPath)
+
+    def getSegmentName(self, dateString):
+        '''
+        This method is responsible for returning the name of the monthly segment a row belongs to.
+        params:
+            dateString: date of the row in dd/mm/yyyy format
+        returns:
+            segmentName: segment name in yyyy-mm format
+        '''
+
+        try:
+            rowDate = datetime.strptime(str(dateString).strip(), DATE_FORMAT)
+        except ValueError:
+            # Rows without a valid date are stored with the current month
+            rowDate = datetime.now()
+
+        return rowDate.strftime("%Y-%m")
+
+    def getSegmentPath(self, segmentName):
+        if segmentName in self.archived:
+            return os.path.join(self.directory, segmentName + ARCHIVE_EXTENSION)
+
+        return os.path.join(self.directory, segmentName + ".csv")
+
+    def getSegmentPaths(self):
+        '''
+        This method is responsible for returning the segment file paths from oldest to newest.
+        returns:
+            paths: list of segment file paths
+        '''
+        return [self.getSegmentPath(name) for name in sorted(self.segments)]
+
+    def getNumOfEntries(self):
+        return self.numOfEntries
+
+    def append(self, newData):
+        '''
+        This method is responsible for appending a single row to the end of its monthly segment.
+        params:
+            newData: list of values in the COLUMNS order
+        '''
+        self.appendRows([newData])
+
+    def appendRows(self, rows):
+        '''
+        This method is responsible for appending rows to their monthly segments and dropping old segments once the dataset is full.
+        The cost of an append only depends on the number of rows being added, never on the amount of history stored.
+        params:
+            rows: iterable of row lists in the COLUMNS order
+        '''
+
+        file = None
+        writer = None
+        currentSegment = None
+        changedSegments = set()
+        startedSegment = False
+
+        try:
+            for row in rows:
+
+                segmentName = self.getSegmentName(row[0])
+
+                # Switch to a different segment file when the month changes
+                if segmentName != currentSegment:
+
+                    if file is not None:
+                        file.close()
+
+                    # Late rows for an archived month go back into a plain CSV segment
+                    if segmentName in self.archived:
+                        self.unarchiveSegment(segmentName)
+
+                    isNewSegment = segmentName not in self.segments
+                    file = open(self.getSegmentPath(segmentName), mode="a", newline="")
+                    writer = csv.writer(file)
+                    currentSegment = segmentName
+
+                    # Each segment starts with the same header as the original CSV file
+                    if isNewSegment:
+                        writer.writerow(COLUMNS)
+                        self.segments[segmentName] = 0
+                        startedSegment = True
+
+                writer.writerow(row)
+
+                # Index the row so a resent record can replace it
+                day = dateToDay(row[0])
+                if day is not None:
+                    self.index[(self.stationId, day)] = (segmentName, self.segments[segmentName])
+                    self.segmentIndexes.setdefault(segmentName, {})[str(day)] = self.segments[segmentName]
+                    changedSegments.add(segmentName)
+
+                self.segments[segmentName] += 1
+                self.numOfEntries += 1
+        finally:
+            if file is not None:
+                file.close()
+
+        self.finishAppend(changedSegments, startedSegment)
+
+    def appendArrays(self, days, values, lines=None):
+        '''
+        This method is responsible for storing a block of parsed rows in the weatherData.csv row format.
+        The rows of each month are written with a single write and indexed together, so large imports aren't written row by row.
+        Days already stored are replaced in place like upsert does, with one rewrite per month, and a day repeated within the block
+        keeps its last row, so importing an overlapping export never duplicates days.
+        params:
+            days: array of day numbers
+            values: two-dimensional array with one column per feature, NaN for missing values
+            lines: the same rows already formatted by formatLines (such as by a bulk import worker), formatted here when None
+        '''
+
+        days = np.asarray(days, dtype=np.int32)
+
+        if len(days) == 0:
+            return
+
+        if lines is None:
+            lines = formatLines(days, values)
+
+        lines = np.asarray(lines, dtype=object)
+
+        # Only the last row of each day in the block is kept, rows without a date are all kept
+        valid = days != MISSING_DAY
+        keep = ~valid
+        keep[len(days) - 1 - np.unique(days[::-1], return_index=True)[1]] = True
+
+        # Days already in the store replace their rows, grouped by segment so each month is rewritten once
+        replacements = {}
+
+        for position in np.flatnonzero(keep & valid).tolist():
+            key = (self.stationId, int(days[position]))
+
+            if key in self.index:
+                segmentName, rowNumber = self.index[key]
+                replacements.setdefault(segmentName, {})[rowNumber] = lines[position].split(",")
+                keep[position] = False
+
+        for segmentName, rows in replacements.items():
+            self.replaceRows(segmentName, rows)
+
+        days, lines = days[keep], lines[keep]
+
+        if len(days) == 0:
+            return
+
+        segmentNames = describeDays(days)[1]
+
+        changedSegments = set()
+        startedSegment = False
+
+        # Stable grouping by month, so the rows of a month keep their order
+        order = np.argsort(segmentNames, kind="stable")
+        names, starts = np.unique(segmentNames[order], return_index=True)
+
+        for segmentName, positions in zip(names, np.split(order, starts[1:])):
+
+            # Late rows for an archived month go back into a plain CSV segment
+            if segmentName in self.archived:
+                self.unarchiveSegment(segmentName)
+
+            isNewSegment = segmentName not in self.segments
+
+            with open(self.getSegmentPath(segmentName), mode="a", newline="") as file:
+
+                # Each segment starts with the same header as the original CSV file
+                if isNewSegment:
+                    csv.writer(file).writerow(COLUMNS)
+                    self.segments[segmentName] = 0
+                    startedSegment = True
+
+                file.write(LINE_TERMINATOR.join(lines[positions]) + LINE_TERMINATOR)
+
+            # Index the rows so resent records can replace them
+            segmentIndex = self.segmentIndexes.setdefault(segmentName, {})
+
+            for rowNumber, day in enumerate(days[positions].tolist(), self.segments[segmentName]):
+                if day != MISSING_DAY:
+                    self.index[(self.stationId, day)] = (segmentName, rowNumber)
+                    segmentIndex[str(day)] = rowNumber
+
+            changedSegments.add(segmentName)
+
+            self.segments[segmentName] += len(positions)
+            self.numOfEntries += len(positions)
+
+        self.finishAppend(changedSegments, startedSegment)
+
+    def finishAppend(self, changedSegments, startedSegment):
+        '''
+        This method is responsible for applying the retention and saving the indexes and the manifest after rows were appended.
+        params:
+            changedSegments: set of the names of the segments rows were added to
+            startedSegment: True if a new segment was started
+        '''
+
+        self.applyRetention()
+
+        for segmentName in changedSegments:
+            if segmentName in self.segments:
+                self.saveSegmentIndex(segmentName, self.segmentIndexes[segmentName])
+
+        # A new month closes the older segments, which are not written to anymore apart from late records
+        if startedSegment and self.keepRecent is not None:
+            self.archiveSegments(self.keepRecent)
+
+        self.saveManifest()
+
+    def upsert(self, newData):
+        '''
+        This method is responsible for storing a daily record, replacing the stored row in place if the same station and date were already received.
+        params:
+            newData: list of values in the COLUMNS order
+        returns:
+            replaced: True if an existing row was replaced, False if the record was appended
+        '''
+
+        key = (self.stationId, dateToDay(newData[0]))
+
+        if key not in self.index:
+            self.append(newData)
+            return False
+
+        segmentName, rowNumber = self.index[key]
+        self.replaceRow(segmentName, rowNumber, newData)
+
+        return True
+
+    def replaceRow(self, segmentName, rowNumber, newData):
+        '''
+        This method is responsible for replacing a single row of a segment. Only that month's segment is rewritten.
+        params:
+            segmentName: name of the segment holding the row
+            rowNumber: position of the row within the segment, not counting the header
+            newData: list of values in the COLUMNS order
+        '''
+        self.replaceRows(segmentName, {rowNumber: newData})
+
+    def replaceRows(self, segmentName, newRows):
+        '''
+        This method is responsible for replacing several rows of a segment with a single rewrite of that month's segment.
+        params:
+            segmentName: name of the segment holding the rows
+            newRows: dictionary of row position within the segment, not counting the header, to the list of values in the COLUMNS order
+        '''
+
+        if segmentName in self.archived:
+            self.unarchiveSegment(segmentName)
+
+        path = self.getSegmentPath(segmentName)
+
+        with open(path, mode="r", newline="") as file:
+            rows = list(csv.reader(file))
+
+        # The first line of the segment is the header
+        for rowNumber, newData in newRows.items():
+            rows[rowNumber + 1] = newData
+
+        tempFile = path + ".tmp"
+
+        with open(tempFile, mode="w", newline="") as file:
+            csv.writer(file).writerows(rows)
+
+        os.replace(tempFile, path)
+
+    def applyRetention(self):
+        '''This method is responsible for deleting whole segments from the oldest end while the remaining rows still fill the dataset'''
+
+        segmentNames = sorted(self.segments)
+
+        while len(segmentNames) > 1 and self.numOfEntries - self.segments[segmentNames[0]] >= self.maxEntries:
+
+            oldestSegment = segmentNames.pop(0)
+            self.numOfEntries -= self.segments.pop(oldestSegment)
+
+            os.remove(self.getSegmentPath(oldestSegment))
+            self.archived.discard(oldestSegment)
+
+            if os.path.exists(self.getIndexPath(oldestSegment)):
+                os.remove(self.getIndexPath(oldestSegment))
+
+            # Forget the index entries of the dropped segment
+            for day in self.segmentIndexes.pop(oldestSegment, {}):
+                self.index.pop((self.stationId, int(day)), None)
+
+    def importCSV(self, csvFile):
+        '''
+        This method is responsible for migrating an existing single weather data CSV file into monthly segments.
+        params:
+            csvFile: path of the CSV file to import
+        '''
+
+        with open(csvFile, mode="r") as file:
+
+            reader = csv.reader(file)
+
+            # Skip the header row
+            next(reader, None)
+
+            self.appendRows(row for row in reader if row)
+
+    def readFrame(self):
+        '''
+        This method is responsible for loading every segment into a single data frame, oldest rows first.
+        returns:
+            data: data frame with the COLUMNS layout, float32 measurements
+        '''
+
+        frames = [readTypedSegment(path) for path in self.getSegmentPaths()]
+
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+
+        return pd.concat(frames, ignore_index=True)
+
+    def readTail(self, numOfRows):
+        '''
+        This method is responsible for loading the last valid rows of the dataset by reading the segments backwards from their end.
+        Rows with a missing value are skipped, the same as dropna() on the full data frame, and the rest of the history is never read.
+        params:
+            numOfRows: number of valid rows to return
+        returns:
+            data: data frame with the COLUMNS layout holding at most numOfRows rows, oldest first
+        '''
+
+        rows = []
+
+        for segmentName in reversed(sorted(self.segments)):
+
+            for row in self.readValidRowsReversed(segmentName):
+
+                rows.append(row)
+
+                if len(rows) >= numOfRows:
+                    break
+
+            if len(rows) >= numOfRows:
+                break
+
+        rows.reverse()
+
+        return pd.DataFrame(rows, columns=COLUMNS)
+
+    def readValidRowsReversed(self, segmentName):
+        '''
+        This method is responsible for yielding the valid rows of a segment from the last one to the first.
+        params:
+            segmentName: name of the segment to read
+        returns:
+            rows: generator of lists with the date followed by float measurements
+        '''
+
+        path = self.getSegmentPath(segmentName)
+
+        if segmentName in self.archived:
+
+            days, values = readArchive(path)
+
+            for day, rowValues in zip(days[::-1].tolist(), values[::-1].tolist()):
+                if day != MISSING_DAY and not any(math.isnan(value) for value in rowValues):
+                    yield [dayToDate(day)] + rowValues
+
+            return
+
+        for line in readLinesReversed(path):
+
+            row = parseValidRow(line)
+
+            if row is not None:
+                yield row
+
+    def archiveSegments(self, keepRecent=1):
+        '''
+        This method is responsible for compressing older segments into Gorilla encoded archives, which are rarely read but take most of the disk space.
+        The row order is kept, so the (station, day) index stays valid.
+        params:
+            keepRecent: number of newest segments kept as plain CSV
+        returns:
+            archivedSegments: list of the segment names that were archived
+        '''
+
+        segmentNames = sorted(self.segments)
+        archivedSegments = []
+
+        for segmentName in segmentNames[:max(len(segmentNames) - keepRecent, 0)]:
+
+            if segmentName in self.archived:
+                continue
+
+            csvPath = self.getSegmentPath(segmentName)
+
+            data = readTypedCSV(csvPath)
+            days = parseDays(data["Date"])
+
+            self.archived.add(segmentName)
+            writeArchive(self.getSegmentPath(segmentName), days, data[FEATURES].to_numpy(dtype=np.float32))
+            os.remove(csvPath)
+
+            archivedSegments.append(segmentName)
+
+        self.saveManifest()
+
+        return archivedSegments
+
+    def unarchiveSegment(self, segmentName):
+        '''
+        This method is responsible for turning an archived segment back into a plain CSV segment so rows can be added or replaced.
+        params:
+            segmentName: name of the archived segment
+        '''
+
+        archivePath = self.getSegmentPath(segmentName)
+        days, values = readArchive(archivePath)
+
+        self.archived.discard(segmentName)
+        csvPath = self.getSegmentPath(segmentName)
+
+        with open(csvPath, mode="w", newline="") as file:
+            csv.writer(file).writerow(COLUMNS)
+
+            if len(days):
+                file.write(LINE_TERMINATOR.join(formatLines(days, values)) + LINE_TERMINATOR)
+
+        os.remove(archivePath)
+        self.saveManifest()
+
+
+def describeDays(days):
+    '''
+    This function is responsible for converting day numbers into their dd/mm/yyyy dates and the names of their monthly segments.
+    Only the distinct months are formatted, the days of the month are looked up.
+    params:
+        days: int32 array of day numbers
+    returns:
+        dates: object array of date strings, "N/A" for MISSING_DAY
+        segmentNames: object array of yyyy-mm segment names, rows without a date belong to the current month (see getSegmentName)
+    '''
+
+    valid = days != MISSING_DAY
+
+    # The missing day lies millions of years away, so it is masked before the conversion
+    dates = np.where(valid, days, 0).astype("datetime64[D]")
+    months = dates.astype("datetime64[M]")
+    daysOfMonth = (dates - months).astype(np.int64) + 1
+
+    uniqueMonths, inverse = np.unique(months, return_inverse=True)
+    monthStarts = pd.to_datetime(uniqueMonths)
+
+    dates = DAYS_OF_MONTH[daysOfMonth] + monthStarts.strftime("/%m/%Y").to_numpy(dtype=object)[inverse]
+    segmentNames = monthStarts.strftime("%Y-%m").to_numpy(dtype=object)[inverse]
+
+    return np.where(valid, dates, "N/A"), np.where(valid, segmentNames, datetime.now().strftime("%Y-%m"))
+
+
+def formatLines(days, values):
+    '''
+    This function is responsible for converting parsed arrays back into lines of the weatherData.csv format, all in one pass.
+    params:
+        days: array of day numbers
+        values: two-dimensional array with one column per feature, NaN for missing values
+    returns:
+        lines: list of row strings without their line ending
+    '''
+
+    data = pd.DataFrame(np.asarray(values, dtype=np.float32), columns=FEATURES)
+    data.insert(0, "Date", describeDays(np.asarray(days, dtype=np.int32))[0])
+
+    # float32 values are written with their shortest representation, the same as the weather station sends them
+    text = data.to_csv(header=False, index=False, na_rep="N/A", lineterminator=LINE_TERMINATOR)
+
+    return text.split(LINE_TERMINATOR)[:-1]
+
+
+def readLinesReversed(path, blockSize=4096):
+    '''
+    This function is responsible for yielding the lines of a text file from the last one to the first, reading the file in blocks from its end.
+    params:
+        path: path of the file to read
+        blockSize: number of bytes read per seek
+    returns:
+        lines: generator of decoded lines, newest first
+    '''
+
+    with open(path, mode="rb") as file:
+
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        remainder = b""
+
+        while position > 0:
+
+            readSize = min(blockSize, position)
+            position -= readSize
+
+            file.seek(position)
+            lines = (file.read(readSize) + remainder).split(b"\n")
+
+            # The first line may continue in the previous block
+            remainder = lines.pop(0)
+
+            for line in reversed(lines):
+                yield line.decode().rstrip("\r")
+
+        yield remainder.decode().rstrip("\r")
+
+
+def parseValidRow(line):
+    '''
+    This function is responsible for parsing a CSV line into a row, rejecting the header and rows with missing values.
+    params:
+        line: line of a segment file
+    returns:
+        row: list with the date followed by float measurements, or None if the row isn't valid
+    '''
+
+    values = next(csv.reader([line]), [])
+
+    if len(values) != len(COLUMNS) or dateToDay(values[0]) is None:
+        return None
+
+    measurements = [toFloat(value) for value in values[1:]]
+
+    if any(math.isnan(value) for value in measurements):
+        return None
+
+    return [values[0]] + measurements
+
+
+if __name__ == '__main__':
+
+    # Usage: python segmentstore.py archive weatherData [number of newest segments kept as CSV]
+    #        python segmentstore.py unarchive weatherData
+    command, directory = sys.argv[1:3]
+    store = SegmentedStore(directory)
+
+    if command == "archive":
+        print("Archived", store.archiveSegments(int(sys.argv[3]) if len(sys.argv) > 3 else 1))
+    elif command == "unarchive":
+        for segmentName in sorted(store.archived):
+            store.unarchiveSegment(segmentName)
+        print("Segments kept as CSV:", sorted(store.segments))
+    else:
+        print("Unknown command:", command)
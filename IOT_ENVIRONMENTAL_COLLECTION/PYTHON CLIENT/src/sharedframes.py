@@ -0,0 +1,105 @@
+'''
+Training data published once into shared memory as contiguous float32 arrays, so worker processes read it in place
+instead of each receiving a pickled copy. Workers get data frames that are views of the shared block.
+'''
+
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+# Offsets of the arrays in the block are rounded up to a cache line
+ALIGNMENT = 64
+
+# Block attached by this worker process, kept open for the following tasks of the same run
+attached = {"name": None, "memory": None, "frames": None}
+
+
+class SharedFrames():
+
+    def __init__(self, frames, dtype=np.float32):
+        '''
+        params:
+            frames: dictionary of name to data frame (or two-dimensional array) to publish
+            dtype: type the values are stored as
+        '''
+
+        self.dtype = np.dtype(dtype)
+        self.layout = {}
+
+        arrays = {}
+        size = 0
+
+        for key, frame in frames.items():
+            values = np.ascontiguousarray(frame, dtype=self.dtype)
+            columns = list(frame.columns) if isinstance(frame, pd.DataFrame) else None
+
+            # Identical arrays, such as the features and targets when every feature is also forecast, are only stored once
+            duplicate = next((other for other, array in arrays.items() if array.shape == values.shape and np.array_equal(array, values)), None)
+
+            if duplicate is not None:
+                self.layout[key] = (self.layout[duplicate][0], values.shape, columns)
+                continue
+
+            arrays[key] = values
+            self.layout[key] = (size, values.shape, columns)
+            size += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+        for key, values in arrays.items():
+            offset, shape, columns = self.layout[key]
+            np.ndarray(shape, dtype=self.dtype, buffer=self.memory.buf, offset=offset)[...] = values
+
+    def getHandle(self):
+        '''
+        This method is responsible for describing the block, the description is all a worker needs to attach to it.
+        returns:
+            handle: tuple of the block name, value type and array layout
+        '''
+        return self.memory.name, self.dtype.str, self.layout
+
+    def close(self):
+        '''This method is responsible for releasing the block once no worker uses it anymore'''
+
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attachFrames(handle):
+    '''
+    This function is responsible for attaching a worker process to a shared block, reusing the attachment for the following tasks.
+    params:
+        handle: description from SharedFrames.getHandle
+    returns:
+        frames: dictionary of name to data frame (or array) viewing the shared block, nothing is copied
+    '''
+
+    name, dtype, layout = handle
+
+    if attached["name"] != name:
+
+        # Only the latest block is kept, earlier runs have released theirs
+        if attached["memory"] is not None:
+            attached["frames"] = None
+            try:
+                attached["memory"].close()
+            except BufferError:
+                pass  # A trained model still refers to the old values, the mapping goes when the model does
+
+        memory = shared_memory.SharedMemory(name=name)
+
+        frames = {}
+        for key, (offset, shape, columns) in layout.items():
+            values = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+            values.flags.writeable = False
+            frames[key] = values if columns is None else pd.DataFrame(values, columns=columns, copy=False)
+
+        attached.update(name=name, memory=memory, frames=frames)
+
+    return attached["frames"]
@@ -0,0 +1,284 @@
+'''
+Supervisor running several collector processes, so collection and forecasting use every core instead of sharing one interpreter.
+Weather stations are split between the workers with a consistent hash ring: changing the number of workers only moves the stations
+of the added or removed share, and a station is always released by its old worker before its new worker polls it.
+'''
+
+import os
+import sys
+import time
+import bisect
+import asyncio
+import hashlib
+import multiprocessing
+from collector import Collector, loadStations
+
+
+def hashKey(key):
+    '''
+    This function is responsible for placing a key on the hash ring.
+    params:
+        key: station ID or virtual node name
+    returns:
+        position: 64 bit integer, the same in every process and run
+    '''
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+
+class HashRing():
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas  # Number of positions of each node on the ring, more positions give more even shares
+
+        positions = sorted((hashKey("%s#%d" % (node, replica)), node) for node in nodes for replica in range(replicas))
+
+        self.positions = [position for position, node in positions]
+        self.nodes = [node for position, node in positions]
+
+    def getNode(self, key):
+        '''
+        This method is responsible for finding the node owning a key, the first node position clockwise from the key.
+        params:
+            key: station ID
+        returns:
+            node: name of the owning node
+        '''
+        return self.nodes[bisect.bisect(self.positions, hashKey(key)) % len(self.positions)]
+
+
+def assignShards(stations, workerIds):
+    '''
+    This function is responsible for splitting the weather stations between the workers.
+    params:
+        stations: list of station dictionaries
+        workerIds: list of worker IDs
+    returns:
+        shards: dictionary of worker ID to its list of station dictionaries
+    '''
+
+    ring = HashRing(workerIds)
+    shards = {workerId: [] for workerId in workerIds}
+
+    for station in stations:
+        shards[ring.getNode(station["stationId"])].append(station)
+
+    return shards
+
+
+async def serveShard(collector, interval, connection):
+    '''
+    This function is responsible for running a worker's ingestion windows, handling the supervisor's commands between windows.
+    params:
+        collector: Collector polling the worker's stations
+        interval: seconds between the starts of the ingestion windows
+        connection: pipe to the supervisor
+    '''
+
+    while True:
+        start = time.perf_counter()
+
+        await collector.pollAll()
+
+        # Commands are only handled between windows, so a station is never released in the middle of an exchange
+        while True:
+
+            if connection.poll():
+                command, stations, coreBudget = connection.recv()
+
+                if command == "stop":
+                    return
+
+                collector.setStations(stations)
+                collector.setCoreBudget(coreBudget)
+                connection.send("assigned")
+
+            elif time.perf_counter() - start >= interval:
+                break
+            else:
+                await asyncio.sleep(min(interval - (time.perf_counter() - start), 0.5))
+
+
+def runWorker(stations, interval, collectorOptions, connection):
+    '''
+    This function is responsible for the main loop of a worker process.
+    params:
+        stations: list of station dictionaries of the worker's shard
+        interval: seconds between the starts of the ingestion windows
+        collectorOptions: keyword arguments of the Collector
+        connection: pipe to the supervisor
+    '''
+
+    collector = Collector(stations, **collectorOptions)
+
+    try:
+        asyncio.run(serveShard(collector, interval, connection))
+    finally:
+        collector.close()
+
+
+class Supervisor():
+
+    def __init__(self, stations, numOfWorkers=None, interval=60, stopTimeout=None, **collectorOptions):
+        self.stations = stations
+        self.numOfWorkers = numOfWorkers or os.cpu_count()
+        self.interval = interval  # Seconds between the starts of the ingestion windows
+        self.stopTimeout = stopTimeout or 2 * interval  # Seconds stop() gives the workers to finish their window before terminating them
+        self.collectorOptions = collectorOptions
+
+        # Process and pipe of each running worker by worker ID
+        self.workers = {}
+
+        # Stations of each worker by worker ID
+        self.shards = {}
+
+    def getCoreBudget(self):
+        return max(os.cpu_count() // self.numOfWorkers, 1)
+
+    def startWorker(self, workerId):
+        '''
+        This method is responsible for starting a worker process for a shard.
+        params:
+            workerId: ID of the worker
+        '''
+
+        connection, workerConnection = multiprocessing.Pipe()
+        options = dict(self.collectorOptions, coreBudget=self.getCoreBudget())
+
+        # Not a daemon, as daemonic processes can't start the process pools of the model selection. stop() ends the workers instead
+        process = multiprocessing.Process(target=runWorker, args=(self.shards[workerId], self.interval, options, workerConnection),
+                                          name="collector-%d" % workerId, daemon=False)
+        process.start()
+
+        self.workers[workerId] = (process, connection)
+
+    def requestStop(self, workerId):
+        '''
+        This method is responsible for asking a worker to stop once its current window is finished.
+        params:
+            workerId: ID of the worker
+        returns:
+            process: process of the worker
+        '''
+
+        process, connection = self.workers.pop(workerId)
+
+        try:
+            connection.send(("stop", None, None))
+        except OSError:
+            pass  # The worker has already exited
+
+        return process
+
+    def stopWorker(self, workerId):
+        '''
+        This method is responsible for stopping a worker once its current window is finished, waiting for it however long the window takes.
+        params:
+            workerId: ID of the worker
+        '''
+
+        self.requestStop(workerId).join()
+
+    def assign(self, workerId, stations):
+        '''
+        This method is responsible for changing the stations of a running worker, returning once the worker has taken the change.
+        params:
+            workerId: ID of the worker
+            stations: list of station dictionaries
+        '''
+
+        process, connection = self.workers[workerId]
+
+        connection.send(("assign", stations, self.getCoreBudget()))
+
+        # The worker answers after its current window, a worker that died is restarted by monitor
+        while process.is_alive() and not connection.poll(1):
+            pass
+
+        if connection.poll():
+            connection.recv()
+
+    def start(self):
+        '''This method is responsible for starting a worker for every shard'''
+
+        self.shards = assignShards(self.stations, list(range(self.numOfWorkers)))
+
+        for workerId in self.shards:
+            self.startWorker(workerId)
+
+    def rebalance(self, stations=None, numOfWorkers=None):
+        '''
+        This method is responsible for moving the weather stations to their new workers after the stations or the number of workers changed.
+        Every worker first releases the stations it loses, then the stations are handed to their new workers,
+        so no station's data is ever written by two workers at once.
+        params:
+            stations: new list of station dictionaries, unchanged when None
+            numOfWorkers: new number of workers, unchanged when None
+        '''
+
+        self.stations = stations if stations is not None else self.stations
+        self.numOfWorkers = numOfWorkers or self.numOfWorkers
+
+        shards = assignShards(self.stations, list(range(self.numOfWorkers)))
+
+        # Release: removed workers stop, the others keep only the stations they still own
+        for workerId in list(self.workers):
+            if workerId not in shards:
+                self.stopWorker(workerId)
+            else:
+                newIds = set(station["stationId"] for station in shards[workerId])
+                self.assign(workerId, [station for station in self.shards[workerId] if station["stationId"] in newIds])
+
+        # Take over: the remaining workers get their new stations and added workers start
+        self.shards = shards
+
+        for workerId in shards:
+            if workerId in self.workers:
+                self.assign(workerId, shards[workerId])
+            else:
+                self.startWorker(workerId)
+
+    def monitor(self):
+        '''This method is responsible for restarting workers that died, with the same shard'''
+
+        for workerId, (process, connection) in list(self.workers.items()):
+            if not process.is_alive():
+                print("Worker %d stopped with exit code %s, restarting it" % (workerId, process.exitcode))
+                self.startWorker(workerId)
+
+    def stop(self):
+        '''This method is responsible for stopping every worker, the workers still running after stopTimeout are terminated'''
+
+        processes = [self.requestStop(workerId) for workerId in list(self.workers)]
+        deadline = time.monotonic() + self.stopTimeout
+
+        for process in processes:
+            process.join(max(deadline - time.monotonic(), 0))
+
+            if process.is_alive():
+                print("Worker %s didn't stop within %gs, terminating it" % (process.name, self.stopTimeout))
+                process.terminate()
+                process.join()
+
+
+if __name__ == '__main__':
+
+    # Usage: python supervisor.py stations.json [number of workers] [interval in seconds]
+    # The stations are rebalanced whenever the stations file changes
+    stationsFile = sys.argv[1]
+
+    supervisor = Supervisor(loadStations(stationsFile), int(sys.argv[2]) if len(sys.argv) > 2 else None,
+                            float(sys.argv[3]) if len(sys.argv) > 3 else 60)
+    supervisor.start()
+
+    modified = os.path.getmtime(stationsFile)
+
+    try:
+        while True:
+            time.sleep(5)
+            supervisor.monitor()
+
+            if os.path.getmtime(stationsFile) != modified:
+                modified = os.path.getmtime(stationsFile)
+                supervisor.rebalance(loadStations(stationsFile))
+    finally:
+        supervisor.stop()
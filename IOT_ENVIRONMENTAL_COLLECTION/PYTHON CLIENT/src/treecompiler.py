@@ -0,0 +1,223 @@
+'''
+Compiler flattening trained decision trees and random forests into contiguous NumPy node arrays, with a vectorized evaluator
+that walks the trees one level at a time for a whole batch of rows. Compiled models are much smaller to save and faster to load.
+A single row or a small batch is predicted many times faster than by sklearn, which starts a job per tree, while large batches
+run within about 20% of sklearn's single threaded predict (16000 rows, 100 trees: 0.5s for sklearn, 0.55-0.7s compiled).
+'''
+
+import sys
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+# Number of (row, tree) pairs walked together, bounding the memory of the position arrays.
+# Large batches are walked one tree at a time, small ones walk several trees together so each NumPy call still has enough work
+PAIR_CHUNK_SIZE = 16384
+
+
+class CompiledTreeEnsemble():
+
+    def __init__(self, name, features, thresholds, children, leafRows, leafValues, roots, depths):
+        self.name = name  # Class name of the compiled model
+
+        # One entry per node of every tree, node numbers are offset so every tree's nodes follow the previous tree's.
+        # Leaves compare against infinity and have themselves as both children, so a row that reached a leaf stays on it
+        # A row goes right when its feature value is above the float32 threshold, features past the inputs are the negated inputs
+        self.features = features
+        self.thresholds = thresholds
+
+        # Left and right child of each node side by side
+        self.children = children
+
+        # Row of leafValues of each node, -1 for split nodes
+        self.leafRows = leafRows
+        self.leafValues = leafValues
+
+        # Node number of the root of each tree, and the number of levels walked to reach every leaf of the tree
+        self.roots = roots
+        self.depths = depths
+
+    def predict(self, X):
+        '''
+        This method is responsible for predicting a batch of rows by walking the trees one level at a time for all rows together.
+        Every row takes a step on every level, rows already on a leaf stay there, so the position arrays are filled in place
+        instead of being compacted as rows finish.
+        params:
+            X: two-dimensional array (or data frame) of feature values
+        returns:
+            predictions: two-dimensional array with one row per input row, the average of the trees' leaf values
+        '''
+
+        # The trees were trained on float32 inputs, comparing float32 values keeps the same branches as sklearn
+        X = np.asarray(X, dtype=np.float32)
+        predictions = np.zeros((len(X), self.leafValues.shape[1]), dtype=np.float64)
+
+        if len(X) == 0:
+            return predictions
+
+        # Rows predicted together, and trees walked together for those rows
+        numOfRows = min(len(X), PAIR_CHUNK_SIZE)
+        numOfTrees = max(PAIR_CHUNK_SIZE // numOfRows, 1)
+
+        # Position arrays reused by every group of trees, one entry per (tree, row) pair
+        # Every array indexing the nodes has the integer type of the node numbers, so np.take fills them without converting
+        nodes = np.empty(numOfRows * numOfTrees, dtype=self.children.dtype)
+        positions = np.empty_like(nodes)
+        values = np.empty(len(nodes), dtype=np.float32)
+        thresholds = np.empty(len(nodes), dtype=np.float32)
+        goRight = np.empty(len(nodes), dtype=bool)
+
+        for start in range(0, len(X), numOfRows):
+            # The negated values follow the values of each row, for the nodes sending missing values right (see compileTreeModel)
+            rows = X[start:start + numOfRows]
+            rows = np.hstack([rows, -rows])
+            flatRows = rows.ravel()
+            rowOffsets = np.tile(np.arange(len(rows), dtype=nodes.dtype) * rows.shape[1], numOfTrees)
+
+            for firstTree in range(0, len(self.roots), numOfTrees):
+                roots = self.roots[firstTree:firstTree + numOfTrees]
+                numOfPairs = len(roots) * len(rows)
+
+                groupNodes = nodes[:numOfPairs]
+                groupPositions = positions[:numOfPairs]
+                groupValues = values[:numOfPairs]
+                groupThresholds = thresholds[:numOfPairs]
+                groupGoRight = goRight[:numOfPairs]
+
+                groupNodes[:] = np.repeat(roots, len(rows))
+
+                for level in range(int(self.depths[firstTree:firstTree + numOfTrees].max())):
+                    np.take(self.features, groupNodes, out=groupPositions)
+                    groupPositions += rowOffsets[:numOfPairs]
+                    np.take(flatRows, groupPositions, out=groupValues)
+                    np.take(self.thresholds, groupNodes, out=groupThresholds)
+                    np.greater(groupValues, groupThresholds, out=groupGoRight)
+
+                    # The children of node n are stored at 2n and 2n + 1
+                    groupNodes *= 2
+                    groupNodes += groupGoRight
+                    np.take(self.children, groupNodes, out=groupNodes)
+
+                # Leaf values of the (tree, row) pairs, summed over the trees of the group
+                leafValues = self.leafValues[self.leafRows[groupNodes]].reshape(len(roots), len(rows), -1)
+                predictions[start:start + numOfRows] += leafValues[0] if len(roots) == 1 else leafValues.sum(axis=0, dtype=np.float64)
+
+        predictions /= len(self.roots)
+
+        return predictions
+
+    def __repr__(self):
+        return "CompiledTreeEnsemble(%s, %d trees)" % (self.name, len(self.roots))
+
+
+def getEstimators(model):
+    '''
+    This function is responsible for listing the decision trees of a model.
+    params:
+        model: trained DecisionTreeRegressor or RandomForestRegressor
+    returns:
+        estimators: list of trained decision trees
+    '''
+
+    if isinstance(model, RandomForestRegressor):
+        return list(model.estimators_)
+
+    if isinstance(model, DecisionTreeRegressor):
+        return [model]
+
+    raise ValueError("Can't compile a " + type(model).__name__)
+
+
+def compileTreeModel(model, valueDtype=np.float64):
+    '''
+    This function is responsible for flattening a trained tree model into contiguous node arrays.
+    params:
+        model: trained DecisionTreeRegressor or RandomForestRegressor
+        valueDtype: type of the stored leaf values, float32 halves the size of the largest array but rounds the predictions
+    returns:
+        compiledModel: CompiledTreeEnsemble giving the same predictions as the model with float64 leaf values,
+                       up to the rounding of the average over the trees
+    '''
+
+    features = []
+    thresholds = []
+    children = []
+    leafRows = []
+    leafValues = []
+    roots = []
+    depths = []
+
+    numOfNodes = 0
+    numOfLeaves = 0
+    numOfFeatures = model.n_features_in_
+
+    for estimator in getEstimators(model):
+        tree = estimator.tree_
+        isLeaf = tree.children_left == -1
+        nodeNumbers = numOfNodes + np.arange(tree.node_count)
+
+        roots.append(numOfNodes)
+        depths.append(tree.max_depth)
+
+        feature = tree.feature.copy()
+        left = numOfNodes + tree.children_left
+        right = numOfNodes + tree.children_right
+
+        # sklearn compares the float32 inputs with float64 thresholds, the largest float32 not above a threshold splits them the same way
+        threshold = tree.threshold.astype(np.float32)
+        roundedUp = threshold > tree.threshold
+        threshold[roundedUp] = np.nextafter(threshold[roundedUp], np.float32(-np.inf))
+
+        # A missing value is never above the threshold, so it goes left. A node sending missing values right swaps its children
+        # and compares the negated value instead, -x is above the negated next float32 up exactly when x is at most the threshold
+        sendsRight = ~isLeaf & (getattr(tree, "missing_go_to_left", np.ones(tree.node_count)) == 0)
+        feature[sendsRight] += numOfFeatures
+        threshold[sendsRight] = -np.nextafter(threshold[sendsRight], np.float32(np.inf))
+        left[sendsRight], right[sendsRight] = right[sendsRight], left[sendsRight].copy()
+
+        # A leaf sends every row to itself, comparing against infinity so even a missing value goes to its left child
+        feature[isLeaf] = 0
+        threshold[isLeaf] = np.inf
+        left[isLeaf] = nodeNumbers[isLeaf]
+        right[isLeaf] = nodeNumbers[isLeaf]
+
+        features.append(feature)
+        thresholds.append(threshold)
+        children.append(np.column_stack([left, right]).ravel())
+
+        # Values are stored as (nodes, outputs, 1) for regression trees, only the leaves are kept
+        rows = np.full(tree.node_count, -1, dtype=np.int64)
+        rows[isLeaf] = numOfLeaves + np.arange(np.count_nonzero(isLeaf))
+        leafRows.append(rows)
+        leafValues.append(tree.value[isLeaf, :, 0])
+
+        numOfNodes += tree.node_count
+        numOfLeaves += np.count_nonzero(isLeaf)
+
+    # The smallest integer type that can number every node keeps the arrays compact
+    indexDtype = np.int32 if 2 * numOfNodes < 2 ** 31 else np.int64
+
+    return CompiledTreeEnsemble(type(model).__name__,
+                                np.concatenate(features).astype(indexDtype),
+                                np.concatenate(thresholds),
+                                np.concatenate(children).astype(indexDtype),
+                                np.concatenate(leafRows).astype(indexDtype),
+                                np.concatenate(leafValues).astype(valueDtype),
+                                np.array(roots, dtype=indexDtype),
+                                np.array(depths, dtype=np.int32))
+
+
+def isCompilable(model):
+    return isinstance(model, (DecisionTreeRegressor, RandomForestRegressor))
+
+
+if __name__ == '__main__':
+
+    # Usage: python treecompiler.py weather_predictor.sav compiled_predictor.sav
+    source, destination = sys.argv[1:3]
+
+    compiledModel = compileTreeModel(joblib.load(source))
+    joblib.dump(compiledModel, destination)
+
+    print("Compiled", compiledModel)
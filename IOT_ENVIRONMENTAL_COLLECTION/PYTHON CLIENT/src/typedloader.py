@@ -0,0 +1,130 @@
+'''
+Typed loader for the weather dataset. Measurements are read as float32 and dates are parsed once into integer day numbers.
+CSV segments, Gorilla archives and column store directories can all be loaded.
+'''
+
+import os
+import numpy as np
+import pandas as pd
+from weatherschema import COLUMNS, FEATURES, NA_VALUES, DATE_FORMAT, MISSING_DAY
+from gorillacodec import readArchive
+from columnstore import ColumnStore
+
+# File extension of segments compressed with the Gorilla codec
+ARCHIVE_EXTENSION = ".gor"
+
+# Column types declared up front so pandas never has to infer them
+CSV_DTYPES = dict({"Date": "string"}, **{feature: np.float32 for feature in FEATURES})
+
+
+def readTypedCSV(path):
+    '''
+    This function is responsible for reading a weather data CSV file with the declared column types.
+    params:
+        path: path of the CSV file to read
+    returns:
+        data: data frame with a string Date column and float32 measurements
+    '''
+    return pd.read_csv(path, usecols=COLUMNS, dtype=CSV_DTYPES, na_values=NA_VALUES)
+
+
+def readTypedSegment(path):
+    '''
+    This function is responsible for reading a CSV segment or a compressed archive into the same typed data frame.
+    params:
+        path: path of the segment file
+    returns:
+        data: data frame with a string Date column and float32 measurements
+    '''
+
+    if not path.endswith(ARCHIVE_EXTENSION):
+        return readTypedCSV(path)
+
+    days, values = readArchive(path)
+
+    data = pd.DataFrame(values, columns=FEATURES)
+
+    # The missing day lies millions of years away, so it is masked before the conversion
+    valid = days != MISSING_DAY
+    dates = pd.Series(pd.to_datetime(np.where(valid, days, 0), unit="D").strftime(DATE_FORMAT), dtype="string")
+    data.insert(0, "Date", dates.where(valid, pd.NA))
+
+    return data
+
+
+def parseDays(dates, dateFormat=DATE_FORMAT):
+    '''
+    This function is responsible for converting a column of dd/mm/yyyy dates into integer day numbers.
+    params:
+        dates: series of date strings
+        dateFormat: strptime format of the dates
+    returns:
+        days: int32 array of days since 01/01/1970, MISSING_DAY where the date can't be parsed
+    '''
+
+    parsedDates = pd.to_datetime(dates, format=dateFormat, errors="coerce")
+    days = (parsedDates - pd.Timestamp(1970, 1, 1)).dt.days
+
+    return days.fillna(MISSING_DAY).to_numpy(dtype=np.int32)
+
+
+def loadTypedHistory(paths):
+    '''
+    This function is responsible for loading weather data CSV files into compact arrays sorted by day.
+    Rows without a valid date or with a missing measurement are left out.
+    params:
+        paths: list of CSV file, archive or column store directory paths
+    returns:
+        days: sorted int32 array of day numbers
+        values: float32 array with one column per feature, in the same order as days
+    '''
+
+    dayBlocks = []
+    valueBlocks = []
+
+    for path in paths:
+
+        # Archives and column stores decode straight into arrays, CSV segments go through pandas
+        if os.path.isdir(path):
+            days, values = ColumnStore(path).readArrays()
+        elif path.endswith(ARCHIVE_EXTENSION):
+            days, values = readArchive(path)
+        else:
+            data = readTypedCSV(path)
+
+            days = parseDays(data["Date"])
+            values = data[FEATURES].to_numpy(dtype=np.float32)
+
+        valid = (days != MISSING_DAY) & ~np.isnan(values).any(axis=1)
+
+        dayBlocks.append(days[valid])
+        valueBlocks.append(values[valid])
+
+    if not dayBlocks:
+        return np.empty(0, dtype=np.int32), np.empty((0, len(FEATURES)), dtype=np.float32)
+
+    days = np.concatenate(dayBlocks)
+    values = np.concatenate(valueBlocks)
+
+    # Stable sort so rows sharing a date keep the order they were stored in
+    order = np.argsort(days, kind="stable")
+
+    return days[order], values[order]
+
+
+def findDayRange(days, startDay, endDay):
+    '''
+    This function is responsible for finding the rows that fall within a date range using binary search.
+    params:
+        days: sorted array of day numbers
+        startDay: first day of the range
+        endDay: last day of the range (inclusive)
+    returns:
+        start: position of the first row in the range
+        end: position after the last row in the range
+    '''
+
+    start = np.searchsorted(days, startDay, side="left")
+    end = np.searchsorted(days, endDay, side="right")
+
+    return int(start), int(end)
@@ -0,0 +1,69 @@
+'''
+Shared description of the daily weather record exchanged between the weather station and the python client.
+'''
+
+from datetime import date, datetime, timedelta
+import numpy as np
+
+# Column layout of a daily weather data row (matches the original weatherData.csv header)
+COLUMNS = ["Date", "MinTemp", "MaxTemp", "WindSpeed9am", "WindSpeed3pm", "Humidity9am", "Humidity3pm", "Pressure9am", "Pressure3pm", "Temp9am", "Temp3pm"]
+
+# Measurement columns used as the input features and targets of the forecast models
+FEATURES = COLUMNS[1:]
+
+# Strings sent by the weather station when a reading is missing
+NA_VALUES = ["not available", "n/a", "N/A"]
+
+# Maximum number of daily entries kept in the dataset
+MAX_ENTRIES = 20538
+
+# Date format used by the weather station
+DATE_FORMAT = "%d/%m/%Y"
+
+EPOCH = date(1970, 1, 1)
+
+# Day number stored for rows whose date couldn't be parsed. -1 is 31/12/1969, a real date, so the lowest int32 is used instead
+MISSING_DAY = int(np.iinfo(np.int32).min)
+
+
+def dateToDay(dateString):
+    '''
+    This function is responsible for converting a dd/mm/yyyy date string into an integer day number.
+    params:
+        dateString: date in the weather station's dd/mm/yyyy format
+    returns:
+        day: number of days since 01/01/1970, or None if the date can't be parsed
+    '''
+    try:
+        return (datetime.strptime(str(dateString).strip(), DATE_FORMAT).date() - EPOCH).days
+    except ValueError:
+        return None
+
+
+def dayToDate(day):
+    '''
+    This function is responsible for converting an integer day number back into a dd/mm/yyyy date string.
+    params:
+        day: number of days since 01/01/1970
+    returns:
+        dateString: date in the weather station's dd/mm/yyyy format
+    '''
+    return (EPOCH + timedelta(days=int(day))).strftime(DATE_FORMAT)
+
+
+def toFloat(value):
+    '''
+    This function is responsible for converting a raw CSV value into a float, missing values become NaN.
+    params:
+        value: value read from the CSV file or received from the weather station
+    returns:
+        number: float value of the argument
+    '''
+
+    if value is None or str(value).strip() in NA_VALUES:
+        return float("nan")
+
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
@@ -0,0 +1,26 @@
+import os
+import sys
+from datetime import date, timedelta
+import numpy as np
+import pytest
+
+# The client modules import each other by name, as when main.py is run from src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+@pytest.fixture
+def weatherRows():
+    '''
+    Synthetic daily records in the COLUMNS layout: seasonal readings with noise, rounded like the weather station's readings.
+    '''
+
+    def makeRows(numOfRows, startDate=date(2000, 1, 1), seed=0):
+        rng = np.random.default_rng(seed)
+        days = np.arange(numOfRows)
+
+        season = np.sin(2 * np.pi * days / 365.25)[:, None] * np.array([5, 6, 2, 2, 10, 10, 8, 8, 6, 6])
+        values = np.round(season + np.array([8, 18, 10, 12, 70, 60, 1010, 1008, 12, 16]) + rng.normal(size=(numOfRows, 10)), 1)
+
+        return [[(startDate + timedelta(days=int(day))).strftime("%d/%m/%Y")] + list(values[day]) for day in days]
+
+    return makeRows
@@ -0,0 +1,57 @@
+import csv
+import numpy as np
+from weatherschema import COLUMNS
+from gorillacodec import readArchive, writeArchive
+from segmentstore import SegmentedStore
+from typedloader import loadTypedHistory
+
+
+def test_closedMonthsAreArchived(tmp_path, weatherRows):
+    rows = weatherRows(200)
+
+    plain = SegmentedStore(str(tmp_path / "plain"))
+    plain.appendRows(rows)
+
+    store = SegmentedStore(str(tmp_path / "archived"), keepRecent=2)
+    for row in rows:
+        store.upsert(row)
+
+    # 200 days from January hold 7 months, the last two stay as CSV
+    assert sorted(store.archived) == sorted(store.segments)[:-2]
+    assert store.readFrame().equals(plain.readFrame())
+
+    # A resent record of an archived month is still replaced in place
+    store.upsert([rows[10][0]] + [1.0] * 10)
+    assert store.getNumOfEntries() == 200
+    assert np.all(store.readFrame().iloc[10, 1:].to_numpy() == 1.0)
+
+
+def test_archiveRoundTrip(tmp_path, weatherRows):
+    rows = weatherRows(20000)
+
+    csvPath = str(tmp_path / "history.csv")
+    with open(csvPath, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+    days, values = loadTypedHistory([csvPath])
+
+    # The sentinel and NaN must survive as well as ordinary rows
+    days[5] = np.iinfo(np.int32).min
+    values[7, 3] = np.nan
+
+    archivePath = str(tmp_path / "history.gor")
+    writeArchive(archivePath, days, values)
+
+    archivedDays, archivedValues = readArchive(archivePath)
+    assert np.array_equal(archivedDays, days)
+    assert np.array_equal(archivedValues, values, equal_nan=True)
+
+    # The typed loader reads an archive like the CSV it was written from
+    writeArchive(archivePath, *loadTypedHistory([csvPath]))
+
+    archivedDays, archivedValues = loadTypedHistory([archivePath])
+    csvDays, csvValues = loadTypedHistory([csvPath])
+    assert np.array_equal(archivedDays, csvDays)
+    assert np.array_equal(archivedValues, csvValues, equal_nan=True)
@@ -0,0 +1,59 @@
+import os
+import csv
+from segmentstore import SegmentedStore
+from bulkimport import BulkImporter
+
+COLUMN_MAP = {"date": "Date", "tmin": "MinTemp", "tmax": "MaxTemp", "p9": "Pressure9am"}
+
+
+def test_dailyImportWritesTheSameSegments(tmp_path, weatherRows):
+    rows = weatherRows(800)
+
+    exportFile = str(tmp_path / "export.csv")
+    with open(exportFile, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(list(COLUMN_MAP))
+        writer.writerows([row[0], row[1], row[2], row[7]] for row in rows)
+        writer.writerow(["not a date", 1, 2, 3])
+
+    # Small blocks, so the rows of some months arrive from two workers
+    imported = SegmentedStore(str(tmp_path / "imported"))
+    assert BulkImporter(imported, workers=2, blockSize=4096).importDaily(exportFile, COLUMN_MAP) == 800
+
+    # The same rows appended one by one
+    expected = SegmentedStore(str(tmp_path / "expected"))
+    expected.appendRows([row[0], row[1], row[2]] + ["N/A"] * 4 + [row[7]] + ["N/A"] * 3 for row in rows)
+
+    assert imported.segments == expected.segments
+    assert imported.index == expected.index
+
+    for name in sorted(expected.segments):
+        with open(os.path.join(str(tmp_path / "imported"), name + ".csv"), mode="rb") as file:
+            importedBytes = file.read()
+        with open(os.path.join(str(tmp_path / "expected"), name + ".csv"), mode="rb") as file:
+            assert importedBytes == file.read()
+
+
+def test_overlappingImportReplacesStoredDays(tmp_path, weatherRows):
+    rows = weatherRows(100)
+
+    exportFile = str(tmp_path / "export.csv")
+    with open(exportFile, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(list(COLUMN_MAP))
+        writer.writerows([row[0], row[1], row[2], row[7]] for row in rows)
+
+    store = SegmentedStore(str(tmp_path / "weatherData"))
+    importer = BulkImporter(store, workers=2, blockSize=1024)
+    importer.importDaily(exportFile, COLUMN_MAP)
+
+    # The second import overlaps every stored day and repeats the last one
+    with open(exportFile, mode="a", newline="") as file:
+        csv.writer(file).writerow([rows[-1][0], 1.0, 2.0, 3.0])
+    importer.importDaily(exportFile, COLUMN_MAP)
+
+    data = SegmentedStore(str(tmp_path / "weatherData")).readFrame()
+
+    assert store.getNumOfEntries() == 100
+    assert len(data) == data["Date"].nunique() == 100
+    assert data.iloc[-1, 1:3].tolist() == [1.0, 2.0]
@@ -0,0 +1,85 @@
+import os
+import time
+import socket
+import asyncio
+import threading
+import recordprotocol
+from collector import Collector
+from test_supervisor import FakeStation
+
+
+def makeStations(tmp_path, stationIds):
+    return [{"stationId": stationId, "host": "127.0.0.1", "port": 6000, "altitude": 590, "directory": str(tmp_path / ("station%d" % stationId))}
+            for stationId in stationIds]
+
+
+def test_coreBudgetReachesLoadedStations(tmp_path):
+    stations = makeStations(tmp_path, [1, 2])
+    collector = Collector(stations)
+
+    try:
+        machines = [collector.getMachine(station) for station in stations]
+        assert all(machine.coreBudget == os.cpu_count() for machine in machines)
+
+        # A rebalance changes the budget of the stations already loaded, and of the ones loaded afterwards
+        collector.setStations(stations + makeStations(tmp_path, [3]))
+        collector.setCoreBudget(2)
+
+        assert all(machine.coreBudget == 2 for machine in machines)
+        assert collector.getMachine(collector.stations[2]).coreBudget == 2
+    finally:
+        collector.close()
+
+
+class FakeMachine():
+    '''
+    MachineLearning answering every record with the same codes, without storing it or training a model.
+    '''
+
+    def handleMessage(self, message):
+        messageType, payload = recordprotocol.parseFrame(message)
+        stationId, sequence, record = recordprotocol.decodeRecord(payload)
+        return recordprotocol.encodeReply(stationId, sequence, [1, 2])
+
+    def retrainInBackground(self):
+        pass
+
+
+def test_downStationDoesNotHoldUpTheOthers(tmp_path, weatherRows, capsys):
+    station = FakeStation(1, weatherRows(1)[0])
+
+    # Nothing listens on the port of the second station once its socket is closed, so every connection is refused
+    closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    closed.bind(("127.0.0.1", 0))
+    downPort = closed.getsockname()[1]
+    closed.close()
+
+    stations = makeStations(tmp_path, [1, 2])
+    stations[0]["port"] = station.port
+    stations[1]["port"] = downPort
+
+    collector = Collector(stations, retries=2, retryDelay=0.5)
+    collector.getMachine = lambda station: FakeMachine()
+
+    results = {}
+    polling = threading.Thread(target=lambda: results.update(asyncio.run(collector.pollAll())))
+
+    try:
+        start = time.perf_counter()
+        polling.start()
+
+        sequence, reply = station.replies.get(timeout=5)
+        answered = time.perf_counter() - start
+
+        polling.join()
+        duration = time.perf_counter() - start
+    finally:
+        collector.close()
+        station.close()
+
+    assert results == {1: True, 2: False}
+    assert reply == (1, sequence, [1, 2])
+
+    # The down station was tried three times, waiting 0.5s and then 1s, while the first station was answered straight away
+    assert capsys.readouterr().out.count("Station 2: attempt") == 3
+    assert answered < 1.5 <= duration
@@ -0,0 +1,36 @@
+import numpy as np
+from sklearn.linear_model import LinearRegression
+from columnstore import ColumnStore
+from typedloader import loadTypedHistory
+from main import MachineLearning
+
+
+def test_resentDayKeepsLastRow(tmp_path, weatherRows):
+    rows = weatherRows(5)
+    store = ColumnStore(str(tmp_path / "columns"))
+    store.appendRows(rows)
+    store.append([rows[2][0]] + [1.0] * 10)
+
+    days, values = loadTypedHistory([str(tmp_path / "columns")])
+
+    assert len(days) == 5
+    assert np.all(np.diff(days) > 0)
+    assert np.all(values[2] == 1.0)
+
+
+def test_trainsFromColumnStore(tmp_path, weatherRows):
+    rows = weatherRows(400)
+    ColumnStore(str(tmp_path / "columns")).appendRows(rows[:399])
+
+    machine = MachineLearning(directory=str(tmp_path), columnDirectory=str(tmp_path / "columns"))
+    machine.getCandidateModels = lambda: [LinearRegression()]
+
+    # The CSV segments are empty, every training row comes from the column store
+    assert machine.store.getNumOfEntries() == 0
+
+    machine.updateCSV(rows[399])
+    predictions = machine.predictWeatherParams()
+
+    assert machine.dataset.numOfEntries == 400
+    assert ColumnStore(str(tmp_path / "columns")).getNumOfEntries() == 400
+    assert len(predictions) == 10
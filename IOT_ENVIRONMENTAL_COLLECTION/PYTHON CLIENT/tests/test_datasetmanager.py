@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from weatherschema import FEATURES, dateToDay
+from segmentstore import SegmentedStore
+from datasetmanager import DatasetManager
+from rollingfeatures import RollingFeatureEngine
+
+
+def makeDataset(tmp_path, capacity):
+    return DatasetManager(SegmentedStore(str(tmp_path / "weatherData")), capacity=capacity, windowSizes=(7, 30), lags=(1, 3))
+
+
+def rebuiltFeatures(dataset):
+    engine = RollingFeatureEngine(dataset.features.windowSizes, dataset.features.lags)
+    engine.build(dataset.getDays(), dataset.getValues())
+    return engine.getFeatures()
+
+
+def test_resentDayUpdatesTheRollingFeaturesInPlace(tmp_path, weatherRows, monkeypatch):
+    rows = weatherRows(161)
+
+    dataset = makeDataset(tmp_path, capacity=100)
+    dataset.load()
+    for row in rows[:160]:
+        dataset.upsert(row)
+
+    # The features are no longer rebuilt from the whole history
+    monkeypatch.setattr(dataset.features, "build", None)
+
+    # Day 150 is still in the running windows, day 80 only in the saved feature rows, and the oldest rows were dropped
+    for index in [150, 80, 159]:
+        dataset.upsert([rows[index][0]] + [value + 2.5 for value in rows[index][1:]])
+        assert np.allclose(dataset.features.getFeatures(), rebuiltFeatures(dataset))
+
+    # The running sums and recent rows carry the new values into the next day
+    dataset.upsert(rows[160])
+    assert np.allclose(dataset.features.getFeatures(), rebuiltFeatures(dataset))
+
+
+def test_rangeAggregatesMatchPandas(tmp_path, weatherRows):
+    rows = weatherRows(400)
+
+    dataset = makeDataset(tmp_path, capacity=300)
+    dataset.load()
+    for row in rows:
+        dataset.upsert(row)
+
+    # A resent day of the retained rows changes every window holding it
+    dataset.upsert([rows[250][0]] + [value - 40 for value in rows[250][1:]])
+
+    # The oldest 100 rows were dropped, so the frame only holds the rows still in the dataset
+    frame = pd.DataFrame([row[1:] for row in rows[100:]], columns=FEATURES, dtype=np.float32)
+    frame.iloc[150] -= 40
+    frame["Day"] = [dateToDay(row[0]) for row in rows[100:]]
+
+    rng = np.random.default_rng(4)
+    firstDay = dateToDay(rows[0][0])
+
+    for startDay, endDay in np.sort(rng.integers(firstDay, firstDay + 420, size=(50, 2)), axis=1):
+        column = FEATURES[rng.integers(len(FEATURES))]
+        selected = frame.loc[(frame["Day"] >= startDay) & (frame["Day"] <= endDay), column].astype(np.float64)
+
+        for statistic in ["mean", "min", "max"]:
+            expected = getattr(selected, statistic)() if len(selected) else np.nan
+            assert np.isclose(dataset.aggregate(column, startDay, endDay, statistic), expected, equal_nan=True)
@@ -0,0 +1,130 @@
+import os
+import pickle
+import numpy as np
+import pytest
+from sklearn.exceptions import NotFittedError
+from sklearn.neighbors import KNeighborsRegressor
+import knnindex
+from knnindex import KDTreeKNNRegressor
+import main
+from main import MachineLearning
+
+
+def test_searchIsExact(tmp_path):
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(3000, 10))
+    y = rng.normal(size=(3000, 10))
+    queries = rng.normal(size=(700, 10))
+
+    # One tree from fit, several levels and a partly filled buffer from the inserts
+    model = KDTreeKNNRegressor(leafSize=16, bufferSize=64).fit(X[:2000], y[:2000])
+    for start in range(2000, 3000, 37):
+        model.partial_fit(X[start:start + 37], y[start:start + 37])
+
+    expected = KNeighborsRegressor(n_neighbors=5, algorithm="brute").fit(X, y).predict(queries)
+    assert np.allclose(model.predict(queries), expected)
+
+    # A saved index is searched the same once it is loaded again
+    model.save(str(tmp_path / "index"))
+    assert np.allclose(pickle.loads(pickle.dumps(model)).predict(queries), expected)
+
+
+def test_loadedTreesAreNotBuiltAgain(tmp_path, monkeypatch):
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(2000, 10))
+    y = rng.normal(size=(2000, 10))
+    queries = rng.normal(size=(50, 10))
+
+    model = KDTreeKNNRegressor(leafSize=16).fit(X, y)
+    model.save(str(tmp_path / "index"))
+    expected = model.predict(queries)
+
+    # Building a KD-tree now fails, the loaded one comes from the memory mapped files
+    class NoBuild(knnindex.KDTree):
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("the KD-tree was built again")
+
+    monkeypatch.setattr(knnindex, "KDTree", NoBuild)
+    loaded = KDTreeKNNRegressor.load(str(tmp_path / "index"))
+
+    assert isinstance([tree for tree in loaded.levels if tree is not None][0]["nodes"], np.memmap)
+    assert np.allclose(loaded.predict(queries), expected)
+
+
+def test_emptyIndexCannotBeSearched():
+    model = KDTreeKNNRegressor().fit(np.empty((0, 3)), np.empty((0, 2)))
+
+    with pytest.raises(NotFittedError):
+        model.predict(np.zeros((1, 3)))
+
+
+def test_appendedRowsUpdateTheIndex(tmp_path, weatherRows, monkeypatch):
+    rows = weatherRows(330)
+
+    machine = MachineLearning(directory=str(tmp_path))
+    machine.getCandidateModels = lambda: [KDTreeKNNRegressor()]
+
+    for row in rows[:320]:
+        machine.updateCSV(row)
+    machine.predictWeatherParams()
+
+    previousVersion = machine.registry.currentVersion
+    previousModel = machine.registry.load(previousVersion)
+    numOfSamples = previousModel.numOfSamples
+
+    # Appending more rows than retrainAfterRows inserts them into the index, no model is selected again
+    monkeypatch.setattr(main, "selectBestModel", None)
+
+    for row in rows[320:]:
+        machine.updateCSV(row)
+    predictions = machine.predictWeatherParams()
+
+    assert len(predictions) == 10
+    assert machine.registry.currentVersion != previousVersion
+    assert machine.registry.versions[-1]["updatedFrom"] == previousVersion
+    assert machine.currentModel.numOfSamples == numOfSamples + 10
+
+    # The version is scored on the appended rows, and shares the files of the level the rows didn't change with the previous version
+    entry = machine.registry.versions[-1]
+    assert entry["incrementalRows"] == 10
+    assert entry["mse"] != machine.registry.versions[-2]["mse"]
+
+    level = [level for level, tree in enumerate(previousModel.levels) if tree is not None][0]
+    treeFile = "level%d_points.npy" % level
+    assert os.path.samefile(os.path.join(previousModel.indexDirectory, treeFile), os.path.join(machine.currentModel.indexDirectory, treeFile))
+
+    # The previous version is unchanged and can still be rolled back to
+    assert previousModel.numOfSamples == numOfSamples
+    assert machine.rollbackModel() == previousVersion
+
+
+def test_modelSelectionRunsAgainAfterIncrementalRows(tmp_path, weatherRows, monkeypatch):
+    rows = weatherRows(340)
+
+    machine = MachineLearning(directory=str(tmp_path))
+    machine.getCandidateModels = lambda: [KDTreeKNNRegressor()]
+    machine.maxIncrementalRows = 15
+
+    for row in rows[:320]:
+        machine.updateCSV(row)
+    machine.predictWeatherParams()
+    numOfSamples = machine.currentModel.numOfSamples
+
+    for row in rows[320:330]:
+        machine.updateCSV(row)
+    machine.predictWeatherParams()
+
+    assert "updatedFrom" in machine.registry.versions[-1]
+
+    # Ten more rows would make 20 inserted rows, so every model is compared again on the whole history
+    selections = []
+    selectBestModel = main.selectBestModel
+    monkeypatch.setattr(main, "selectBestModel", lambda *args, **kwargs: selections.append(len(args[1])) or selectBestModel(*args, **kwargs))
+
+    for row in rows[330:]:
+        machine.updateCSV(row)
+    machine.predictWeatherParams()
+
+    assert len(selections) == 1
+    assert "updatedFrom" not in machine.registry.versions[-1]
+    assert machine.currentModel.numOfSamples > numOfSamples
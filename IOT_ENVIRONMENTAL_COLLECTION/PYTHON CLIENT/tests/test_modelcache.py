@@ -0,0 +1,21 @@
+import numpy as np
+from modelcache import ModelCache, hashRows
+from main import MachineLearning
+
+
+def test_thresholdIsReadAtLookup(tmp_path):
+    days = np.arange(12, dtype=np.int32)
+    rowHashes = hashRows(days, np.ones((12, 10), dtype=np.float32))
+
+    cache = ModelCache(str(tmp_path), maxNewRows=7)
+    cache.store("config", rowHashes[:10], "version")
+
+    assert cache.lookup("config", rowHashes) == "version"
+    assert cache.lookup("config", rowHashes, maxNewRows=2) is None
+    assert cache.lookup("config", rowHashes[:10], maxNewRows=0) == "version"
+
+
+def test_retrainAfterRowsIsConfigurable(tmp_path):
+    machine = MachineLearning(directory=str(tmp_path), retrainAfterRows=30)
+
+    assert machine.retrainAfterRows == 30
@@ -0,0 +1,51 @@
+from sklearn.linear_model import LinearRegression
+from modelregistry import ModelRegistry
+from main import MachineLearning
+
+
+def test_changesFromAnotherProcessAreKept(tmp_path):
+    collector = ModelRegistry(str(tmp_path))
+    collector.register(LinearRegression(), "v1")
+
+    # The command line opens the same registry and rolls back while the collector keeps running
+    commandLine = ModelRegistry(str(tmp_path))
+    commandLine.register(LinearRegression(), "v2")
+    assert commandLine.rollback() == "v1"
+
+    collector.register(LinearRegression(), "v3")
+
+    assert [entry["version"] for entry in ModelRegistry(str(tmp_path)).versions] == ["v1", "v2", "v3"]
+    assert not ModelRegistry(str(tmp_path)).pinned
+
+
+def test_pinnedVersionIsNotReplacedByTheCache(tmp_path, weatherRows):
+    rows = weatherRows(360)
+
+    machine = MachineLearning(directory=str(tmp_path))
+    machine.getCandidateModels = lambda: [LinearRegression()]
+
+    for row in rows[:340]:
+        machine.updateCSV(row)
+    machine.predictWeatherParams()
+    firstVersion = machine.registry.currentVersion
+
+    for row in rows[340:350]:
+        machine.updateCSV(row)
+    machine.predictWeatherParams()
+    secondVersion = machine.registry.currentVersion
+
+    # Rolled back from the command line, the running collector has its own registry object
+    assert ModelRegistry(machine.registryDirectory).rollback() == firstVersion
+
+    machine.updateCSV(rows[350])
+    machine.predictWeatherParams()
+
+    assert machine.registry.currentVersion == firstVersion
+    assert machine.registry.pinned
+
+    # Once unpinned, the cached version is used again
+    ModelRegistry(machine.registryDirectory).unpin()
+    machine.predictWeatherParams()
+
+    assert machine.registry.currentVersion == secondVersion
+    assert not machine.registry.pinned
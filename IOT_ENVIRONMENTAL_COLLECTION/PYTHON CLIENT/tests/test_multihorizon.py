@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+from weatherschema import FEATURES
+from multihorizon import forecastHorizons
+
+
+def forecastDayByDay(model, recentValues, numOfDays):
+    rows = [np.asarray(row, dtype=np.float64) for row in recentValues]
+
+    for day in range(numOfDays):
+        inputs = pd.DataFrame([np.mean(rows[-len(recentValues):], axis=0)], columns=FEATURES)
+        rows.append(np.asarray(model.predict(inputs), dtype=np.float64)[0])
+
+    return np.array(rows[len(recentValues):])
+
+
+def test_horizonsMatchTheDayByDayRecursion(weatherRows):
+    values = np.array([row[1:] for row in weatherRows(400)], dtype=np.float64)
+
+    # Models predicting the next day from the rolling average of the 30 days before it, like MachineLearning trains them
+    inputs = pd.DataFrame(values, columns=FEATURES).rolling(30).mean().iloc[29:-1]
+    targets = pd.DataFrame(values[30:], columns=FEATURES)
+
+    for model in [LinearRegression(), DecisionTreeRegressor(max_depth=6, random_state=0)]:
+        model.fit(inputs, targets)
+
+        expected = forecastDayByDay(model, values[-30:], 10)
+        assert np.allclose(forecastHorizons(model, values[-30:], 10), expected, atol=1e-4)
+
+        # Without a tolerance the passes only stop once every day equals the recursion
+        assert np.allclose(forecastHorizons(model, values[-30:], 10, tolerance=0), expected, rtol=0, atol=1e-9)
@@ -0,0 +1,46 @@
+from sklearn.linear_model import LinearRegression
+from segmentstore import SegmentedStore
+from parquetstore import exportParquet, importParquet, loadParquetHistory
+from main import MachineLearning
+
+
+def test_trainsFromParquetExport(tmp_path, weatherRows):
+    rows = weatherRows(400)
+
+    source = SegmentedStore(str(tmp_path / "source"))
+    source.appendRows(rows[:399])
+    exportParquet(source, str(tmp_path / "parquet"))
+
+    assert len(loadParquetHistory(str(tmp_path / "parquet"), 1)[0]) == 399
+
+    machine = MachineLearning(directory=str(tmp_path / "station"), parquetDirectory=str(tmp_path / "parquet"))
+    machine.getCandidateModels = lambda: [LinearRegression()]
+
+    # The station's own CSV segments are empty, every training row comes from the Parquet export
+    assert machine.store.getNumOfEntries() == 0
+
+    machine.updateCSV(rows[399])
+    predictions = machine.predictWeatherParams()
+
+    assert machine.dataset.numOfEntries == 400
+    assert machine.store.getNumOfEntries() == 1
+    assert len(predictions) == 10
+
+    # After a restart the record received since the export is still part of the history
+    restarted = MachineLearning(directory=str(tmp_path / "station"), parquetDirectory=str(tmp_path / "parquet"))
+    restarted.dataset.load()
+
+    assert restarted.dataset.numOfEntries == 400
+
+
+def test_importBackIntoSourceKeepsDays(tmp_path, weatherRows):
+    store = SegmentedStore(str(tmp_path / "weatherData"))
+    store.appendRows(weatherRows(100))
+    exportParquet(store, str(tmp_path / "parquet"))
+
+    importParquet(str(tmp_path / "parquet"), store)
+
+    data = SegmentedStore(str(tmp_path / "weatherData")).readFrame()
+
+    assert store.getNumOfEntries() == 100
+    assert len(data) == data["Date"].nunique() == 100
@@ -0,0 +1,72 @@
+import struct
+import pytest
+import recordprotocol
+from main import MachineLearning
+
+
+class TrickleSocket():
+    '''
+    Socket handing out the bytes of a message a few at a time, like a slow network splitting it.
+    '''
+
+    def __init__(self, data, chunkSize=3):
+        self.data = data
+        self.chunkSize = chunkSize
+
+    def recv(self, numOfBytes):
+        chunk = self.data[:min(numOfBytes, self.chunkSize)]
+        self.data = self.data[len(chunk):]
+        return chunk
+
+
+def test_recordAndReplyRoundTrip():
+    record = ["05/03/2021", 8.5, 21.3, "N/A", 11.0, 65.0, 48.0, 1012.4, 1009.8, 14.2, 19.9]
+
+    messageType, payload = recordprotocol.readFrame(TrickleSocket(recordprotocol.encodeRecord(7, 123456, record)))
+    assert messageType == recordprotocol.RECORD
+
+    # The missing reading travels as NaN and comes back as the missing value
+    assert recordprotocol.decodeRecord(payload) == (7, 123456, record)
+
+    messageType, payload = recordprotocol.readFrame(TrickleSocket(recordprotocol.encodeReply(7, 123456, [3, 26, 1, 14]), chunkSize=1))
+    assert messageType == recordprotocol.REPLY
+    assert recordprotocol.decodeReply(payload) == (7, 123456, [3, 26, 1, 14])
+
+
+def test_badMessagesAreRejected():
+    message = recordprotocol.encodeRecord(7, 1, ["05/03/2021"] + [1.0] * 10)
+
+    with pytest.raises(ValueError):
+        recordprotocol.parseFrame(b"XX" + message[2:])
+
+    newerVersion = struct.pack(recordprotocol.HEADER_FORMAT, recordprotocol.MAGIC, recordprotocol.PROTOCOL_VERSION + 1, recordprotocol.RECORD,
+                               recordprotocol.RECORD_SIZE)
+    with pytest.raises(ValueError):
+        recordprotocol.parseFrame(newerVersion + message[recordprotocol.HEADER_SIZE:])
+
+    with pytest.raises(ValueError):
+        recordprotocol.parseFrame(message[:-1])
+
+    # The connection closing part way through a message isn't mistaken for a complete one
+    with pytest.raises(OSError):
+        recordprotocol.readFrame(TrickleSocket(message[:-1]))
+
+
+def test_handleMessageAnswersInTheFormatReceived(tmp_path):
+    machine = MachineLearning(stationId=7, directory=str(tmp_path))
+
+    received = []
+    machine.handleRecord = lambda newData: received.append(newData) or [(3, 26), (1, 14)]
+
+    # Older firmware sends the values as text separated by spaces, and gets the codes back as text
+    assert machine.handleMessage(b"05/03/2021 8.5 21.3 N/A 11.0 65.0 48.0 1012.4 1009.8 14.2 19.9") == b"3,26,1,14"
+    assert received[-1] == ["05/03/2021", 8.5, 21.3, "N/A", 11.0, 65.0, 48.0, 1012.4, 1009.8, 14.2, 19.9]
+
+    reply = machine.handleMessage(recordprotocol.encodeRecord(7, 42, received[-1]))
+    assert recordprotocol.decodeReply(recordprotocol.parseFrame(reply)[1]) == (7, 42, [3, 26, 1, 14])
+    assert received[-1] == received[0]
+
+    # A record of another weather station isn't stored
+    with pytest.raises(ValueError):
+        machine.handleMessage(recordprotocol.encodeRecord(8, 43, received[-1]))
+    assert len(received) == 2
@@ -0,0 +1,33 @@
+import numpy as np
+from weatherschema import dateToDay
+from segmentstore import SegmentedStore
+
+
+def test_resentDayIsReplacedInPlace(tmp_path, weatherRows):
+    rows = weatherRows(100)
+    directory = str(tmp_path / "weatherData")
+
+    store = SegmentedStore(directory, keepRecent=1)
+    for row in rows:
+        assert not store.upsert(row)
+
+    # 100 days from January fill four months, the older three are archived
+    assert sorted(store.archived) == ["2000-01", "2000-02", "2000-03"]
+
+    # A resent day of the open month and one of an archived month replace their rows
+    for index in [95, 20]:
+        assert store.upsert([rows[index][0]] + [float(index)] * 10)
+
+    assert store.getNumOfEntries() == 100
+    frame = store.readFrame()
+    assert frame["Date"].tolist() == [row[0] for row in rows]
+    assert np.all(frame.iloc[[20, 95], 1:].to_numpy() == [[20.0], [95.0]])
+
+    # The index is read back from disk, so the same days are still replaced after a restart
+    reloaded = SegmentedStore(directory, keepRecent=1)
+    assert reloaded.index == store.index
+    assert (1, dateToDay(rows[20][0])) in reloaded.index
+
+    assert reloaded.upsert([rows[20][0]] + [1.0] * 10)
+    assert reloaded.getNumOfEntries() == 100
+    assert np.all(reloaded.readFrame().iloc[20, 1:].to_numpy() == 1.0)
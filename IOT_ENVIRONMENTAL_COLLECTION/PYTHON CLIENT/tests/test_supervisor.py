@@ -0,0 +1,81 @@
+import csv
+import queue
+import socket
+import threading
+import recordprotocol
+from weatherschema import COLUMNS
+from supervisor import Supervisor
+
+
+class FakeStation():
+    '''
+    Weather station server sending the same record to every connection and keeping the replies it gets back.
+    '''
+
+    def __init__(self, stationId, record):
+        self.stationId = stationId
+        self.record = record
+        self.replies = queue.Queue()
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        sequence = 0
+
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except OSError:
+                return  # The server was closed
+
+            with connection:
+                sequence += 1
+                recordprotocol.sendAll(connection, recordprotocol.encodeRecord(self.stationId, sequence, self.record))
+
+                try:
+                    messageType, payload = recordprotocol.readFrame(connection)
+                except OSError:
+                    continue
+
+                self.replies.put((sequence, recordprotocol.decodeReply(payload)))
+
+    def close(self):
+        self.server.close()
+
+
+def test_supervisedWorkerRepliesToStation(tmp_path, weatherRows):
+    rows = weatherRows(401)
+
+    # History of the station, imported by its MachineLearning the first time it is used
+    directory = tmp_path / "station7"
+    directory.mkdir()
+    with open(str(directory / "weatherData.csv"), mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows[:400])
+
+    station = FakeStation(7, rows[400])
+    stations = [{"stationId": 7, "host": "127.0.0.1", "port": station.port, "altitude": 590, "directory": str(directory)}]
+
+    supervisor = Supervisor(stations, numOfWorkers=1, interval=1, stopTimeout=60, retries=0, readTimeout=120)
+    supervisor.start()
+
+    try:
+        # The first reply needs the model selection, which runs its own process pool inside the worker
+        sequence, (stationId, repliedSequence, codes) = station.replies.get(timeout=180)
+    finally:
+        processes = [process for process, connection in supervisor.workers.values()]
+        supervisor.stop()
+        station.close()
+
+    assert stationId == 7
+    assert repliedSequence == sequence
+    assert len(codes) == 2
+    assert all(1 <= code <= 26 for code in codes)
+    assert not any(process.is_alive() for process in processes)
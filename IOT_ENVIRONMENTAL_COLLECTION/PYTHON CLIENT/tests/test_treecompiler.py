@@ -0,0 +1,25 @@
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+import treecompiler
+from treecompiler import compileTreeModel
+
+
+def test_compiledModelsPredictLikeSklearn(monkeypatch):
+    rng = np.random.default_rng(3)
+
+    # Rounded values put many inputs exactly on the split thresholds
+    X = np.round(rng.normal(size=(600, 6)), 1)
+    y = X @ rng.normal(size=(6, 3)) + rng.normal(size=(600, 3))
+    queries = np.round(rng.normal(size=(900, 6)), 1)
+    queries[0, 2] = np.nan
+
+    for model in [RandomForestRegressor(n_estimators=20, random_state=0).fit(X, y), DecisionTreeRegressor(random_state=0).fit(X, y)]:
+        compiledModel = compileTreeModel(model)
+        expected = model.predict(queries)
+
+        # A single row walks every tree together, a large batch one tree at a time and in several chunks of rows
+        assert np.allclose(compiledModel.predict(queries[:1]), expected[:1], rtol=0, atol=1e-12)
+        monkeypatch.setattr(treecompiler, "PAIR_CHUNK_SIZE", 256)
+        assert np.allclose(compiledModel.predict(queries), expected, rtol=0, atol=1e-12)
+        monkeypatch.undo()
@@ -0,0 +1,26 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+from weatherschema import MISSING_DAY, dateToDay
+from segmentstore import SegmentedStore
+from typedloader import loadTypedHistory, parseDays
+
+
+def test_dayBeforeEpochIsNotMissing(tmp_path, weatherRows):
+    rows = weatherRows(3, startDate=date(1969, 12, 30))
+    rows.append(["not a date"] + rows[0][1:])
+
+    assert list(parseDays(pd.Series([row[0] for row in rows]))) == [-2, -1, 0, MISSING_DAY]
+
+    store = SegmentedStore(str(tmp_path / "weatherData"))
+    store.appendRows(rows)
+
+    days, values = loadTypedHistory(store.getSegmentPaths())
+    assert list(days) == [-2, -1, 0]
+
+    # The same rows survive once their segments are archived
+    store.archiveSegments(keepRecent=0)
+    days, values = loadTypedHistory(store.getSegmentPaths())
+    assert list(days) == [-2, -1, 0]
+    assert store.readFrame()["Date"].tolist()[:3] == [row[0] for row in rows[:3]]
+    assert store.index[(1, dateToDay("31/12/1969"))] is not None
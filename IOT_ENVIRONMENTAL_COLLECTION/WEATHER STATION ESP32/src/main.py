@@ -9,6 +9,7 @@ import uasyncio as asyncio
 from machine import Pin, UART
 import ubluetooth as bluetooth
 import wifimgr
+import recordprotocol
 import machine
 import _thread as thread
 
@@ -20,6 +21,9 @@ class ESP32Handler():
         
         # Instantiate ESP32 ESPNow credentials 
         self.id = 1
+        
+        # Number of the last daily record sent to the python client, echoed back in its reply
+        self.sequenceNumber = 0
         self.senderMacAddress = " "
         self.peerList = [b'SENSOR-STATION-ESP-MAC-ADDRESS']
         
@@ -127,8 +131,9 @@ class ESP32Handler():
             # Convert dictionary to list of values
             dailyData = list(dailyData.values())
             
-            # Convert list to string
-            dailyData = ' '.join([str(elem) for elem in dailyData])
+            # Encode the record as a framed binary message (see recordprotocol.py)
+            self.sequenceNumber += 1
+            dailyData = recordprotocol.encodeRecord(self.id, self.sequenceNumber, dailyData)
             
             # Get instance
             server_socket = socket.socket() 
@@ -162,11 +167,25 @@ class ESP32Handler():
             
             #print("Connection from: " + str(address) + " established")
             
-            # Send data to the client
-            conn.send(dailyData.encode())
-            
-            # Assign response data to variable
-            responseData = conn.recv(1024).decode()
+            try:
+                
+                # Send data to the client
+                recordprotocol.sendAll(conn, dailyData)
+                
+                # Receive the framed reply, however the network splits it
+                messageType, payload = recordprotocol.readFrame(conn)
+                stationId, sequence, zambrettiCodes = recordprotocol.decodeReply(payload)
+                
+                if messageType != recordprotocol.REPLY or sequence != self.sequenceNumber:
+                    raise ValueError("Reply doesn't match the record sent")
+                
+                # Assign response data to variable
+                responseData = ",".join([str(code) for code in zambrettiCodes])
+                
+            except (OSError, ValueError):
+                
+                # Assign response data string
+                responseData = "5,5"
 
             # Close the connection
             conn.close()
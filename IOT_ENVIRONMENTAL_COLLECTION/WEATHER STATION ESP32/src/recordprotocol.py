@@ -0,0 +1,230 @@
+'''
+Binary framing of the messages exchanged between the weather station and the python client, shared by both sides
+(the same file runs on MicroPython and CPython). Every message starts with a fixed header holding the protocol version,
+the message type and the payload length, so a reader always knows how many bytes to wait for.
+
+    header:  magic "WX", version (uint8), message type (uint8), payload length (uint16)
+    record:  station ID (uint16), sequence number (uint32), year (uint16), month (uint8), day (uint8), 10 readings (float32)
+    reply:   station ID (uint16), sequence number of the record (uint32), number of codes (uint8), Zambretti codes (uint8 each)
+
+All values are big-endian, missing readings are sent as NaN.
+'''
+
+try:
+    import struct
+except ImportError:
+    import ustruct as struct
+
+MAGIC = b"WX"
+PROTOCOL_VERSION = 1
+
+# Message types
+RECORD = 1
+REPLY = 2
+
+HEADER_FORMAT = ">2sBBH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+NUM_OF_READINGS = 10
+RECORD_FORMAT = ">HIHBB" + str(NUM_OF_READINGS) + "f"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+REPLY_FORMAT = ">HIB"
+REPLY_SIZE = struct.calcsize(REPLY_FORMAT)
+
+# Largest payload accepted, anything longer is a corrupted header
+MAX_PAYLOAD_SIZE = 1024
+
+# Value stored for a missing reading, the same string the weather station used before
+MISSING_VALUE = "N/A"
+
+
+def frame(messageType, payload):
+    '''
+    This function is responsible for putting the header in front of a payload.
+    params:
+        messageType: RECORD or REPLY
+        payload: encoded message body
+    returns:
+        message: bytes ready to send
+    '''
+    return struct.pack(HEADER_FORMAT, MAGIC, PROTOCOL_VERSION, messageType, len(payload)) + payload
+
+
+def parseHeader(header):
+    '''
+    This function is responsible for checking a received header and reading the length of the payload that follows it.
+    params:
+        header: first HEADER_SIZE bytes of a message
+    returns:
+        messageType: RECORD or REPLY
+        length: number of payload bytes following the header
+    '''
+
+    magic, version, messageType, length = struct.unpack(HEADER_FORMAT, header)
+
+    if magic != MAGIC:
+        raise ValueError("Not a weather record message")
+    if version > PROTOCOL_VERSION:
+        raise ValueError("Unsupported protocol version " + str(version))
+    if length > MAX_PAYLOAD_SIZE:
+        raise ValueError("Payload too large: " + str(length))
+
+    return messageType, length
+
+
+def parseFrame(message):
+    '''
+    This function is responsible for splitting a complete message into its type and payload.
+    params:
+        message: header followed by the payload
+    returns:
+        messageType: RECORD or REPLY
+        payload: message body
+    '''
+
+    messageType, length = parseHeader(message[:HEADER_SIZE])
+
+    if len(message) != HEADER_SIZE + length:
+        raise ValueError("Truncated message")
+
+    return messageType, message[HEADER_SIZE:]
+
+
+def encodeRecord(stationId, sequence, record):
+    '''
+    This function is responsible for encoding a daily record.
+    params:
+        stationId: ID of the weather station
+        sequence: number of the record, increased by the weather station with every record it sends
+        record: date string (dd/mm/yyyy) followed by the 10 readings, missing readings can be any non-numeric value
+    returns:
+        message: framed record
+    '''
+
+    try:
+        day, month, year = [int(part) for part in str(record[0]).split("/")]
+    except ValueError:
+        day, month, year = 0, 0, 0
+
+    readings = []
+
+    for value in record[1:NUM_OF_READINGS + 1]:
+        try:
+            readings.append(float(value))
+        except ValueError:
+            readings.append(float("nan"))
+
+    return frame(RECORD, struct.pack(RECORD_FORMAT, stationId, sequence, year, month, day, *readings))
+
+
+def decodeRecord(payload):
+    '''
+    This function is responsible for decoding a daily record.
+    params:
+        payload: record message body
+    returns:
+        stationId: ID of the weather station
+        sequence: number of the record
+        record: date string followed by the 10 readings, with MISSING_VALUE for missing readings
+    '''
+
+    if len(payload) != RECORD_SIZE:
+        raise ValueError("Record payload of " + str(len(payload)) + " bytes")
+
+    values = struct.unpack(RECORD_FORMAT, payload)
+    stationId, sequence, year, month, day = values[:5]
+
+    record = ["{:02d}/{:02d}/{}".format(day, month, year) if year else MISSING_VALUE]
+
+    for value in values[5:]:
+
+        # NaN is the only value not equal to itself. float32 readings are rounded back to the 7 digits they hold, so 1012.4 stays 1012.4
+        record.append(MISSING_VALUE if value != value else float("%.7g" % value))
+
+    return stationId, sequence, record
+
+
+def encodeReply(stationId, sequence, codes):
+    '''
+    This function is responsible for encoding the Zambretti reply to a record.
+    params:
+        stationId: ID of the weather station
+        sequence: number of the record answered
+        codes: list of Zambretti codes, the 9am and 3pm codes of each forecast day
+    returns:
+        message: framed reply
+    '''
+    return frame(REPLY, struct.pack(REPLY_FORMAT, stationId, sequence, len(codes)) + bytes(codes))
+
+
+def decodeReply(payload):
+    '''
+    This function is responsible for decoding the Zambretti reply to a record.
+    params:
+        payload: reply message body
+    returns:
+        stationId: ID of the weather station
+        sequence: number of the record answered
+        codes: list of Zambretti codes
+    '''
+
+    if len(payload) < REPLY_SIZE:
+        raise ValueError("Truncated reply")
+
+    stationId, sequence, numOfCodes = struct.unpack(REPLY_FORMAT, payload[:REPLY_SIZE])
+
+    if len(payload) != REPLY_SIZE + numOfCodes:
+        raise ValueError("Truncated reply")
+
+    return stationId, sequence, list(payload[REPLY_SIZE:])
+
+
+def recvExactly(sock, numOfBytes):
+    '''
+    This function is responsible for receiving an exact number of bytes, however the network splits them.
+    params:
+        sock: connected blocking socket
+        numOfBytes: number of bytes to receive
+    returns:
+        data: received bytes
+    '''
+
+    data = b""
+
+    while len(data) < numOfBytes:
+        chunk = sock.recv(numOfBytes - len(data))
+
+        if not chunk:
+            raise OSError("Connection closed after " + str(len(data)) + " of " + str(numOfBytes) + " bytes")
+
+        data += chunk
+
+    return data
+
+
+def sendAll(sock, data):
+    '''
+    This function is responsible for sending every byte of a message, send may only take part of it.
+    params:
+        sock: connected blocking socket
+        data: bytes to send
+    '''
+
+    while data:
+        data = data[sock.send(data):]
+
+
+def readFrame(sock):
+    '''
+    This function is responsible for receiving a complete message.
+    params:
+        sock: connected blocking socket
+    returns:
+        messageType: RECORD or REPLY
+        payload: message body
+    '''
+
+    messageType, length = parseHeader(recvExactly(sock, HEADER_SIZE))
+
+    return messageType, recvExactly(sock, length)